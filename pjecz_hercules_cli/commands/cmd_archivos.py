@@ -0,0 +1,157 @@
+"""
+Command Archivos
+"""
+
+import csv
+import os
+import sys
+import time
+from urllib.parse import unquote
+
+import click
+from dotenv import load_dotenv
+
+from pjecz_hercules_cli.dependencies import file_index
+from pjecz_hercules_cli.dependencies.api_client import crear_sesion, paginar
+from pjecz_hercules_cli.dependencies.authentications import get_auth_token
+from pjecz_hercules_cli.dependencies.exceptions import MyAnyError
+
+load_dotenv()
+EDICTOS_BASE_DIR = os.getenv("EDICTOS_BASE_DIR")
+EDICTOS_GCS_BASE_URL = os.getenv("EDICTOS_GCS_BASE_URL")
+SENTENCIAS_BASE_DIR = os.getenv("SENTENCIAS_BASE_DIR")
+SENTENCIAS_GCS_BASE_URL = os.getenv("SENTENCIAS_GCS_BASE_URL")
+
+RECURSOS = {
+    "edictos": (EDICTOS_BASE_DIR, EDICTOS_GCS_BASE_URL),
+    "sentencias": (SENTENCIAS_BASE_DIR, SENTENCIAS_GCS_BASE_URL),
+}
+MOSTRAR_FALTANTES = 20
+
+
+@click.group()
+def cli():
+    """Archivos"""
+
+
+@click.command()
+@click.option("--completo", is_flag=True, help="Volver a listar todos los directorios, aunque no hayan cambiado")
+@click.option("--hilos", type=int, default=file_index.INDICE_HILOS, help="Número de hilos para recorrer los directorios")
+@click.option("--recurso", type=click.Choice(["todos", *RECURSOS]), default="todos", help="Directorio a indexar")
+def indexar(completo, hilos, recurso):
+    """Crear o actualizar el índice de los PDF de SENTENCIAS_BASE_DIR y EDICTOS_BASE_DIR"""
+    from tabulate import tabulate  # Se importa aquí para que el CLI arranque rápido
+
+    click.echo("Indexando archivos")
+
+    # Validar los hilos
+    if hilos < 1:
+        click.echo(click.style("Los hilos deben ser mayores a cero", fg="red"))
+        sys.exit(1)
+
+    # Recorrer cada directorio, sólo se listan los que cambiaron desde la última vez
+    tabla = []
+    for nombre, (base_dir, _) in RECURSOS.items():
+        if recurso not in ("todos", nombre):
+            continue
+        if not base_dir:
+            click.echo(click.style(f"No está definido el directorio de {nombre}", fg="yellow"))
+            continue
+        try:
+            resultado = file_index.actualizar_indice(base_dir, completo, hilos)
+        except OSError as error:
+            click.echo(click.style(str(error), fg="red"))
+            sys.exit(1)
+        tabla.append(
+            [
+                nombre,
+                resultado["directorios"],
+                resultado["explorados"],
+                resultado["borrados"],
+                resultado["errores"],
+                resultado["archivos"],
+                f"{resultado['bytes'] / 1024 / 1024:.1f}",
+                f"{resultado['segundos']:.1f}",
+            ]
+        )
+    click.echo(
+        tabulate(tabla, headers=["recurso", "directorios", "listados", "borrados", "errores", "archivos", "MB", "segundos"])
+    )
+
+
+@click.command()
+def mostrar():
+    """Mostrar los índices de archivos"""
+    from tabulate import tabulate  # Se importa aquí para que el CLI arranque rápido
+
+    tabla = []
+    for nombre, (base_dir, _) in RECURSOS.items():
+        estadisticas = file_index.obtener_estadisticas(base_dir) if base_dir else None
+        if estadisticas is None:
+            tabla.append([nombre, base_dir, "", "", "No se ha creado"])
+            continue
+        actualizado = time.strftime("%Y-%m-%d %H:%M", time.localtime(estadisticas["actualizado"]))
+        tabla.append([nombre, base_dir, estadisticas["archivos"], f"{estadisticas['bytes'] / 1024 / 1024:.1f}", actualizado])
+    click.echo(tabulate(tabla, headers=["recurso", "directorio", "archivos", "MB", "actualizado"]))
+
+
+@click.command()
+@click.argument("recurso", type=click.Choice(list(RECURSOS)))
+@click.argument("creado_desde", type=str)
+@click.argument("creado_hasta", type=str)
+@click.option("--salida", type=str, default="", help="Archivo CSV donde guardar los faltantes")
+def faltantes(recurso, creado_desde, creado_hasta, salida):
+    """Reportar los registros de la API cuyo PDF no está en el índice, sin consultar la unidad de red"""
+    from tabulate import tabulate  # Se importa aquí para que el CLI arranque rápido
+
+    click.echo(f"Buscando los archivos faltantes de {recurso}")
+
+    # Validar que exista el índice
+    base_dir, gcs_base_url = RECURSOS[recurso]
+    estadisticas = file_index.obtener_estadisticas(base_dir) if base_dir else None
+    if estadisticas is None:
+        click.echo(click.style(f"No hay índice de {recurso}, créelo con: hercules archivos indexar", fg="red"))
+        sys.exit(1)
+
+    # Obtener el token
+    try:
+        oauth2_token = get_auth_token()
+    except Exception as error:
+        click.echo(click.style(str(error), fg="red"))
+        sys.exit(1)
+    sesion = crear_sesion(oauth2_token)
+
+    # Comparar cada registro del listado con el índice
+    total = 0
+    renglones = []
+    parametros = {"creado_desde": creado_desde, "creado_hasta": creado_hasta}
+    try:
+        for paginado in paginar(sesion, f"/api/v5/{recurso}", parametros):
+            for item in paginado["data"]:
+                total += 1
+                archivo_ruta = base_dir + unquote(item["url"][len(gcs_base_url) :])
+                if file_index.buscar_archivo(base_dir, archivo_ruta) is None:
+                    renglones.append([item["id"], item["archivo"], archivo_ruta])
+    except MyAnyError as error:
+        click.echo(click.style(str(error), fg="red"))
+        sys.exit(1)
+
+    # Guardar los faltantes en un archivo CSV
+    if salida:
+        with open(salida, "w", encoding="utf8", newline="") as puntero:
+            escritor = csv.writer(puntero)
+            escritor.writerow(["id", "archivo", "ruta"])
+            escritor.writerows(renglones)
+        click.echo(f"Faltantes guardados en {salida}")
+
+    # Mostrar los primeros faltantes y el total
+    if renglones:
+        click.echo(tabulate(renglones[:MOSTRAR_FALTANTES], headers=["id", "archivo", "ruta"]))
+    actualizado = time.strftime("%Y-%m-%d %H:%M", time.localtime(estadisticas["actualizado"]))
+    color = "yellow" if renglones else "green"
+    click.echo(click.style(f"Faltan {len(renglones)} de {total} archivos según el índice del {actualizado}", fg=color))
+
+
+cli.add_command(indexar)
+cli.add_command(mostrar)
+cli.add_command(faltantes)
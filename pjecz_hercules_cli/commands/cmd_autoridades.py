@@ -3,20 +3,13 @@ Command Autoridades
 """
 
 import csv
-import os
 import sys
 
 import click
-from dotenv import load_dotenv
-import requests
-from tabulate import tabulate
 
+from pjecz_hercules_cli.dependencies.api_client import resumir_limites, crear_sesion, paginar
 from pjecz_hercules_cli.dependencies.authentications import get_auth_token
-
-load_dotenv()
-API_BASE_URL = os.getenv("API_BASE_URL")
-LIMIT = int(os.getenv("LIMIT"))
-TIMEOUT = int(os.getenv("TIMEOUT"))
+from pjecz_hercules_cli.dependencies.exceptions import MyAnyError
 
 
 @click.group()
@@ -50,45 +43,29 @@ def exportar(archivo_csv, jurisdiccionales, notarias):
         es_notaria = 1 if notarias else 0
 
         # Consultar las autoridades
-        offset = 0
-        while True:
-            try:
-                respuesta = requests.get(
-                    url=f"{API_BASE_URL}/api/v5/autoridades",
-                    headers={"Authorization": f"Bearer {oauth2_token}"},
-                    params={"es_jurisdiccional": es_jurisdiccional, "es_notaria": es_notaria, "limit": LIMIT, "offset": offset},
-                    timeout=TIMEOUT,
-                )
-            except requests.exceptions.RequestException as error:
-                click.echo(click.style(str(error), fg="red"))
-                sys.exit(1)
-            if respuesta.status_code != 200:
-                click.echo(click.style(str(respuesta), fg="red"))
-                sys.exit(1)
-
-            # Si hubo un error
-            contenido = respuesta.json()
-            if contenido["success"] is False:
-                click.echo(click.style(contenido["message"], fg="red"))
-                sys.exit(1)
-
-            # Bucle por cada autoridad
-            for item in contenido["data"]:
-                escritor.writerow(
-                    {
-                        "clave": item["clave"],
-                        "directorio_edictos": item["directorio_edictos"],
-                    }
-                )
-                contador += 1
-                click.echo(click.style(f"[{item['clave']}] ", fg="green"), nl=False)
-
-            # Incrementar el offset con el LIMIT para la siguiente consulta
-            offset += LIMIT
-
-            # Si ya llegamos al final de las consultas
-            if offset > contenido["total"]:
-                break  # Salir del bucle
+        sesion = crear_sesion(oauth2_token)
+        params = {"es_jurisdiccional": es_jurisdiccional, "es_notaria": es_notaria}
+        try:
+            for contenido in paginar(sesion, "/api/v5/autoridades", params):
+
+                # Bucle por cada autoridad
+                for item in contenido["data"]:
+                    escritor.writerow(
+                        {
+                            "clave": item["clave"],
+                            "directorio_edictos": item["directorio_edictos"],
+                        }
+                    )
+                    contador += 1
+                    click.echo(click.style(f"[{item['clave']}] ", fg="green"), nl=False)
+        except MyAnyError as error:
+            click.echo(click.style(str(error), fg="red"))
+            sys.exit(1)
+
+    # Mostrar los tamaños de página elegidos, en un renglón aparte del avance
+    click.echo()
+    for renglon in resumir_limites():
+        click.echo(click.style(renglon, fg="white"))
 
     # Mostrar el mensaje de término
     click.echo(click.style(f"Fueron agregadas {contador} autoridades a {archivo_csv}", fg="green"))
@@ -98,6 +75,7 @@ def exportar(archivo_csv, jurisdiccionales, notarias):
 @click.option("--notarias", is_flag=True, help="Solo Notarías")
 def mostrar(notarias):
     """Mostrar tabla de autoridades"""
+    from tabulate import tabulate  # Se importa aquí para que el CLI arranque rápido
 
     # Obtener el token
     try:
@@ -107,36 +85,23 @@ def mostrar(notarias):
         sys.exit(1)
 
     # Definir parámetros
-    params = {"limit": LIMIT}
+    params = {}
     if notarias:
         params["es_notaria"] = 1
 
-    # Consultar
+    # Consultar todas las páginas, el tamaño de página lo adapta paginar
+    sesion = crear_sesion(oauth2_token)
+    tabla = []
+    encabezados = ["clave", "descripcion_corta", "es_notaria"]
     try:
-        respuesta = requests.get(
-            url=f"{API_BASE_URL}/api/v5/autoridades",
-            headers={"Authorization": f"Bearer {oauth2_token}"},
-            params=params,
-            timeout=TIMEOUT,
-        )
-    except requests.exceptions.RequestException as error:
+        for contenido in paginar(sesion, "/api/v5/autoridades", params):
+            for item in contenido["data"]:
+                tabla.append([item[encabezado] for encabezado in encabezados])
+    except MyAnyError as error:
         click.echo(click.style(str(error), fg="red"))
         sys.exit(1)
-    if respuesta.status_code != 200:
-        click.echo(click.style(str(respuesta), fg="red"))
-        sys.exit(1)
-
-    # Si hubo un error
-    contenido = respuesta.json()
-    if contenido["success"] is False:
-        click.echo(click.style(contenido["message"], fg="red"))
-        sys.exit(1)
 
-    # Mostrar la tabla con los datos de los distritos
-    tabla = []
-    encabezados = ["clave", "descripcion_corta", "es_notaria"]
-    for item in contenido["data"]:
-        tabla.append([item[encabezado] for encabezado in encabezados])
+    # Mostrar la tabla con los datos de las autoridades
     click.echo(tabulate(tabla, headers=encabezados))
 
 
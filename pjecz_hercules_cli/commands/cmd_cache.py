@@ -0,0 +1,79 @@
+"""
+Command Cache
+"""
+
+import sys
+
+import click
+
+from pjecz_hercules_cli.dependencies import synthesis_cache, text_cache
+
+
+@click.group()
+def cli():
+    """Cache"""
+
+
+@click.command()
+def mostrar():
+    """Mostrar las estadísticas de la cache"""
+    import sqlite3  # Se importa aquí para que el CLI arranque rápido
+
+    from tabulate import tabulate
+
+    # Consultar las estadísticas
+    try:
+        textos = text_cache.obtener_estadisticas()
+        sintesis = synthesis_cache.obtener_estadisticas()
+    except sqlite3.Error as error:
+        click.echo(click.style(str(error), fg="red"))
+        sys.exit(1)
+
+    # Mostrar la tabla
+    tabla = [
+        [
+            "textos",
+            textos["archivos"],
+            textos["textos"],
+            f"{textos['bytes'] / 1024 / 1024:.1f}",
+            f"{textos['maximo_bytes'] / 1024 / 1024:.1f}",
+            "",
+            "",
+        ],
+        [
+            "sintesis",
+            "",
+            sintesis["registros"],
+            f"{sintesis['bytes'] / 1024 / 1024:.1f}",
+            f"{sintesis['maximo_bytes'] / 1024 / 1024:.1f}",
+            sintesis["aciertos"],
+            sintesis["fallos"],
+        ],
+    ]
+    click.echo(tabulate(tabla, headers=["cache", "archivos", "registros", "MB", "maximo MB", "aciertos", "fallos"]))
+    click.echo(click.style(f"Directorio {text_cache.CACHE_DIR}", fg="white"))
+
+
+@click.command()
+@click.option("--probar", is_flag=True, help="Modo de prueba, sin cambios")
+def vaciar(probar):
+    """Vaciar la cache"""
+    import sqlite3  # Se importa aquí para que el CLI arranque rápido
+
+    # Si está en modo de pruebas, no se borra
+    if probar:
+        click.echo(click.style("Modo de prueba, no se vació la cache", fg="yellow"))
+        return
+
+    # Vaciar
+    try:
+        text_cache.vaciar()
+        synthesis_cache.vaciar()
+    except sqlite3.Error as error:
+        click.echo(click.style(str(error), fg="red"))
+        sys.exit(1)
+    click.echo(click.style("Se vaciaron las caches de textos y de síntesis", fg="green"))
+
+
+cli.add_command(mostrar)
+cli.add_command(vaciar)
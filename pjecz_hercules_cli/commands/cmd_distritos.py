@@ -2,20 +2,13 @@
 Command Distritos
 """
 
-import os
 import sys
 
 import click
-from dotenv import load_dotenv
-import requests
-from tabulate import tabulate
 
+from pjecz_hercules_cli.dependencies.api_client import crear_sesion, paginar
 from pjecz_hercules_cli.dependencies.authentications import get_auth_token
-
-load_dotenv()
-API_BASE_URL = os.getenv("API_BASE_URL")
-LIMIT = int(os.getenv("LIMIT"))
-TIMEOUT = int(os.getenv("TIMEOUT"))
+from pjecz_hercules_cli.dependencies.exceptions import MyAnyError
 
 
 @click.group()
@@ -26,6 +19,7 @@ def cli():
 @click.command()
 def mostrar():
     """Mostrar los distritos"""
+    from tabulate import tabulate  # Se importa aquí para que el CLI arranque rápido
 
     # Obtener el token
     try:
@@ -34,32 +28,19 @@ def mostrar():
         click.echo(click.style(str(error), fg="red"))
         sys.exit(1)
 
-    # Consultar
+    # Consultar todas las páginas, el tamaño de página lo adapta paginar
+    sesion = crear_sesion(oauth2_token)
+    tabla = []
+    encabezados = ["clave", "nombre_corto", "nombre", "es_jurisdiccional"]
     try:
-        respuesta = requests.get(
-            url=f"{API_BASE_URL}/api/v5/distritos",
-            headers={"Authorization": f"Bearer {oauth2_token}"},
-            params={"limit": LIMIT},
-            timeout=TIMEOUT,
-        )
-    except requests.exceptions.RequestException as error:
+        for contenido in paginar(sesion, "/api/v5/distritos"):
+            for item in contenido["data"]:
+                tabla.append([item[encabezado] for encabezado in encabezados])
+    except MyAnyError as error:
         click.echo(click.style(str(error), fg="red"))
         sys.exit(1)
-    if respuesta.status_code != 200:
-        click.echo(click.style(str(respuesta), fg="red"))
-        sys.exit(1)
-
-    # Si hubo un error
-    contenido = respuesta.json()
-    if contenido["success"] is False:
-        click.echo(click.style(contenido["message"], fg="red"))
-        sys.exit(1)
 
     # Mostrar la tabla con los datos de los distritos
-    tabla = []
-    encabezados = ["clave", "nombre_corto", "nombre", "es_jurisdiccional"]
-    for item in contenido["data"]:
-        tabla.append([item[encabezado] for encabezado in encabezados])
     click.echo(tabulate(tabla, headers=encabezados))
 
 
@@ -2,35 +2,43 @@
 Command Edictos
 """
 
-import json
+import concurrent.futures
+import functools
+from datetime import date
 from pathlib import Path
 import os
+import stat
 import sys
+import time
+from typing import TYPE_CHECKING
 from urllib.parse import unquote
 
 import click
 from dotenv import load_dotenv
-from openai import OpenAI
-import requests
 
+from pjecz_hercules_cli.dependencies import file_index, metrics, synthesis_cache
+from pjecz_hercules_cli.dependencies.api_client import resumir_limites, consultar, crear_sesion, enviar, paginar
 from pjecz_hercules_cli.dependencies.authentications import get_auth_token
+from pjecz_hercules_cli.dependencies.checkpoints import PuntoControl
+from pjecz_hercules_cli.dependencies.daemons import VIGILAR_INTERVALO, Vigilante
 from pjecz_hercules_cli.dependencies.exceptions import MyAnyError
+from pjecz_hercules_cli.dependencies.executors import mapear_en_orden
+from pjecz_hercules_cli.dependencies.openai_tools import configurar_simultaneas, crear_cliente_openai, sintetizar_texto
 from pjecz_hercules_cli.dependencies.pdf_tools import extraer_texto_de_archivo_pdf
+from pjecz_hercules_cli.dependencies.watermarks import MarcaAgua
+
+# Sólo para las anotaciones, requests y openai tardan en importarse
+if TYPE_CHECKING:
+    import requests
+    from openai import OpenAI
 
 load_dotenv()
-OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
-OPENAI_ENDPOINT = os.getenv("OPENAI_ENDPOINT")
-OPENAI_MODEL = os.getenv("OPENAI_MODEL")
-OPENAI_ORG_ID = os.getenv("OPENAI_ORG_ID")
-OPENAI_PROJECT_ID = os.getenv("OPENAI_PROJECT_ID")
-OPENAI_PROMPT = os.getenv("OPENAI_PROMPT")
-API_BASE_URL = os.getenv("API_BASE_URL")
-LIMIT = int(os.getenv("LIMIT"))
-TIMEOUT = int(os.getenv("TIMEOUT"))
 EDICTOS_BASE_DIR = os.getenv("EDICTOS_BASE_DIR")
 EDICTOS_GCS_BASE_URL = os.getenv("EDICTOS_GCS_BASE_URL")
 MOSTRAR_CARACTERES = int(os.getenv("MOSTRAR_CARACTERES"))
 
+SIMULTANEAS_POR_DEFECTO = 4
+
 
 @click.group()
 def cli():
@@ -38,13 +46,28 @@ def cli():
 
 
 @click.command()
-@click.argument("creado_desde", type=str)
-@click.argument("creado_hasta", type=str)
+@click.argument("creado_desde", type=str, required=False)
+@click.argument("creado_hasta", type=str, required=False)
+@click.option("--desde-ultimo", is_flag=True, help="Procesar lo creado desde la última ejecución que terminó bien")
 @click.option("--probar", is_flag=True, help="Modo de prueba, sin cambios")
+@click.option("--reanudar", is_flag=True, help="Reanudar donde se quedó la ejecución anterior")
+@click.option("--sin-cache", is_flag=True, help="Extraer los textos sin usar la cache")
+@click.option("--sin-indice", is_flag=True, help="Revisar cada archivo en el disco aunque exista el índice")
 @click.option("--sobreescribir", is_flag=True, help="Sobreescribe lo ya analizado")
-def analizar(creado_desde, creado_hasta, probar, sobreescribir):
+def analizar(
+    creado_desde,
+    creado_hasta,
+    desde_ultimo,
+    probar,
+    reanudar,
+    sin_cache,
+    sin_indice,
+    sobreescribir,
+    sesion: "requests.Session" = None,
+):
     """Analizar edictos"""
     click.echo("Analizando edictos")
+    inicio = time.perf_counter()
 
     # Validar que exista el directorio EDICTOS_BASE_DIR
     sentencias_dir = Path(EDICTOS_BASE_DIR)
@@ -52,6 +75,29 @@ def analizar(creado_desde, creado_hasta, probar, sobreescribir):
         click.echo(click.style(f"No existe el directorio {EDICTOS_BASE_DIR}", fg="red"))
         sys.exit(1)
 
+    # Usar el índice de archivos si existe, para no consultar la unidad de red por cada archivo
+    usar_indice = False
+    if sin_indice is False:
+        estadisticas = file_index.obtener_estadisticas(EDICTOS_BASE_DIR)
+        if estadisticas is not None:
+            usar_indice = True
+            actualizado = time.strftime("%Y-%m-%d %H:%M", time.localtime(estadisticas["actualizado"]))
+            click.echo(click.style(f"Usando el índice de {estadisticas['archivos']} archivos del {actualizado}", fg="white"))
+
+    # Definir el rango de fechas, con --desde-ultimo empieza en la marca de agua de la última ejecución que terminó bien
+    marca_agua = None
+    if desde_ultimo:
+        marca_agua = MarcaAgua("edictos_analizar")
+        try:
+            creado_desde, creado_hasta = marca_agua.definir_rango(creado_desde, creado_hasta)
+        except MyAnyError as error:
+            click.echo(click.style(str(error), fg="red"))
+            sys.exit(1)
+        click.echo(click.style(f"Desde la última ejecución, del {creado_desde} al {creado_hasta}", fg="white"))
+    elif not creado_desde or not creado_hasta:
+        click.echo(click.style("Faltan creado_desde y creado_hasta, o use --desde-ultimo", fg="red"))
+        sys.exit(1)
+
     # Obtener el token
     try:
         oauth2_token = get_auth_token()
@@ -59,128 +105,269 @@ def analizar(creado_desde, creado_hasta, probar, sobreescribir):
         click.echo(click.style(str(error), fg="red"))
         sys.exit(1)
 
-    # Inicializar el contador y el offset
-    contador = 0
-    offset = 0
-
-    # Bucle por las consultas
-    while True:
-
-        # Consultar edictos
+    # Preparar el punto de control, si se reanuda se carga el que dejó la ejecución anterior
+    punto_control = PuntoControl("edictos_analizar", creado_desde, creado_hasta, persistente=not probar)
+    if reanudar:
         try:
-            respuesta = requests.get(
-                url=f"{API_BASE_URL}/api/v5/edictos",
-                headers={"Authorization": f"Bearer {oauth2_token}"},
-                params={"creado_desde": creado_desde, "creado_hasta": creado_hasta, "limit": LIMIT, "offset": offset},
-                timeout=TIMEOUT,
-            )
-        except requests.exceptions.RequestException as error:
+            if punto_control.cargar():
+                click.echo(click.style(f"Reanudando desde el offset {punto_control.offset}", fg="white"))
+            else:
+                click.echo(click.style("No hay punto de control, se empieza desde el principio", fg="yellow"))
+        except MyAnyError as error:
             click.echo(click.style(str(error), fg="red"))
             sys.exit(1)
-        if respuesta.status_code != 200:
-            click.echo(click.style(str(respuesta), fg="red"))
-            sys.exit(1)
-        paginado = respuesta.json()
 
-        # Si hubo un error
-        if paginado["success"] is False:
-            click.echo(click.style(paginado["message"], fg="red"))
-            sys.exit(1)
+    # Crear la sesión para reutilizar la conexión, vigilar da la suya para reutilizarla entre vueltas
+    if sesion is None:
+        sesion = crear_sesion(oauth2_token)
 
-        # Bucle por los datos
-        for item in paginado["data"]:
-            click.echo(click.style(f"[{item['id']}] ", fg="white"), nl=False)
+    # Inicializar el contador
+    contador = 0
 
-            # Si ya fue analizada, se omite
-            if sobreescribir is False and item["rag_fue_analizado_tiempo"] is not None:
-                click.echo(click.style("Se omite porque ya fue analizado", fg="yellow"))
-                continue
+    # Bucle por las consultas
+    parametros = {"creado_desde": creado_desde, "creado_hasta": creado_hasta}
+    try:
+        for paginado in paginar(sesion, "/api/v5/edictos", parametros, offset=punto_control.offset):
+            ids = [item["id"] for item in paginado["data"]]
+            pendientes = punto_control.iniciar_pagina(paginado["offset"], paginado["limit"], ids)
+
+            # Bucle por los datos
+            for item in paginado["data"]:
+                # Si ya se procesó en una ejecución anterior que se interrumpió, se omite
+                if item["id"] not in pendientes:
+                    continue
+                click.echo(click.style(f"[{item['id']}] ", fg="white"), nl=False)
 
-            # Definir la ruta al archivo pdf reemplazando el inicio del url con el directorio
-            archivo_ruta = Path(EDICTOS_BASE_DIR + unquote(item["url"][len(EDICTOS_GCS_BASE_URL) :]))
+                # Si ya fue analizada, se omite
+                if sobreescribir is False and item["rag_fue_analizado_tiempo"] is not None:
+                    click.echo(click.style("Se omite porque ya fue analizado", fg="yellow"))
+                    punto_control.marcar(item["id"])
+                    continue
 
-            # Verificar que exista el archivo pdf
-            archivo_ruta_existe = bool(archivo_ruta.exists() and archivo_ruta.is_file())
+                # Definir la ruta al archivo pdf reemplazando el inicio del url con el directorio
+                archivo_ruta = Path(EDICTOS_BASE_DIR + unquote(item["url"][len(EDICTOS_GCS_BASE_URL) :]))
 
-            # Si NO existe se muestra en color amarillo y se omite, de lo contario se muestra en color verde
-            if archivo_ruta_existe is False:
-                click.echo(click.style(f"{item['archivo']} NO existe", fg="yellow"))
-                continue
-            click.echo(click.style(f"{item['archivo'][:20]}... ", fg="green"), nl=False)
+                # Tomar la ruta canónica del índice, para no resolverla en la unidad de red
+                canonica = False
+                if usar_indice:
+                    encontrado = file_index.buscar_archivo(EDICTOS_BASE_DIR, str(archivo_ruta))
+                    if encontrado is not None:
+                        archivo_ruta, canonica = Path(encontrado[0]), True
 
-            # Extraer el texto del archivo PDF
-            try:
-                texto = extraer_texto_de_archivo_pdf(str(archivo_ruta))
-            except MyAnyError as error:
-                click.echo(click.style(str(error), fg="yellow"))
-                continue
-
-            # Si no hay texto, se omite
-            if texto.strip() == "":
-                click.echo(click.style("No tiene texto", fg="yellow"))
-                continue
-            click.echo(click.style(f"{texto[:MOSTRAR_CARACTERES]}... = {len(texto)} ", fg="blue"), nl=False)
-
-            # Definir los datos RAG a enviar
-            data = {
-                "id": item["id"],
-                "analisis": {
-                    "archivo_tamanio": archivo_ruta.stat().st_size,
-                    "autor": item["autoridad_clave"],
-                    "longitud": len(texto),
-                    "texto": texto,
-                },
-                "sintesis": None,
-                "categorias": None,
-            }
-
-            # Si NO está en modo de pruebas
-            if probar is False:
-                # Enviar los datos RAG
+                # Verificar que exista el archivo pdf con una consulta al disco, que también da su tamaño actual
                 try:
-                    respuesta = requests.put(
-                        url=f"{API_BASE_URL}/api/v5/edictos/rag",
-                        headers={"Authorization": f"Bearer {oauth2_token}"},
-                        data=json.dumps(data),
-                        timeout=TIMEOUT,
-                    )
-                except requests.exceptions.RequestException as error:
-                    click.echo(click.style(str(error), fg="red"))
-                    sys.exit(1)
-                if respuesta.status_code != 200:
-                    click.echo(click.style(str(respuesta.content), fg="red"))
-                    sys.exit(1)
-
-                # Si hubo un error
-                resultado = respuesta.json()
-                if resultado["success"] is False:
-                    click.echo(click.style(resultado["message"], fg="yellow"))
+                    estado = os.stat(archivo_ruta)
+                except OSError:
+                    estado = None
+                archivo_ruta_existe = estado is not None and stat.S_ISREG(estado.st_mode)
+
+                # Si NO existe se muestra en color amarillo y se omite, de lo contario se muestra en color verde
+                if archivo_ruta_existe is False:
+                    click.echo(click.style(f"{item['archivo']} NO existe", fg="yellow"))
+                    punto_control.marcar(item["id"])
                     continue
+                click.echo(click.style(f"{item['archivo'][:20]}... ", fg="green"), nl=False)
 
-            # Incrementar el contador
-            contador += 1
-            if probar is False:
-                click.echo(click.style("ENVIADO", fg="white"))
-            else:
-                click.echo(click.style("PROBADO", fg="white"))
+                # Extraer el texto del archivo PDF
+                try:
+                    texto = extraer_texto_de_archivo_pdf(str(archivo_ruta), not sin_cache, estado=estado, canonica=canonica)
+                except MyAnyError as error:
+                    click.echo(click.style(str(error), fg="yellow"))
+                    punto_control.marcar(item["id"])
+                    continue
 
-        # Incrementar el offset y terminar el bucle si lo rebasamos
-        offset += LIMIT
-        if offset >= paginado["total"]:
-            break
+                # Si no hay texto, se omite
+                if texto.strip() == "":
+                    click.echo(click.style("No tiene texto", fg="yellow"))
+                    punto_control.marcar(item["id"])
+                    continue
+                click.echo(click.style(f"{texto[:MOSTRAR_CARACTERES]}... = {len(texto)} ", fg="blue"), nl=False)
+
+                # Definir los datos RAG a enviar
+                data = {
+                    "id": item["id"],
+                    "analisis": {
+                        "archivo_tamanio": estado.st_size,
+                        "autor": item["autoridad_clave"],
+                        "longitud": len(texto),
+                        "texto": texto,
+                    },
+                    "sintesis": None,
+                    "categorias": None,
+                }
+
+                # Si NO está en modo de pruebas
+                if probar is False:
+                    # Enviar los datos RAG, si falla la API se deja sin marcar para volver a intentarlo al reanudar
+                    try:
+                        resultado = enviar(sesion, "/api/v5/edictos/rag", data)
+                    except MyAnyError as error:
+                        click.echo(click.style(str(error), fg="yellow"))
+                        continue
+
+                    # Si hubo un error
+                    if resultado["success"] is False:
+                        click.echo(click.style(resultado["message"], fg="yellow"))
+                        punto_control.marcar(item["id"])
+                        continue
+
+                # Incrementar el contador
+                punto_control.marcar(item["id"])
+                contador += 1
+                if probar is False:
+                    click.echo(click.style("ENVIADO", fg="white"))
+                else:
+                    click.echo(click.style("PROBADO", fg="white"))
+    except MyAnyError as error:
+        click.echo(click.style(str(error), fg="red"))
+        click.echo(click.style("Para continuar donde se quedó use --reanudar", fg="yellow"))
+        sys.exit(1)
+    finally:
+        punto_control.guardar()
+
+    # Avanzar la marca de agua, sólo si no quedó nada pendiente de volver a intentar
+    if marca_agua is not None and probar is False:
+        if punto_control.esta_completo():
+            click.echo(click.style(f"Marca de agua en {marca_agua.avanzar()}", fg="white"))
+        else:
+            click.echo(click.style("Quedaron pendientes, la marca de agua no avanzó", fg="yellow"))
+
+    # Borrar el punto de control si ya no hace falta, si quedaron pendientes se conserva para reanudar
+    if punto_control.esta_completo():
+        punto_control.borrar()
+    else:
+        punto_control.guardar()
+        click.echo(click.style("Quedaron pendientes, para volver a intentarlos use --reanudar", fg="yellow"))
+
+    # Guardar y mostrar las medidas de cada etapa
+    resumen, rutas = metrics.publicar("edictos_analizar", time.perf_counter() - inicio, contador)
+    for renglon in metrics.resumir_renglones(resumen):
+        click.echo(click.style(renglon, fg="white"))
+    click.echo(click.style(f"Medidas guardadas en {', '.join(str(ruta) for ruta in rutas)}", fg="white"))
+
+    # Mostrar los tamaños de página elegidos
+    for renglon in resumir_limites():
+        click.echo(click.style(renglon, fg="white"))
 
     # Mostrar el mensaje de término
     click.echo(click.style(f"Fueron analizadas {contador} edictos", fg="green"))
 
 
+def sintetizar_edicto(
+    sesion: "requests.Session",
+    open_ai: "OpenAI",
+    item: dict,
+    probar: bool,
+    sobreescribir: bool,
+    usar_cache: bool = True,
+) -> tuple[bool | None, list]:
+    """Sintetizar un edicto, entrega si fue sintetizado (None si falló la API) y los mensajes (texto, color) a mostrar"""
+    mensajes = []
+
+    # Si todavía no ha sido analizado, no hay texto que sintetizar, se omite
+    if sobreescribir is False and item["rag_fue_analizado_tiempo"] is None:
+        mensajes.append(("Se omite porque todavía no ha sido analizado", "yellow"))
+        return False, mensajes
+
+    # Si ya fue sintetizado, se omite
+    if sobreescribir is False and item["rag_fue_sintetizado_tiempo"] is not None:
+        mensajes.append(("Se omite porque ya fue sintetizado", "yellow"))
+        return False, mensajes
+
+    # Consultar por su ID para obtener su texto, si falla la API queda pendiente para volver a intentarlo
+    try:
+        detalle = consultar(sesion, f"/api/v5/edictos/{item['id']}")
+    except MyAnyError as error:
+        mensajes.append((str(error), "yellow"))
+        return None, mensajes
+
+    # Validar que tiene el texto
+    datos = detalle["data"]
+    if datos is None:
+        mensajes.append(("No tiene 'data'", "yellow"))
+        return False, mensajes
+    if "rag_analisis" not in datos or datos["rag_analisis"] is None:
+        mensajes.append(("No tiene 'rag_analisis' o es nulo", "yellow"))
+        return False, mensajes
+    if "texto" not in datos["rag_analisis"] or datos["rag_analisis"]["texto"] is None:
+        mensajes.append(("No tiene 'texto' el análisis o es nulo", "yellow"))
+        return False, mensajes
+    texto = datos["rag_analisis"]["texto"]
+    if texto.strip() == "":
+        mensajes.append(("No hay texto para sintetizar, está vacío", "yellow"))
+        return False, mensajes
+
+    # Agregar a los mensajes la longitud de caracteres
+    mensajes.append((f"{texto[:MOSTRAR_CARACTERES]}… = {len(texto)} ", "blue"))
+
+    # Enviar a OpenAI el texto
+    try:
+        sintesis, tokens_total, modelo = sintetizar_texto(open_ai, texto, usar_cache)
+    except MyAnyError as error:
+        mensajes.append((str(error), "yellow"))
+        return False, mensajes
+
+    # Agregar a los mensajes un fragmento de la sintesis
+    mensajes.append((f"{sintesis[:MOSTRAR_CARACTERES]}… = {tokens_total} ", "magenta"))
+
+    # Definir los datos RAG a enviar
+    data = {
+        "id": item["id"],
+        "analisis": None,
+        "sintesis": {
+            "modelo": modelo,
+            "sintesis": sintesis,
+            "tokens_total": tokens_total,
+        },
+        "categorias": None,
+    }
+
+    # Si está en modo de pruebas, no se envía
+    if probar:
+        mensajes.append(("PROBADO", "white"))
+        return True, mensajes
+
+    # Enviar los datos RAG, si falla la API queda pendiente para volver a intentarlo
+    try:
+        resultado = enviar(sesion, "/api/v5/edictos/rag", data)
+    except MyAnyError as error:
+        mensajes.append((str(error), "yellow"))
+        return None, mensajes
+    if resultado["success"] is False:
+        mensajes.append((resultado["message"], "yellow"))
+        return False, mensajes
+    mensajes.append(("ENVIADO", "white"))
+    return True, mensajes
+
+
 @click.command()
-@click.argument("creado_desde", type=str)
-@click.argument("creado_hasta", type=str)
+@click.argument("creado_desde", type=str, required=False)
+@click.argument("creado_hasta", type=str, required=False)
+@click.option("--desde-ultimo", is_flag=True, help="Procesar lo creado desde la última ejecución que terminó bien")
 @click.option("--probar", is_flag=True, help="Modo de prueba, sin cambios")
+@click.option("--reanudar", is_flag=True, help="Reanudar donde se quedó la ejecución anterior")
+@click.option("--simultaneas", type=int, default=SIMULTANEAS_POR_DEFECTO, help="Máximo de solicitudes simultáneas a OpenAI")
+@click.option("--sin-cache", is_flag=True, help="Sintetizar sin usar la cache")
 @click.option("--sobreescribir", is_flag=True, help="Sobreescribe lo ya sintetizado")
-def sintetizar(creado_desde, creado_hasta, probar, sobreescribir):
+def sintetizar(
+    creado_desde,
+    creado_hasta,
+    desde_ultimo,
+    probar,
+    reanudar,
+    simultaneas,
+    sin_cache,
+    sobreescribir,
+    sesion: "requests.Session" = None,
+):
     """Sintetizar edictos"""
     click.echo("Sintetizando edictos")
+    inicio = time.perf_counter()
+
+    # Validar las simultáneas
+    if simultaneas < 1:
+        click.echo(click.style("Las simultáneas deben ser mayores a cero", fg="red"))
+        sys.exit(1)
 
     # Validar que exista el directorio EDICTOS_BASE_DIR
     sentencias_dir = Path(EDICTOS_BASE_DIR)
@@ -188,14 +375,23 @@ def sintetizar(creado_desde, creado_hasta, probar, sobreescribir):
         click.echo(click.style(f"No existe el directorio {EDICTOS_BASE_DIR}", fg="red"))
         sys.exit(1)
 
-    # Inicializar OpenAI
-    open_ai = OpenAI(
-        api_key=OPENAI_API_KEY,
-        base_url=OPENAI_ENDPOINT,
-        organization=OPENAI_ORG_ID,
-        project=OPENAI_PROJECT_ID,
-        timeout=60,
-    )
+    # Inicializar OpenAI, con el máximo de solicitudes en vuelo, incluyendo las de los fragmentos de textos largos
+    open_ai = crear_cliente_openai()
+    configurar_simultaneas(simultaneas)
+
+    # Definir el rango de fechas, con --desde-ultimo empieza en la marca de agua de la última ejecución que terminó bien
+    marca_agua = None
+    if desde_ultimo:
+        marca_agua = MarcaAgua("edictos_sintetizar")
+        try:
+            creado_desde, creado_hasta = marca_agua.definir_rango(creado_desde, creado_hasta)
+        except MyAnyError as error:
+            click.echo(click.style(str(error), fg="red"))
+            sys.exit(1)
+        click.echo(click.style(f"Desde la última ejecución, del {creado_desde} al {creado_hasta}", fg="white"))
+    elif not creado_desde or not creado_hasta:
+        click.echo(click.style("Faltan creado_desde y creado_hasta, o use --desde-ultimo", fg="red"))
+        sys.exit(1)
 
     # Obtener el token
     try:
@@ -204,160 +400,165 @@ def sintetizar(creado_desde, creado_hasta, probar, sobreescribir):
         click.echo(click.style(str(error), fg="red"))
         sys.exit(1)
 
-    # Inicializar el contador y el offset
-    contador = 0
-    offset = 0
-
-    # Bucle por las consultas
-    while True:
-
-        # Consultar edictos
+    # Preparar el punto de control, si se reanuda se carga el que dejó la ejecución anterior
+    punto_control = PuntoControl("edictos_sintetizar", creado_desde, creado_hasta, persistente=not probar)
+    if reanudar:
         try:
-            respuesta = requests.get(
-                url=f"{API_BASE_URL}/api/v5/edictos",
-                headers={"Authorization": f"Bearer {oauth2_token}"},
-                params={"creado_desde": creado_desde, "creado_hasta": creado_hasta, "limit": LIMIT, "offset": offset},
-                timeout=TIMEOUT,
-            )
-        except requests.exceptions.RequestException as error:
+            if punto_control.cargar():
+                click.echo(click.style(f"Reanudando desde el offset {punto_control.offset}", fg="white"))
+            else:
+                click.echo(click.style("No hay punto de control, se empieza desde el principio", fg="yellow"))
+        except MyAnyError as error:
             click.echo(click.style(str(error), fg="red"))
             sys.exit(1)
-        if respuesta.status_code != 200:
-            click.echo(click.style(str(respuesta), fg="red"))
-            sys.exit(1)
-        paginado = respuesta.json()
 
-        # Si hubo un error
-        if paginado["success"] is False:
-            click.echo(click.style(paginado["message"], fg="red"))
-            sys.exit(1)
+    # Crear la sesión con una conexión por cada solicitud simultánea, vigilar da la suya para reutilizarla
+    if sesion is None:
+        sesion = crear_sesion(oauth2_token, simultaneas)
 
-        # Bucle por los datos
-        for item in paginado["data"]:
-            click.echo(click.style(f"[{item['id']}] ", fg="white"), nl=False)
+    # Inicializar el contador
+    contador = 0
 
-            # Si ya fue analizado, se omite
-            if sobreescribir is False and item["rag_fue_analizado_tiempo"] is not None:
-                click.echo(click.style("Se omite porque ya fue analizado", fg="yellow"))
-                continue
+    # Sintetizar con varias solicitudes en vuelo, pero mostrar los resultados en el orden de la consulta
+    parametros = {"creado_desde": creado_desde, "creado_hasta": creado_hasta}
+    sintetizar_item = functools.partial(
+        sintetizar_edicto,
+        sesion,
+        open_ai,
+        probar=probar,
+        sobreescribir=sobreescribir,
+        usar_cache=not sin_cache,
+    )
 
-            # Si ya fue sintetizado, se omite
-            if sobreescribir is False and item["rag_fue_sintetizado_tiempo"] is not None:
-                click.echo(click.style("Se omite porque ya fue sintetizado", fg="yellow"))
-                continue
+    def items_pendientes():
+        """Entregar los registros de cada página, sin los que ya procesó una ejecución anterior"""
+        for paginado in paginar(sesion, "/api/v5/edictos", parametros, offset=punto_control.offset):
+            ids = [item["id"] for item in paginado["data"]]
+            pendientes = punto_control.iniciar_pagina(paginado["offset"], paginado["limit"], ids)
+            for item in paginado["data"]:
+                if item["id"] in pendientes:
+                    yield item
 
-            # Consultar por su ID para obtener su texto
-            try:
-                respuesta = requests.get(
-                    url=f"{API_BASE_URL}/api/v5/edictos/{item['id']}",
-                    headers={"Authorization": f"Bearer {oauth2_token}"},
-                    timeout=TIMEOUT,
-                )
-            except requests.exceptions.RequestException as error:
-                click.echo(click.style(str(error), fg="red"))
-                sys.exit(1)
-            if respuesta.status_code != 200:
-                click.echo(click.style(str(respuesta), fg="red"))
-                sys.exit(1)
-            detalle = respuesta.json()
-
-            # Si hubo un error
-            contenido = respuesta.json()
-            if contenido["success"] is False:
-                click.echo(click.style(contenido["message"], fg="red"))
-                sys.exit(1)
-
-            # Validar que tiene el texto
-            datos = detalle["data"]
-            if datos is None:
-                click.echo(click.style("No tiene 'data'", fg="yellow"))
-                continue
-            if "rag_analisis" not in datos or datos["rag_analisis"] is None:
-                click.echo(click.style("No tiene 'rag_analisis' o es nulo", fg="yellow"))
-                continue
-            if "texto" not in datos["rag_analisis"] or datos["rag_analisis"]["texto"] is None:
-                click.echo(click.style("No tiene 'texto' el análisis o es nulo", fg="yellow"))
-                continue
-            texto = datos["rag_analisis"]["texto"]
-            if texto.strip() == "":
-                click.echo(click.style("No hay texto para sintetizar, está vacío", fg="yellow"))
-                continue
-
-            # Mostrar en pantalla la longitud de caracteres
-            click.echo(click.style(f"{texto[:MOSTRAR_CARACTERES]}… = {len(texto)} ", fg="blue"), nl=False)
-
-            # Definir los mensajes a enviar a OpenAI
-            mensajes = [
-                {"role": "system", "content": OPENAI_PROMPT},
-                {"role": "user", "content": texto},
-            ]
-
-            # Enviar a OpenAI el texto
+    try:
+        with concurrent.futures.ThreadPoolExecutor(max_workers=simultaneas) as executor:
+            for item, future in mapear_en_orden(executor, sintetizar_item, items_pendientes(), simultaneas):
+                fue_sintetizado, mensajes = future.result()
+                click.echo(click.style(f"[{item['id']}] ", fg="white"), nl=False)
+                for mensaje, color in mensajes:
+                    click.echo(click.style(mensaje, fg=color), nl=False)
+                click.echo()
+                # Si falló la API se deja sin marcar, para que se vuelva a intentar al reanudar
+                if fue_sintetizado is None:
+                    continue
+                punto_control.marcar(item["id"])
+                if fue_sintetizado:
+                    contador += 1
+    except MyAnyError as error:
+        click.echo(click.style(str(error), fg="red"))
+        click.echo(click.style("Para continuar donde se quedó use --reanudar", fg="yellow"))
+        sys.exit(1)
+    finally:
+        punto_control.guardar()
+
+    # Avanzar la marca de agua, sólo si no quedó nada pendiente de volver a intentar
+    if marca_agua is not None and probar is False:
+        if punto_control.esta_completo():
+            click.echo(click.style(f"Marca de agua en {marca_agua.avanzar()}", fg="white"))
+        else:
+            click.echo(click.style("Quedaron pendientes, la marca de agua no avanzó", fg="yellow"))
+
+    # Borrar el punto de control si ya no hace falta, si quedaron pendientes se conserva para reanudar
+    if punto_control.esta_completo():
+        punto_control.borrar()
+    else:
+        punto_control.guardar()
+        click.echo(click.style("Quedaron pendientes, para volver a intentarlos use --reanudar", fg="yellow"))
+
+    # Mostrar los aciertos de la cache
+    if sin_cache is False:
+        contadores = synthesis_cache.obtener_contadores_ejecucion()
+        click.echo(
+            click.style(f"Cache de síntesis: {contadores['aciertos']} aciertos, {contadores['fallos']} fallos", fg="white")
+        )
+
+    # Guardar y mostrar las medidas de cada etapa
+    resumen, rutas = metrics.publicar("edictos_sintetizar", time.perf_counter() - inicio, contador)
+    for renglon in metrics.resumir_renglones(resumen):
+        click.echo(click.style(renglon, fg="white"))
+    click.echo(click.style(f"Medidas guardadas en {', '.join(str(ruta) for ruta in rutas)}", fg="white"))
+
+    # Mostrar los tamaños de página elegidos
+    for renglon in resumir_limites():
+        click.echo(click.style(renglon, fg="white"))
+
+    # Mostrar el mensaje de término
+    click.echo(click.style(f"Fueron sintetizados {contador} edictos", fg="green"))
+
+
+@click.command()
+@click.option("--desde", type=str, default="", help="Fecha inicial AAAA-MM-DD si aún no hay marca de agua (por defecto hoy)")
+@click.option("--intervalo", type=int, default=VIGILAR_INTERVALO, help="Segundos entre cada consulta")
+@click.option("--probar", is_flag=True, help="Modo de prueba, sin cambios")
+@click.option("--simultaneas", type=int, default=SIMULTANEAS_POR_DEFECTO, help="Máximo de solicitudes simultáneas a OpenAI")
+@click.option("--sin-sintetizar", is_flag=True, help="Sólo analizar")
+@click.pass_context
+def vigilar(ctx, desde, intervalo, probar, simultaneas, sin_sintetizar):
+    """Quedarse en ejecución analizando y sintetizando los edictos nuevos cada intervalo, termina con SIGTERM"""
+    click.echo(f"Vigilando edictos cada {intervalo} segundos")
+
+    # Validar el intervalo
+    if intervalo < 1:
+        click.echo(click.style("El intervalo debe ser mayor a cero", fg="red"))
+        sys.exit(1)
+
+    # Cada vuelta ejecuta las órdenes con --desde-ultimo en este proceso, así se reutilizan los módulos ya importados,
+    # el cliente de OpenAI, las caches y los tamaños de página aprendidos; el token se reutiliza mientras esté vigente
+    ordenes = [(analizar, {})]
+    if sin_sintetizar is False:
+        ordenes.append((sintetizar, {"simultaneas": simultaneas}))
+    vigilante = Vigilante(intervalo)
+
+    # La sesión se crea una sola vez y se da a cada orden, así las conexiones a la API quedan listas entre vueltas;
+    # se crea en la primera vuelta para que un login fallido se vuelva a intentar
+    compartidos = {}
+
+    def vuelta():
+        """Procesar lo creado desde la última vuelta que terminó bien"""
+        if "sesion" not in compartidos:
+            compartidos["sesion"] = crear_sesion(get_auth_token(), simultaneas)
+        for orden, opciones in ordenes:
+            if vigilante.detener.is_set():
+                break
+            # Las medidas y los aciertos de la cache que muestra cada orden son sólo de esa vuelta
+            metrics.reiniciar()
+            synthesis_cache.reiniciar_contadores_ejecucion()
             try:
-                chat_response = open_ai.chat.completions.create(
-                    model=OPENAI_MODEL,
-                    messages=mensajes,
-                    stream=False,
+                ctx.invoke(
+                    orden,
+                    creado_desde=desde or date.today().isoformat(),
+                    desde_ultimo=True,
+                    probar=probar,
+                    sesion=compartidos["sesion"],
+                    **opciones,
                 )
-            except Exception as error:
-                click.echo(click.style(f"Error al sintetizar: {str(error)}", fg="yellow"))
-                continue
-
-            # Mostrar en pantalla un fragmento de la sintesis
-            sintesis = chat_response.choices[0].message.content
-            tokens_total = chat_response.usage.total_tokens
-            click.echo(click.style(f"{sintesis[:MOSTRAR_CARACTERES]}… = {tokens_total} ", fg="magenta"), nl=False)
-
-            # Definir los datos RAG a enviar
-            data = {
-                "id": item["id"],
-                "analisis": None,
-                "sintesis": {
-                    "modelo": chat_response.model,
-                    "sintesis": sintesis,
-                    "tokens_total": tokens_total,
-                },
-                "categorias": None,
-            }
-
-            # Si NO está en modo de pruebas
-            if probar is False:
-                # Enviar los datos RAG
-                try:
-                    respuesta = requests.put(
-                        url=f"{API_BASE_URL}/api/v5/edictos/rag",
-                        headers={"Authorization": f"Bearer {oauth2_token}"},
-                        data=json.dumps(data),
-                        timeout=TIMEOUT,
+            except SystemExit as salida:
+                if salida.code:
+                    click.echo(
+                        click.style(f"{orden.name} terminó con error, se vuelve a intentar en la siguiente vuelta", fg="yellow")
                     )
-                except requests.exceptions.RequestException as error:
-                    click.echo(click.style(str(error), fg="red"))
-                    sys.exit(1)
-                if respuesta.status_code != 200:
-                    click.echo(click.style(str(respuesta.content), fg="red"))
-                    sys.exit(1)
-
-                # Si hubo un error
-                resultado = respuesta.json()
-                if resultado["success"] is False:
-                    click.echo(click.style(resultado["message"], fg="yellow"))
-                    continue
-
-            # Incrementar el contador
-            contador += 1
-            if probar is False:
-                click.echo(click.style("ENVIADO", fg="white"))
-            else:
-                click.echo(click.style("PROBADO", fg="white"))
 
-        # Incrementar el offset y terminar el bucle si lo rebasamos
-        offset += LIMIT
-        if offset >= paginado["total"]:
-            break
+    def al_fallar(error: Exception):
+        """Mostrar el error inesperado y seguir vigilando"""
+        click.echo(click.style(f"Error inesperado: {str(error)}", fg="red"))
 
-    # Mostrar el mensaje de término
-    click.echo(click.style(f"Fueron sintetizados {contador} edictos", fg="green"))
+    try:
+        vigilante.ejecutar(vuelta, al_fallar)
+    finally:
+        if "sesion" in compartidos:
+            compartidos["sesion"].close()
+    click.echo(click.style(f"Se dejó de vigilar después de {vigilante.vueltas} vueltas", fg="green"))
 
 
 cli.add_command(analizar)
 cli.add_command(sintetizar)
+cli.add_command(vigilar)
@@ -4,20 +4,20 @@ Command OpenAI
 
 import os
 import sys
+from typing import TYPE_CHECKING
 
 import click
 from dotenv import load_dotenv
-from openai import OpenAI
 
 from pjecz_hercules_cli.dependencies.exceptions import MyAnyError
+from pjecz_hercules_cli.dependencies.openai_tools import crear_cliente_openai, preguntar_en_flujo, sintetizar_texto
 from pjecz_hercules_cli.dependencies.pdf_tools import extraer_texto_de_archivo_pdf
 
+# Sólo para las anotaciones, openai tarda en importarse
+if TYPE_CHECKING:
+    from openai import OpenAI
+
 load_dotenv()
-OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
-OPENAI_ENDPOINT = os.getenv("OPENAI_ENDPOINT")
-OPENAI_MODEL = os.getenv("OPENAI_MODEL")
-OPENAI_ORG_ID = os.getenv("OPENAI_ORG_ID")
-OPENAI_PROJECT_ID = os.getenv("OPENAI_PROJECT_ID")
 OPENAI_PROMPT = os.getenv("OPENAI_PROMPT")
 
 
@@ -26,56 +26,86 @@ def cli():
     """OpenAI"""
 
 
-@click.command()
-@click.argument("pregunta", type=str)
-def preguntar(pregunta):
-    """Hacer una pregunta para probar la comunicación"""
-    click.echo("Hacer una pregunta para probar la comunicación")
-
-    # Mostrar la pregunta
-    click.echo(click.style("Pregunta: ", fg="green"), nl=False)
-    click.echo(click.style(pregunta, fg="white"))
-
-    # Inicializar OpenAI
-    open_ai = OpenAI(
-        api_key=OPENAI_API_KEY,
-        base_url=OPENAI_ENDPOINT,
-        organization=OPENAI_ORG_ID,
-        project=OPENAI_PROJECT_ID,
-        timeout=60,
-    )
+def hacer_pregunta(open_ai: "OpenAI", pregunta: str):
+    """Enviar una pregunta con stream, mostrar la respuesta conforme llega y las métricas de latencia"""
 
     # Definir los mensajes que se va a enviar
     mensajes = []
-    if OPENAI_PROMPT != "":
+    if OPENAI_PROMPT:
         mensajes.append({"role": "system", "content": OPENAI_PROMPT})
     mensajes.append({"role": "user", "content": pregunta})
 
-    # Enviar los mensajes
-    try:
-        response = open_ai.chat.completions.create(
-            model=OPENAI_MODEL,
-            messages=mensajes,
-            stream=False,
+    # Enviar los mensajes y mostrar la respuesta conforme llega
+    click.echo(click.style("Respuesta: ", fg="green"), nl=False)
+    metricas = preguntar_en_flujo(open_ai, mensajes, lambda pedazo: click.echo(click.style(pedazo, fg="white"), nl=False))
+    click.echo()
+
+    # Mostrar las métricas
+    estimados = " (estimados)" if metricas["tokens_estimados"] else ""
+    click.echo(
+        click.style(
+            f"Modelo {metricas['modelo']}, primer token en {metricas['tiempo_primer_token']:.3f} s, "
+            f"total {metricas['tiempo_total']:.3f} s, {metricas['tokens']} tokens{estimados}, "
+            f"{metricas['tokens_por_segundo']:.1f} tokens/s",
+            fg="blue",
         )
-    except Exception as error:
-        click.echo(click.style(str(error), fg="red"))
+    )
+
+
+@click.command()
+@click.argument("pregunta", type=str, required=False)
+@click.option("--interactivo", is_flag=True, help="Hacer varias preguntas con el mismo cliente, termine con una línea vacía")
+def preguntar(pregunta, interactivo):
+    """Hacer una pregunta para probar la comunicación"""
+    click.echo("Hacer una pregunta para probar la comunicación")
+
+    # Validar que se tenga la pregunta si no es interactivo
+    if pregunta is None and interactivo is False:
+        click.echo(click.style("Falta la pregunta o use --interactivo", fg="red"))
         sys.exit(1)
 
-    # Mostrar la respuesta
-    click.echo(click.style("Respuesta: ", fg="green"), nl=False)
-    click.echo(click.style(response.choices[0].message.content, fg="white"))
+    # Inicializar OpenAI, el cliente mantiene la conexión abierta entre preguntas
+    open_ai = crear_cliente_openai()
+
+    # Hacer la pregunta del argumento
+    if pregunta is not None:
+        click.echo(click.style("Pregunta: ", fg="green"), nl=False)
+        click.echo(click.style(pregunta, fg="white"))
+        try:
+            hacer_pregunta(open_ai, pregunta)
+        except MyAnyError as error:
+            click.echo(click.style(str(error), fg="red"))
+            sys.exit(1)
+
+    # Si no es interactivo, terminar
+    if interactivo is False:
+        return
+
+    # Bucle de preguntas hasta una línea vacía o fin de archivo
+    while True:
+        try:
+            pregunta = click.prompt(click.style("Pregunta", fg="green"), default="", show_default=False)
+        except (EOFError, click.Abort):
+            click.echo()
+            break
+        if pregunta.strip() == "":
+            break
+        try:
+            hacer_pregunta(open_ai, pregunta)
+        except MyAnyError as error:
+            click.echo(click.style(str(error), fg="red"))
 
 
 @click.command()
 @click.argument("archivo", type=str)
-def extraer(archivo):
+@click.option("--sin-cache", is_flag=True, help="Extraer el texto sin usar la cache")
+def extraer(archivo, sin_cache):
     """Extraer el texto de un archivo PDF"""
     click.echo("Extrayendo el texto de un archivo PDF")
 
     # Extraer el texto
     try:
-        texto = extraer_texto_de_archivo_pdf(archivo)
+        texto = extraer_texto_de_archivo_pdf(archivo, not sin_cache)
     except MyAnyError as error:
         click.echo(click.style(str(error), fg="yellow"))
         sys.exit(1)
@@ -87,42 +117,23 @@ def extraer(archivo):
 
 @click.command()
 @click.argument("archivo", type=str)
-def sintetizar(archivo):
+@click.option("--sin-cache", is_flag=True, help="Extraer y sintetizar sin usar la cache")
+def sintetizar(archivo, sin_cache):
     """Sintetizar el texto de un archivo PDF"""
     click.echo("Sintetizando el texto de un archivo PDF")
 
     # Extraer el texto
     try:
-        texto = extraer_texto_de_archivo_pdf(archivo)
+        texto = extraer_texto_de_archivo_pdf(archivo, not sin_cache)
     except MyAnyError as error:
         click.echo(click.style(str(error), fg="yellow"))
         sys.exit(1)
 
-    # Inicializar OpenAI
-    open_ai = OpenAI(
-        api_key=OPENAI_API_KEY,
-        base_url=OPENAI_ENDPOINT,
-        organization=OPENAI_ORG_ID,
-        project=OPENAI_PROJECT_ID,
-        timeout=60,
-    )
-
-    # Definir los mensajes a enviar
-    mensajes = [
-        {"role": "system", "content": OPENAI_PROMPT},
-        {"role": "user", "content": texto},
-    ]
-
     # Sintetizar con OpenAI
     try:
-        chat_response = open_ai.chat.completions.create(
-            model=OPENAI_MODEL,
-            messages=mensajes,
-            stream=False,
-        )
-        sintetizado = chat_response.choices[0].message.content
-    except Exception as error:
-        click.echo(click.style("Error al sintetizar: " + str(error), fg="yellow"))
+        sintetizado, _, _ = sintetizar_texto(crear_cliente_openai(), texto, not sin_cache)
+    except MyAnyError as error:
+        click.echo(click.style(str(error), fg="yellow"))
         sys.exit(1)
 
     # Mostrar la síntesis en pantalla
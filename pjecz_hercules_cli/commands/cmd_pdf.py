@@ -0,0 +1,119 @@
+"""
+Command PDF
+"""
+
+import os
+import random
+import sys
+from pathlib import Path
+
+import click
+from dotenv import load_dotenv
+
+from pjecz_hercules_cli.dependencies import file_index
+from pjecz_hercules_cli.dependencies.exceptions import MyAnyError
+from pjecz_hercules_cli.dependencies.pdf_backends import (
+    MOTORES_PDF,
+    PDF_MOTOR,
+    elegir_motor,
+    leer_calibracion,
+    obtener_motores_disponibles,
+)
+from pjecz_hercules_cli.dependencies.pdf_tools import calibrar_motores
+
+load_dotenv()
+EDICTOS_BASE_DIR = os.getenv("EDICTOS_BASE_DIR")
+SENTENCIAS_BASE_DIR = os.getenv("SENTENCIAS_BASE_DIR")
+
+
+@click.group()
+def cli():
+    """PDF"""
+
+
+def mostrar_calibracion(calibracion: dict):
+    """Mostrar la tabla con los resultados de una calibración"""
+    from tabulate import tabulate  # Se importa aquí para que el CLI arranque rápido
+
+    tabla = []
+    for motor, resultado in calibracion["motores"].items():
+        tabla.append(
+            [
+                motor,
+                resultado["documentos"],
+                resultado["errores"],
+                resultado["caracteres"],
+                resultado["segundos"],
+                resultado["documentos_por_segundo"],
+                "Sí" if resultado["aceptable"] else "No",
+            ]
+        )
+    click.echo(tabulate(tabla, headers=["motor", "documentos", "errores", "caracteres", "segundos", "docs/s", "aceptable"]))
+    click.echo(click.style(f"Seleccionado {calibracion['seleccionado']} el {calibracion['actualizado']}", fg="green"))
+
+
+@click.command()
+def motores():
+    """Mostrar los motores de extracción de texto y el que se usa"""
+    from tabulate import tabulate  # Se importa aquí para que el CLI arranque rápido
+
+    # Mostrar los motores y si están instalados
+    disponibles = obtener_motores_disponibles()
+    tabla = [[nombre, motor.modulo, "Sí" if nombre in disponibles else "No"] for nombre, motor in MOTORES_PDF.items()]
+    click.echo(tabulate(tabla, headers=["motor", "módulo", "instalado"]))
+
+    # Mostrar la última calibración
+    calibracion = leer_calibracion()
+    if calibracion is not None:
+        mostrar_calibracion(calibracion)
+
+    # Mostrar el motor que se usa
+    try:
+        motor = elegir_motor()
+    except MyAnyError as error:
+        click.echo(click.style(str(error), fg="red"))
+        sys.exit(1)
+    click.echo(click.style(f"Con PDF_MOTOR={PDF_MOTOR} se usa {motor}", fg="green"))
+
+
+@click.command()
+@click.option("--muestra", default=20, help="Cantidad de archivos PDF a extraer con cada motor")
+@click.option("--tolerancia", default=0.9, help="Fracción mínima de caracteres respecto al motor que más extrae")
+@click.option("--semilla", type=int, default=None, help="Semilla para elegir la misma muestra al azar")
+def calibrar(muestra, tolerancia, semilla):
+    """Medir la velocidad de cada motor con una muestra de archivos y elegir el más rápido aceptable"""
+    click.echo("Calibrando los motores de extracción de texto")
+
+    # Validar los parámetros
+    if muestra < 1:
+        click.echo(click.style("La muestra debe ser mayor a cero", fg="red"))
+        sys.exit(1)
+    if tolerancia <= 0 or tolerancia > 1:
+        click.echo(click.style("La tolerancia debe ser mayor a cero y hasta uno", fg="red"))
+        sys.exit(1)
+
+    # Juntar todos los PDF de sentencias y edictos, del índice de archivos si existe para no recorrer la unidad de red
+    candidatos = []
+    for base_dir in (SENTENCIAS_BASE_DIR, EDICTOS_BASE_DIR):
+        if base_dir is None or Path(base_dir).is_dir() is False:
+            continue
+        if file_index.obtener_estadisticas(base_dir) is not None:
+            candidatos.extend(file_index.listar_archivos(base_dir))
+        else:
+            candidatos.extend(str(ruta) for ruta in Path(base_dir).rglob("*.pdf"))
+    if len(candidatos) == 0:
+        click.echo(click.style("No se encontraron archivos PDF en SENTENCIAS_BASE_DIR ni EDICTOS_BASE_DIR", fg="red"))
+        sys.exit(1)
+
+    # Elegir la muestra al azar entre todos, con la semilla se repite la misma muestra
+    archivos = random.Random(semilla).sample(candidatos, min(muestra, len(candidatos)))
+
+    # Calibrar con los motores instalados
+    disponibles = obtener_motores_disponibles()
+    click.echo(f"Extrayendo {len(archivos)} archivos con {', '.join(disponibles)}")
+    calibracion = calibrar_motores(archivos, disponibles, tolerancia)
+    mostrar_calibracion(calibracion)
+
+
+cli.add_command(motores)
+cli.add_command(calibrar)
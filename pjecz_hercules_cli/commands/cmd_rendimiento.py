@@ -0,0 +1,360 @@
+"""
+Command Rendimiento
+"""
+
+import os
+import shlex
+import signal
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import click
+from dotenv import load_dotenv
+
+load_dotenv()
+CACHE_DIR = os.getenv("CACHE_DIR", str(Path.home() / ".cache" / "pjecz_hercules_cli"))
+
+ORDENES_POR_DEFECTO = ["--help", "distritos --help", "sentencias --help", "openai --help"]
+PAQUETE_DIR = str(Path(__file__).resolve().parents[2])
+VIGILAR_ESPERA_SEGUNDOS = 600  # Máximo que se espera a que vigilar termine su primera vuelta
+
+
+@click.group()
+def cli():
+    """Rendimiento"""
+
+
+def _crear_entorno(variables: dict[str, str] = None) -> dict[str, str]:
+    """Crear las variables de entorno del proceso nuevo, con el paquete en PYTHONPATH"""
+    entorno = {**os.environ, **(variables or {})}
+    entorno["PYTHONPATH"] = os.pathsep.join(filter(None, [PAQUETE_DIR, entorno.get("PYTHONPATH")]))
+    return entorno
+
+
+def ejecutar_orden(
+    argumentos: list[str],
+    opciones_python: list[str] = None,
+    variables: dict[str, str] = None,
+) -> subprocess.CompletedProcess:
+    """Ejecutar el CLI en un proceso nuevo, como lo hacen cron y los scripts, con variables de entorno adicionales"""
+    return subprocess.run(
+        [sys.executable, *(opciones_python or []), "-m", "pjecz_hercules_cli.main", *argumentos],
+        env=_crear_entorno(variables),
+        capture_output=True,
+        text=True,
+        check=False,
+    )
+
+
+def ejecutar_vuelta_vigilar(argumentos: list[str], variables: dict[str, str], registro: Path) -> subprocess.CompletedProcess:
+    """Ejecutar vigilar en un proceso nuevo hasta que termine su primera vuelta y detenerlo con SIGTERM, como systemd"""
+    with open(registro, "w+", encoding="utf8") as puntero:
+        proceso = subprocess.Popen(
+            [sys.executable, "-m", "pjecz_hercules_cli.main", *argumentos],
+            env=_crear_entorno(variables),
+            stdout=puntero,
+            stderr=subprocess.STDOUT,
+            text=True,
+        )
+        # La vuelta termina cuando sintetizar muestra su mensaje de término, lo escribe aunque no haya sintetizado nada
+        limite = time.monotonic() + VIGILAR_ESPERA_SEGUNDOS
+        while proceso.poll() is None and time.monotonic() < limite:
+            if "Fueron sintetizad" in registro.read_text(encoding="utf8"):
+                break
+            time.sleep(0.2)
+        if proceso.poll() is None:
+            proceso.send_signal(signal.SIGTERM)
+        try:
+            proceso.wait(timeout=VIGILAR_ESPERA_SEGUNDOS)
+        except subprocess.TimeoutExpired:
+            proceso.kill()
+            proceso.wait()
+        puntero.seek(0)
+        return subprocess.CompletedProcess(proceso.args, proceso.returncode, puntero.read(), "")
+
+
+@click.command()
+@click.option("--orden", "ordenes", multiple=True, help="Orden a medir, se puede repetir (por defecto varias --help)")
+@click.option("--repeticiones", default=10, help="Veces que se ejecuta cada orden")
+@click.option("--importaciones", default=0, help="Mostrar los N módulos que más tardan en importarse en cada orden")
+def arranque(ordenes, repeticiones, importaciones):
+    """Medir el tiempo de arranque del CLI en procesos nuevos"""
+    from tabulate import tabulate  # Se importa aquí para que el CLI arranque rápido
+
+    click.echo("Midiendo el tiempo de arranque")
+
+    # Validar las repeticiones
+    if repeticiones < 1:
+        click.echo(click.style("Las repeticiones deben ser mayores a cero", fg="red"))
+        sys.exit(1)
+
+    # Medir cada orden, la primera ejecución calienta el bytecode y la cache del sistema de archivos
+    tabla = []
+    for orden in ordenes or ORDENES_POR_DEFECTO:
+        argumentos = shlex.split(orden)
+        ejecutar_orden(argumentos)
+        tiempos = []
+        for _ in range(repeticiones):
+            inicio = time.perf_counter()
+            resultado = ejecutar_orden(argumentos)
+            tiempos.append((time.perf_counter() - inicio) * 1000)
+        if resultado.returncode != 0:
+            click.echo(click.style(f"La orden {orden} terminó con {resultado.returncode}: {resultado.stderr}", fg="red"))
+            sys.exit(1)
+        tabla.append([orden, f"{min(tiempos):.0f}", f"{statistics.median(tiempos):.0f}", f"{max(tiempos):.0f}"])
+
+        # Mostrar los módulos más lentos de importar, según python -X importtime
+        if importaciones > 0:
+            modulos = []
+            for renglon in ejecutar_orden(argumentos, ["-X", "importtime"]).stderr.splitlines():
+                partes = renglon.split("|")
+                if len(partes) == 3 and partes[1].strip().isdigit():
+                    modulos.append((int(partes[1]), partes[2].strip()))
+            modulos.sort(reverse=True)
+            click.echo(click.style(f"Importaciones de {orden}", fg="green"))
+            click.echo(
+                tabulate(
+                    [[modulo, f"{micros / 1000:.1f}"] for micros, modulo in modulos[:importaciones]], headers=["módulo", "ms"]
+                )
+            )
+
+    # Mostrar la tabla de tiempos
+    click.echo(tabulate(tabla, headers=["orden", "mínimo ms", "mediana ms", "máximo ms"]))
+
+
+@click.command()
+@click.option("--base", type=str, default="", help="Archivo JSON de la base (por defecto en CACHE_DIR/rendimiento)")
+@click.option("--corpus", type=str, default="", help="Directorio del corpus sintético (por defecto en CACHE_DIR/rendimiento)")
+@click.option("--guardar-base", is_flag=True, help="Guardar los resultados como la nueva base")
+@click.option("--repeticiones", default=3, help="Veces que se repite cada medida, se toma la mejor")
+@click.option("--salida", type=str, default="", help="Archivo JSON donde guardar los resultados")
+@click.option("--umbral", default=0.10, help="Fracción que puede empeorar una medida respecto a la base")
+def medir(base, corpus, guardar_base, repeticiones, salida, umbral):
+    """Medir la extracción, la normalización, la serialización y la memoria con un corpus sintético, sin conexión"""
+    from tabulate import tabulate  # Se importa aquí para que el CLI arranque rápido
+
+    from pjecz_hercules_cli.commands.cmd_sentencias import crear_analisis_rag
+    from pjecz_hercules_cli.dependencies.benchmarks import (
+        comparar_con_base,
+        ejecutar_benchmarks,
+        generar_corpus,
+        leer_resultados,
+    )
+    from pjecz_hercules_cli.dependencies.checkpoints import escribir_json_atomico
+
+    click.echo("Midiendo el rendimiento")
+
+    # Validar los parámetros
+    if repeticiones < 1 or umbral <= 0:
+        click.echo(click.style("Las repeticiones y el umbral deben ser mayores a cero", fg="red"))
+        sys.exit(1)
+    rendimiento_dir = Path(CACHE_DIR) / "rendimiento"
+    base_ruta = Path(base) if base else rendimiento_dir / "base.json"
+    corpus_dir = Path(corpus) if corpus else rendimiento_dir / "corpus"
+
+    # Generar el corpus, si ya existe se reutiliza, y medir
+    archivos = generar_corpus(corpus_dir)
+    click.echo(f"Corpus en {corpus_dir} con {sum(len(lista) for lista in archivos.values())} archivos")
+    actual = ejecutar_benchmarks(archivos, crear_analisis_rag, repeticiones)
+
+    # Guardar los resultados
+    if salida:
+        escribir_json_atomico(Path(salida), actual)
+        click.echo(f"Resultados guardados en {salida}")
+
+    # Mostrar la tabla comparando con la base, si la hay
+    anterior = leer_resultados(base_ruta)
+    tabla = []
+    for nombre, resultado in actual["resultados"].items():
+        renglon = [nombre, resultado["valor"], "", ""]
+        if anterior is not None and nombre in anterior["resultados"]:
+            valor_base = anterior["resultados"][nombre]["valor"]
+            renglon[2] = valor_base
+            renglon[3] = f"{(resultado['valor'] - valor_base) / valor_base * 100:+.1f} %" if valor_base else ""
+        tabla.append(renglon)
+    click.echo(tabulate(tabla, headers=["medida", "actual", "base", "cambio"]))
+
+    # Guardar como base
+    if guardar_base:
+        escribir_json_atomico(base_ruta, actual)
+        click.echo(click.style(f"Base guardada en {base_ruta}", fg="green"))
+        return
+
+    # Terminar con error si alguna medida empeoró más que el umbral
+    if anterior is None:
+        click.echo(click.style(f"No hay base en {base_ruta}, guárdela con --guardar-base", fg="yellow"))
+        return
+    regresiones = comparar_con_base(actual, anterior, umbral)
+    for nombre, valor_base, valor, cambio in regresiones:
+        click.echo(click.style(f"Regresión en {nombre}: {valor_base} -> {valor} ({cambio * 100:+.1f} %)", fg="red"))
+    if regresiones:
+        sys.exit(1)
+    click.echo(click.style(f"Sin regresiones mayores a {umbral * 100:.0f} %", fg="green"))
+
+
+@click.command()
+@click.option("--recurso", type=click.Choice(["sentencias", "edictos"]), default="sentencias", help="Recurso a procesar")
+@click.option("--documentos", default=100, help="Cantidad de documentos del corpus simulado")
+@click.option("--paginas", default=5, help="Máximo de páginas de cada PDF simulado")
+@click.option("--latencia", default=20.0, help="Latencia de la API simulada en milisegundos")
+@click.option("--latencia-elemento", default=1.0, help="Latencia adicional por cada elemento del listado en milisegundos")
+@click.option("--latencia-llm", default=200.0, help="Latencia de OpenAI simulado en milisegundos")
+@click.option("--variacion", default=0.2, help="Fracción de variación al azar de las latencias")
+@click.option("--errores", default=0.0, help="Fracción de solicitudes que responden con error 500")
+@click.option("--sin-gzip", is_flag=True, help="La API simulada rechaza los envíos comprimidos con error 415")
+@click.option("--opciones-analizar", default="", help='Opciones para analizar, como "--hilos 8 --envios 4"')
+@click.option("--opciones-sintetizar", default="", help='Opciones para sintetizar, como "--simultaneas 8"')
+@click.option("--vigilar", is_flag=True, help="Ejecutar una vuelta de vigilar, que analiza y sintetiza, en lugar de cada orden")
+@click.option("--opciones-vigilar", default="", help='Opciones para vigilar, como "--simultaneas 8"')
+@click.option("--variable", "variables", multiple=True, help="Variable de entorno CLAVE=VALOR, como LIMIT=50 o TIMEOUT=5")
+@click.option("--salida", type=str, default="", help="Archivo JSON donde guardar los resultados")
+@click.option("--mostrar-salida", is_flag=True, help="Mostrar lo que escriben analizar y sintetizar")
+def carga(
+    recurso,
+    documentos,
+    paginas,
+    latencia,
+    latencia_elemento,
+    latencia_llm,
+    variacion,
+    errores,
+    sin_gzip,
+    opciones_analizar,
+    opciones_sintetizar,
+    vigilar,
+    opciones_vigilar,
+    variables,
+    salida,
+    mostrar_salida,
+):
+    """Ejecutar analizar y sintetizar contra una API y un OpenAI simulados, medir documentos por segundo y latencias"""
+    from tabulate import tabulate  # Se importa aquí para que el CLI arranque rápido
+
+    from pjecz_hercules_cli.dependencies.checkpoints import escribir_json_atomico
+    from pjecz_hercules_cli.dependencies.simulador import GCS_BASE_URL, ConfiguracionSimulador, iniciar_simulador
+
+    click.echo(f"Prueba de carga de {recurso} con {documentos} documentos simulados")
+
+    # Validar los parámetros
+    if documentos < 1 or paginas < 1 or not 0 <= errores < 1 or not 0 <= variacion < 1:
+        click.echo(
+            click.style("Los documentos y las páginas deben ser mayores a cero, errores y variación entre 0 y 1", fg="red")
+        )
+        sys.exit(1)
+    adicionales = {}
+    for variable in variables:
+        clave, separador, valor = variable.partition("=")
+        if separador == "" or clave == "":
+            click.echo(click.style(f"La variable {variable} debe ser CLAVE=VALOR", fg="red"))
+            sys.exit(1)
+        adicionales[clave] = valor
+
+    configuracion = ConfiguracionSimulador(
+        documentos=documentos,
+        paginas=paginas,
+        latencia_ms=latencia,
+        latencia_elemento_ms=latencia_elemento,
+        latencia_llm_ms=latencia_llm,
+        variacion=variacion,
+        tasa_errores=errores,
+        acepta_gzip=not sin_gzip,
+    )
+    resultados = {"recurso": recurso, "configuracion": configuracion.__dict__, "fases": {}}
+    codigo_salida = 0
+    with tempfile.TemporaryDirectory(prefix="hercules_carga_") as temporal:
+        # Iniciar el simulador, la cache va en el directorio temporal para que todo se procese de nuevo
+        servidor, estado = iniciar_simulador(configuracion, Path(temporal) / "archivos")
+        url = f"http://127.0.0.1:{servidor.server_address[1]}"
+        entorno = {
+            "API_BASE_URL": url,
+            "USERNAME": "simulador",
+            "PASSWORD": "simulador",
+            "OPENAI_API_KEY": "simulador",
+            "OPENAI_ENDPOINT": f"{url}/v1",
+            "OPENAI_MODEL": "simulador",
+            f"{recurso.upper()}_BASE_DIR": str(Path(temporal) / "archivos"),
+            f"{recurso.upper()}_GCS_BASE_URL": GCS_BASE_URL,
+            "CACHE_DIR": str(Path(temporal) / "cache"),
+            **adicionales,
+        }
+        click.echo(f"Simulador en {url}")
+
+        # Con vigilar una sola fase analiza y sintetiza, se revisa que la vuelta haga ambas cosas
+        if vigilar:
+            fases = [("vigilar", opciones_vigilar, ["analisis", "sintesis"])]
+        else:
+            fases = [("analizar", opciones_analizar, ["analisis"]), ("sintetizar", opciones_sintetizar, ["sintesis"])]
+
+        try:
+            for fase, opciones, envios in fases:
+                # Ejecutar la fase en un proceso nuevo, como en producción
+                estado.reiniciar_medidas()
+                inicio = time.perf_counter()
+                if fase == "vigilar":
+                    resultado = ejecutar_vuelta_vigilar(
+                        [recurso, fase, "--desde", "2000-01-01", *shlex.split(opciones)],
+                        entorno,
+                        Path(temporal) / "vigilar.log",
+                    )
+                else:
+                    resultado = ejecutar_orden(
+                        [recurso, fase, "2000-01-01", "2100-01-01", *shlex.split(opciones)], variables=entorno
+                    )
+                segundos = time.perf_counter() - inicio
+                envio = envios[-1]  # Los documentos por segundo son de lo último que hace la fase
+                if mostrar_salida:
+                    click.echo(resultado.stdout + resultado.stderr)
+                if resultado.returncode != 0:
+                    ultimos = (resultado.stdout + resultado.stderr).strip().splitlines()[-5:]
+                    click.echo(click.style(f"{fase} terminó con {resultado.returncode}: {' '.join(ultimos)}", fg="red"))
+                    codigo_salida = 1
+
+                # Mostrar los documentos por segundo y las latencias vistas por el simulador
+                latencias = estado.resumir_latencias()
+                resultados["fases"][fase] = {
+                    "codigo": resultado.returncode,
+                    "segundos": round(segundos, 3),
+                    "documentos": estado.envios[envio],
+                    "documentos_por_segundo": round(estado.envios[envio] / segundos, 3),
+                    "errores_simulados": estado.errores,
+                    "latencias_ms": latencias,
+                }
+                click.echo(
+                    click.style(
+                        f"{fase}: {estado.envios[envio]} documentos en {segundos:.1f} s = "
+                        f"{estado.envios[envio] / segundos:.2f} docs/s, {estado.errores} errores simulados",
+                        fg="green",
+                    )
+                )
+
+                # Una fase que no procesó ningún documento no es una medida válida, oculta un error como si fuera lento
+                for nombre in envios:
+                    if estado.envios[nombre] == 0:
+                        click.echo(click.style(f"{fase} envió 0 de {documentos} {nombre}, la medida no es válida", fg="red"))
+                        codigo_salida = 1
+                    elif estado.envios[nombre] < documentos:
+                        click.echo(click.style(f"{fase} envió {estado.envios[nombre]} de {documentos} {nombre}", fg="yellow"))
+                tabla = [
+                    [endpoint, medida["solicitudes"], f"{medida['p50']:.1f}", f"{medida['p95']:.1f}", f"{medida['p99']:.1f}"]
+                    for endpoint, medida in latencias.items()
+                ]
+                click.echo(tabulate(tabla, headers=["endpoint", "solicitudes", "p50 ms", "p95 ms", "p99 ms"]))
+        finally:
+            servidor.shutdown()
+            servidor.server_close()
+
+    # Guardar los resultados
+    if salida:
+        escribir_json_atomico(Path(salida), resultados)
+        click.echo(f"Resultados guardados en {salida}")
+    if codigo_salida != 0:
+        sys.exit(codigo_salida)
+
+
+cli.add_command(arranque)
+cli.add_command(carga)
+cli.add_command(medir)
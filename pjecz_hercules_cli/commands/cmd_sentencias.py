@@ -3,37 +3,52 @@ Command Sentencias
 """
 
 import concurrent.futures
-import json
+import contextlib
+import functools
+from datetime import date
 from pathlib import Path
 import os
+import queue
 import sys
+import time
+from typing import TYPE_CHECKING
 from urllib.parse import unquote
 
 import click
 from dotenv import load_dotenv
-from openai import OpenAI
-import requests
-from tqdm import tqdm
 
+from pjecz_hercules_cli.dependencies import file_index, metrics, synthesis_cache
+from pjecz_hercules_cli.dependencies.api_client import resumir_limites, consultar, crear_sesion, enviar, paginar
 from pjecz_hercules_cli.dependencies.authentications import get_auth_token
+from pjecz_hercules_cli.dependencies.checkpoints import PuntoControl
+from pjecz_hercules_cli.dependencies.daemons import VIGILAR_INTERVALO, Vigilante
 from pjecz_hercules_cli.dependencies.exceptions import MyAnyError
-from pjecz_hercules_cli.dependencies.pdf_tools import extraer_texto_de_archivo_pdf
+from pjecz_hercules_cli.dependencies.executors import MOTORES, crear_ejecutor, dividir_en_lotes, mapear_en_orden
+from pjecz_hercules_cli.dependencies.openai_tools import configurar_simultaneas, crear_cliente_openai, sintetizar_texto
+from pjecz_hercules_cli.dependencies.pdf_tools import (
+    PDF_LECTORES,
+    PDF_LEER_ADELANTE_MB,
+    analizar_lote_archivos_pdf,
+    leer_adelantado_lote_pdf,
+)
+from pjecz_hercules_cli.dependencies.pipelines import FIN, Etapa, PresupuestoBytes, alimentar
+from pjecz_hercules_cli.dependencies.watermarks import MarcaAgua
+
+# Sólo para las anotaciones, requests y openai tardan en importarse
+if TYPE_CHECKING:
+    import requests
+    from openai import OpenAI
 
 load_dotenv()
-OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
-OPENAI_ENDPOINT = os.getenv("OPENAI_ENDPOINT")
-OPENAI_MODEL = os.getenv("OPENAI_MODEL")
-OPENAI_ORG_ID = os.getenv("OPENAI_ORG_ID")
-OPENAI_PROJECT_ID = os.getenv("OPENAI_PROJECT_ID")
-OPENAI_PROMPT = os.getenv("OPENAI_PROMPT")
-API_BASE_URL = os.getenv("API_BASE_URL")
-LIMIT = int(os.getenv("LIMIT"))
-TIMEOUT = int(os.getenv("TIMEOUT"))
 SENTENCIAS_BASE_DIR = os.getenv("SENTENCIAS_BASE_DIR")
 SENTENCIAS_GCS_BASE_URL = os.getenv("SENTENCIAS_GCS_BASE_URL")
 MOSTRAR_CARACTERES = int(os.getenv("MOSTRAR_CARACTERES"))
 
+SIMULTANEAS_POR_DEFECTO = 4
+
 HILOS_POR_DEFECTO = os.cpu_count() or 4
+LOTE_POR_DEFECTO = 4
+ENVIOS_POR_DEFECTO = 4
 
 
 @click.group()
@@ -41,22 +56,9 @@ def cli():
     """Sentencias"""
 
 
-def analizar_archivo_pdf_hilo(id: int, archivo_ruta: Path, autor: str) -> (int, str, int):
-    """Analizar un archivo PDF en un hilo, entrega el ID, el texto extraído, el tamaño del archivo y el autor"""
-    if bool(archivo_ruta.exists() and archivo_ruta.is_file()) is False:
-        raise MyAnyError(f"El archivo {archivo_ruta} no existe o no es un archivo")
-    try:
-        texto = extraer_texto_de_archivo_pdf(str(archivo_ruta))
-    except MyAnyError as error:
-        raise MyAnyError(f"Error al extraer texto del archivo {archivo_ruta.name}: {str(error)}") from error
-    if texto.strip() == "":
-        raise MyAnyError(f"El archivo {archivo_ruta.name} no tiene texto")
-    return id, texto, os.path.getsize(archivo_ruta), autor
-
-
-def enviar_analisis_rag(id: int, texto: str, archivo_tamanio: int, autor: str, oauth2_token: str) -> bool:
-    """Enviar el análisis RAG a la API"""
-    data = {
+def crear_analisis_rag(id: int, texto: str, archivo_tamanio: int, autor: str) -> dict:
+    """Crear los datos del análisis RAG que se envían a la API"""
+    return {
         "id": id,
         "analisis": {
             "archivo_tamanio": archivo_tamanio,
@@ -67,32 +69,62 @@ def enviar_analisis_rag(id: int, texto: str, archivo_tamanio: int, autor: str, o
         "sintesis": None,
         "categorias": None,
     }
-    try:
-        respuesta = requests.put(
-            url=f"{API_BASE_URL}/api/v5/sentencias/rag",
-            headers={"Authorization": f"Bearer {oauth2_token}"},
-            data=json.dumps(data),
-            timeout=TIMEOUT,
-        )
-    except requests.exceptions.RequestException as error:
-        raise MyAnyError(error) from error
-    if respuesta.status_code != 200:
-        raise MyAnyError(f"Status Code {respuesta.status_code}: {respuesta.content}")
-    contenido = respuesta.json()
-    if "success" not in contenido or "message" not in contenido:
-        raise MyAnyError(f"Respuesta inesperada: {contenido}")
+
+
+def enviar_analisis_rag(sesion: "requests.Session", id: int, texto: str, archivo_tamanio: int, autor: str) -> bool:
+    """Enviar el análisis RAG a la API"""
+    contenido = enviar(sesion, "/api/v5/sentencias/rag", crear_analisis_rag(id, texto, archivo_tamanio, autor))
     return bool(contenido["success"])
 
 
 @click.command()
-@click.argument("creado_desde", type=str)
-@click.argument("creado_hasta", type=str)
-@click.option("--hilos", type=int, default=HILOS_POR_DEFECTO, help="Número de hilos a usar")
+@click.argument("creado_desde", type=str, required=False)
+@click.argument("creado_hasta", type=str, required=False)
+@click.option("--desde-ultimo", is_flag=True, help="Procesar lo creado desde la última ejecución que terminó bien")
+@click.option("--envios", type=int, default=ENVIOS_POR_DEFECTO, help="Número de hilos para enviar a la API")
+@click.option("--hilos", type=int, default=HILOS_POR_DEFECTO, help="Número de hilos o procesos a usar")
+@click.option("--lectores", type=int, default=PDF_LECTORES, help="Hilos que leen los PDF por adelantado (0 = no leer)")
+@click.option("--lote", type=int, default=LOTE_POR_DEFECTO, help="Número de archivos por tarea")
+@click.option("--motor", type=click.Choice(MOTORES), default="hilos", help="Motor para extraer los textos")
 @click.option("--probar", is_flag=True, help="Modo de prueba, sin cambios")
+@click.option("--reanudar", is_flag=True, help="Reanudar donde se quedó la ejecución anterior")
+@click.option("--reciclar", type=int, default=0, help="Reciclar cada proceso después de N archivos (0 = nunca)")
+@click.option("--sin-cache", is_flag=True, help="Extraer los textos sin usar la cache")
+@click.option("--sin-indice", is_flag=True, help="Revisar cada archivo en el disco aunque exista el índice")
 @click.option("--sobreescribir", is_flag=True, help="Sobreescribe lo ya analizado")
-def analizar(creado_desde, creado_hasta, hilos, probar, sobreescribir):
+def analizar(
+    creado_desde,
+    creado_hasta,
+    desde_ultimo,
+    envios,
+    hilos,
+    lectores,
+    lote,
+    motor,
+    probar,
+    reanudar,
+    reciclar,
+    sin_cache,
+    sin_indice,
+    sobreescribir,
+    sesion: "requests.Session" = None,
+    executor: concurrent.futures.Executor = None,
+):
     """Analizar sentencias"""
+    from tqdm import tqdm  # Se importa aquí para que el CLI arranque rápido
+
     click.echo("Analizando sentencias")
+    inicio = time.perf_counter()
+
+    # Validar los hilos, los envíos, el lote y los lectores
+    if hilos < 1 or envios < 1 or lote < 1 or lectores < 0:
+        click.echo(click.style("Los hilos, los envíos y el lote deben ser mayores a cero, los lectores no negativos", fg="red"))
+        sys.exit(1)
+
+    # Definir cuántas tareas (lotes) atiende cada proceso antes de reciclarse
+    tareas_por_proceso = 0
+    if motor == "procesos" and reciclar > 0:
+        tareas_por_proceso = max(1, reciclar // lote)
 
     # Validar que exista el directorio SENTENCIAS_BASE_DIR
     sentencias_dir = Path(SENTENCIAS_BASE_DIR)
@@ -100,6 +132,29 @@ def analizar(creado_desde, creado_hasta, hilos, probar, sobreescribir):
         click.echo(click.style(f"No existe el directorio {SENTENCIAS_BASE_DIR}", fg="red"))
         sys.exit(1)
 
+    # Usar el índice de archivos si existe, para no consultar la unidad de red por cada archivo
+    usar_indice = False
+    if sin_indice is False:
+        estadisticas = file_index.obtener_estadisticas(SENTENCIAS_BASE_DIR)
+        if estadisticas is not None:
+            usar_indice = True
+            actualizado = time.strftime("%Y-%m-%d %H:%M", time.localtime(estadisticas["actualizado"]))
+            click.echo(click.style(f"Usando el índice de {estadisticas['archivos']} archivos del {actualizado}", fg="white"))
+
+    # Definir el rango de fechas, con --desde-ultimo empieza en la marca de agua de la última ejecución que terminó bien
+    marca_agua = None
+    if desde_ultimo:
+        marca_agua = MarcaAgua("sentencias_analizar")
+        try:
+            creado_desde, creado_hasta = marca_agua.definir_rango(creado_desde, creado_hasta)
+        except MyAnyError as error:
+            click.echo(click.style(str(error), fg="red"))
+            sys.exit(1)
+        click.echo(click.style(f"Desde la última ejecución, del {creado_desde} al {creado_hasta}", fg="white"))
+    elif not creado_desde or not creado_hasta:
+        click.echo(click.style("Faltan creado_desde y creado_hasta, o use --desde-ultimo", fg="red"))
+        sys.exit(1)
+
     # Obtener el token
     try:
         oauth2_token = get_auth_token()
@@ -107,80 +162,311 @@ def analizar(creado_desde, creado_hasta, hilos, probar, sobreescribir):
         click.echo(click.style(str(error), fg="red"))
         sys.exit(1)
 
-    # Inicializar el contador y el offset
-    contador = 0
-    offset = 0
-
-    # Bucle por las consultas
-    while True:
-
-        # Consultar sentencias
+    # Preparar el punto de control, si se reanuda se carga el que dejó la ejecución anterior
+    punto_control = PuntoControl("sentencias_analizar", creado_desde, creado_hasta, persistente=not probar)
+    if reanudar:
         try:
-            respuesta = requests.get(
-                url=f"{API_BASE_URL}/api/v5/sentencias",
-                headers={"Authorization": f"Bearer {oauth2_token}"},
-                params={"creado_desde": creado_desde, "creado_hasta": creado_hasta, "limit": LIMIT, "offset": offset},
-                timeout=TIMEOUT,
-            )
-        except requests.exceptions.RequestException as error:
+            if punto_control.cargar():
+                click.echo(click.style(f"Reanudando desde el offset {punto_control.offset}", fg="white"))
+            else:
+                click.echo(click.style("No hay punto de control, se empieza desde el principio", fg="yellow"))
+        except MyAnyError as error:
             click.echo(click.style(str(error), fg="red"))
             sys.exit(1)
-        if respuesta.status_code != 200:
-            click.echo(click.style(str(respuesta), fg="red"))
-            sys.exit(1)
-        paginado = respuesta.json()
 
-        # Si hubo un error
-        if paginado["success"] is False:
-            click.echo(click.style(paginado["message"], fg="red"))
-            sys.exit(1)
+    # Crear la sesión con una conexión por cada hilo de envío más la de las consultas, vigilar da la suya para reutilizarla
+    if sesion is None:
+        sesion = crear_sesion(oauth2_token, envios + 1)
 
-        # Inicializar la lista de futuros
-        futures = []
+    # Definir las colas entre las etapas, las acotadas frenan a la etapa anterior si la siguiente va lenta
+    cola_consultas = queue.Queue()
+    cola_lotes = queue.Queue(maxsize=hilos * 2)
+    cola_leidos = queue.Queue(maxsize=hilos * 2)
+    cola_envios = queue.Queue(maxsize=hilos * lote * 2)
+    cola_eventos = queue.Queue()
 
-        # Usar ThreadPoolExecutor para manejar múltiples hilos
-        with concurrent.futures.ThreadPoolExecutor(max_workers=hilos) as executor:
-            # Bucle por los registros de la consulta
-            for item in paginado["data"]:
-                # Si ya fue analizada, se omite
-                if sobreescribir is False and item["rag_fue_analizado_tiempo"] is not None:
-                    continue
+    def etapa_consultar(parametros: dict):
+        """Etapa 1: Consultar las sentencias página por página y entregar lotes de tareas"""
+        try:
+            for paginado in paginar(sesion, "/api/v5/sentencias", parametros, offset=punto_control.offset):
+                cola_eventos.put(("total", paginado["total"]))
+                ids = [item["id"] for item in paginado["data"]]
+                pendientes = punto_control.iniciar_pagina(paginado["offset"], paginado["limit"], ids)
+
+                # Juntar las tareas de los registros de la consulta
+                tareas = []
+                for item in paginado["data"]:
+                    # Si ya se procesó en una ejecución anterior que se interrumpió, se omite
+                    if item["id"] not in pendientes:
+                        continue
+
+                    # Si ya fue analizada, se omite
+                    if sobreescribir is False and item["rag_fue_analizado_tiempo"] is not None:
+                        punto_control.marcar(item["id"])
+                        continue
+
+                    # Definir la ruta al archivo pdf reemplazando el inicio del url con el directorio
+                    archivo_ruta = Path(SENTENCIAS_BASE_DIR + unquote(item["url"][len(SENTENCIAS_GCS_BASE_URL) :]))
+
+                    # Si está en el índice ya se tiene su ruta canónica y su tamaño para reservar la lectura adelantada,
+                    # al extraer se revisa en el disco porque pudo reemplazarse después de indexarlo
+                    tamanio, canonica = None, False
+                    if usar_indice:
+                        encontrado = file_index.buscar_archivo(SENTENCIAS_BASE_DIR, str(archivo_ruta))
+                        if encontrado is not None:
+                            archivo_ruta, tamanio, canonica = Path(encontrado[0]), encontrado[1], True
+                    tareas.append((item["id"], str(archivo_ruta), item["autoridad_clave"], tamanio, canonica, None))
+                cola_eventos.put(("tareas", len(tareas)))
+                yield from dividir_en_lotes(tareas, lote)
+        except MyAnyError as error:
+            cola_eventos.put(("fatal", str(error)))
+
+    # Los lectores leen los archivos de los siguientes lotes mientras el motor extrae, sin pasar de PDF_LEER_ADELANTE_MB
+    leer_adelantado = lectores > 0 and PDF_LEER_ADELANTE_MB > 0
+    presupuesto = PresupuestoBytes(PDF_LEER_ADELANTE_MB * 1024 * 1024)
+
+    def etapa_leer(tareas_lote: list):
+        """Etapa 2: Leer por adelantado los archivos del lote, para que la extracción no espere a la unidad de red"""
+        if leer_adelantado:
+            yield leer_adelantado_lote_pdf(tareas_lote, presupuesto)
+        else:
+            yield tareas_lote, 0
+
+    def etapa_extraer(lote_leido: tuple):
+        """Etapa 3: Extraer los textos de un lote de archivos PDF con el motor y liberar su memoria"""
+        tareas_lote, reservado = lote_leido
+        try:
+            # Las medidas se capturan en el hilo o proceso que extrae y se juntan aquí
+            resultados, medidas = executor.submit(
+                metrics.capturar, analizar_lote_archivos_pdf, tareas_lote, not sin_cache
+            ).result()
+        finally:
+            del tareas_lote, lote_leido
+            presupuesto.liberar(reservado)
+        metrics.juntar(medidas)
+        yield from resultados
+
+    def etapa_enviar(resultado: tuple):
+        """Etapa 4: Enviar el análisis a la API"""
+        id, texto, archivo_tamanio, autor, mensaje_error = resultado
+        if mensaje_error is not None:
+            punto_control.marcar(id)  # Volver a intentarlo no lo arreglaría
+            yield "error", mensaje_error
+            return
+        if probar is False:
+            try:
+                enviar_analisis_rag(sesion, id, texto, archivo_tamanio, autor)
+            except MyAnyError as error:
+                yield "error", str(error)  # Sin marcar, para que se vuelva a intentar al reanudar
+                return
+        punto_control.marcar(id)
+        yield "analizado", id
+
+    # Inicializar los contadores
+    contador = 0
+    total = 0
+    mensaje_fatal = None
 
-                # Definir la ruta al archivo pdf reemplazando el inicio del url con el directorio
-                archivo_ruta = Path(SENTENCIAS_BASE_DIR + unquote(item["url"][len(SENTENCIAS_GCS_BASE_URL) :]))
-
-                # Entregar las tareas al multi hilo para extraer los textos de los archivos PDF en paralelo
-                future = executor.submit(analizar_archivo_pdf_hilo, item["id"], archivo_ruta, item["autoridad_clave"])
-                futures.append(future)
-
-            # Bucle por los resultados de los hilos
-            for future in tqdm(concurrent.futures.as_completed(futures), total=len(futures), desc="Analizando archivos PDF"):
-                try:
-                    id, texto, archivo_tamanio, autor = future.result()
-                    if probar is False:
-                        enviar_analisis_rag(id, texto, archivo_tamanio, autor, oauth2_token)
-                except MyAnyError as error:
-                    click.echo(click.style(str(error), fg="yellow"))
-                    continue
-                contador += 1
+    # Guardar el punto de control aunque se interrumpa
+    try:
 
-        # Incrementar el offset y terminar el bucle si lo rebasamos
-        offset += LIMIT
-        if offset >= paginado["total"]:
-            break
+        # Crear el motor una sola vez para todas las consultas, vigilar da el suyo para no volver a arrancar los procesos
+        if executor is None:
+            contexto_ejecutor = crear_ejecutor(motor, hilos, tareas_por_proceso)
+        else:
+            contexto_ejecutor = contextlib.nullcontext(executor)
+        with contexto_ejecutor as executor:
+
+            # Iniciar las etapas, cada una con su propia concurrencia
+            etapas = [
+                Etapa("consultar", etapa_consultar, cola_consultas, cola_lotes, 1).iniciar(),
+                Etapa("leer", etapa_leer, cola_lotes, cola_leidos, max(1, lectores)).iniciar(),
+                Etapa("extraer", etapa_extraer, cola_leidos, cola_envios, hilos).iniciar(),
+                Etapa("enviar", etapa_enviar, cola_envios, cola_eventos, envios).iniciar(),
+            ]
+            alimentar(cola_consultas, [{"creado_desde": creado_desde, "creado_hasta": creado_hasta}])
+
+            # Mostrar el avance hasta que la última etapa avise que terminó
+            with tqdm(total=0, desc="Analizando archivos PDF") as barra:
+                while True:
+                    evento = cola_eventos.get()
+                    if evento is FIN:
+                        break
+                    tipo, valor = evento
+                    if tipo == "total":
+                        total = valor
+                    elif tipo == "tareas":
+                        barra.total += valor
+                        barra.refresh()
+                    elif tipo == "fatal":
+                        mensaje_fatal = valor
+                    elif tipo == "error":
+                        barra.update(1)
+                        barra.write(click.style(valor, fg="yellow"))
+                    elif tipo == "analizado":
+                        barra.update(1)
+                        contador += 1
+
+            # Esperar a que terminen los hilos
+            for etapa in etapas:
+                etapa.esperar()
+    finally:
+        punto_control.guardar()
+
+    # Mostrar los errores inesperados de las etapas
+    for etapa in etapas:
+        for error in etapa.errores:
+            click.echo(click.style(f"Error en {etapa.nombre}: {str(error)}", fg="red"))
+
+    # Si falló la consulta, terminar con error
+    if mensaje_fatal is not None:
+        click.echo(click.style(mensaje_fatal, fg="red"))
+        click.echo(click.style(f"Fueron analizadas {contador} sentencias antes del error, use --reanudar", fg="yellow"))
+        sys.exit(1)
+
+    # Guardar y mostrar las medidas de cada etapa
+    resumen, rutas = metrics.publicar("sentencias_analizar", time.perf_counter() - inicio, contador)
+    for renglon in metrics.resumir_renglones(resumen):
+        click.echo(click.style(renglon, fg="white"))
+    click.echo(click.style(f"Medidas guardadas en {', '.join(str(ruta) for ruta in rutas)}", fg="white"))
+
+    # Mostrar los tamaños de página elegidos
+    for renglon in resumir_limites():
+        click.echo(click.style(renglon, fg="white"))
+
+    # Avanzar la marca de agua, sólo si no quedó nada pendiente de volver a intentar
+    if marca_agua is not None and probar is False:
+        if punto_control.esta_completo():
+            click.echo(click.style(f"Marca de agua en {marca_agua.avanzar()}", fg="white"))
+        else:
+            click.echo(click.style("Quedaron pendientes, la marca de agua no avanzó", fg="yellow"))
+
+    # Borrar el punto de control si ya no hace falta, si quedaron pendientes se conserva para reanudar
+    if punto_control.esta_completo():
+        punto_control.borrar()
+    else:
+        punto_control.guardar()
+        click.echo(click.style("Quedaron pendientes, para volver a intentarlos use --reanudar", fg="yellow"))
 
     # Mostrar el mensaje de término
-    click.echo(click.style(f"Fueron analizadas {contador} de {paginado['total']} sentencias", fg="green"))
+    click.echo(click.style(f"Fueron analizadas {contador} de {total} sentencias", fg="green"))
+
+
+def sintetizar_sentencia(
+    sesion: "requests.Session",
+    open_ai: "OpenAI",
+    item: dict,
+    probar: bool,
+    sobreescribir: bool,
+    usar_cache: bool = True,
+) -> tuple[bool | None, list]:
+    """Sintetizar una sentencia, entrega si fue sintetizada (None si falló la API) y los mensajes (texto, color) a mostrar"""
+    mensajes = []
+
+    # Si NO ha sido analizada, se omite
+    if sobreescribir is False and item["rag_fue_analizado_tiempo"] is None:
+        mensajes.append(("Se omite porque aun NO se ha analizado", "yellow"))
+        return False, mensajes
+
+    # Si ya fue sintetizada, se omite
+    if sobreescribir is False and item["rag_fue_sintetizado_tiempo"] is not None:
+        mensajes.append(("Se omite porque ya fue sintetizado", "yellow"))
+        return False, mensajes
+
+    # Consultar por su ID para obtener su texto, si falla la API queda pendiente para volver a intentarlo
+    try:
+        detalle = consultar(sesion, f"/api/v5/sentencias/{item['id']}")
+    except MyAnyError as error:
+        mensajes.append((str(error), "yellow"))
+        return None, mensajes
+
+    # Validar que tiene el texto
+    datos = detalle["data"]
+    if datos is None:
+        mensajes.append(("No tiene 'data'", "yellow"))
+        return False, mensajes
+    if "rag_analisis" not in datos or datos["rag_analisis"] is None:
+        mensajes.append(("No tiene 'rag_analisis' o es nulo", "yellow"))
+        return False, mensajes
+    if "texto" not in datos["rag_analisis"] or datos["rag_analisis"]["texto"] is None:
+        mensajes.append(("No tiene 'texto' el análisis o es nulo", "yellow"))
+        return False, mensajes
+    texto = datos["rag_analisis"]["texto"]
+    if texto.strip() == "":
+        mensajes.append(("No hay texto para sintetizar, está vacío", "yellow"))
+        return False, mensajes
+
+    # Agregar a los mensajes la longitud de caracteres
+    mensajes.append((f"{texto[:MOSTRAR_CARACTERES]}… = {len(texto)} ", "blue"))
+
+    # Enviar a OpenAI el texto
+    try:
+        sintesis, tokens_total, modelo = sintetizar_texto(open_ai, texto, usar_cache)
+    except MyAnyError as error:
+        mensajes.append((str(error), "yellow"))
+        return False, mensajes
+
+    # Agregar a los mensajes un fragmento de la sintesis
+    mensajes.append((f"{sintesis[:MOSTRAR_CARACTERES]}… = {tokens_total} ", "magenta"))
+
+    # Definir los datos RAG a enviar
+    data = {
+        "id": item["id"],
+        "analisis": None,
+        "sintesis": {
+            "modelo": modelo,
+            "sintesis": sintesis,
+            "tokens_total": tokens_total,
+        },
+        "categorias": None,
+    }
+
+    # Si está en modo de pruebas, no se envía
+    if probar:
+        mensajes.append(("PROBADO", "white"))
+        return True, mensajes
+
+    # Enviar los datos RAG, si falla la API queda pendiente para volver a intentarlo
+    try:
+        resultado = enviar(sesion, "/api/v5/sentencias/rag", data)
+    except MyAnyError as error:
+        mensajes.append((str(error), "yellow"))
+        return None, mensajes
+    if resultado["success"] is False:
+        mensajes.append((resultado["message"], "yellow"))
+        return False, mensajes
+    mensajes.append(("ENVIADO", "white"))
+    return True, mensajes
 
 
 @click.command()
-@click.argument("creado_desde", type=str)
-@click.argument("creado_hasta", type=str)
+@click.argument("creado_desde", type=str, required=False)
+@click.argument("creado_hasta", type=str, required=False)
+@click.option("--desde-ultimo", is_flag=True, help="Procesar lo creado desde la última ejecución que terminó bien")
 @click.option("--probar", is_flag=True, help="Modo de prueba, sin cambios")
+@click.option("--reanudar", is_flag=True, help="Reanudar donde se quedó la ejecución anterior")
+@click.option("--simultaneas", type=int, default=SIMULTANEAS_POR_DEFECTO, help="Máximo de solicitudes simultáneas a OpenAI")
+@click.option("--sin-cache", is_flag=True, help="Sintetizar sin usar la cache")
 @click.option("--sobreescribir", is_flag=True, help="Sobreescribe lo ya sintetizado")
-def sintetizar(creado_desde, creado_hasta, probar, sobreescribir):
+def sintetizar(
+    creado_desde,
+    creado_hasta,
+    desde_ultimo,
+    probar,
+    reanudar,
+    simultaneas,
+    sin_cache,
+    sobreescribir,
+    sesion: "requests.Session" = None,
+):
     """Sintetizar sentencias"""
     click.echo("Sintetizando sentencias")
+    inicio = time.perf_counter()
+
+    # Validar las simultáneas
+    if simultaneas < 1:
+        click.echo(click.style("Las simultáneas deben ser mayores a cero", fg="red"))
+        sys.exit(1)
 
     # Validar que exista el directorio SENTENCIAS_BASE_DIR
     sentencias_dir = Path(SENTENCIAS_BASE_DIR)
@@ -188,14 +474,23 @@ def sintetizar(creado_desde, creado_hasta, probar, sobreescribir):
         click.echo(click.style(f"No existe el directorio {SENTENCIAS_BASE_DIR}", fg="red"))
         sys.exit(1)
 
-    # Inicializar OpenAI
-    open_ai = OpenAI(
-        api_key=OPENAI_API_KEY,
-        base_url=OPENAI_ENDPOINT,
-        organization=OPENAI_ORG_ID,
-        project=OPENAI_PROJECT_ID,
-        timeout=60,
-    )
+    # Inicializar OpenAI, con el máximo de solicitudes en vuelo, incluyendo las de los fragmentos de textos largos
+    open_ai = crear_cliente_openai()
+    configurar_simultaneas(simultaneas)
+
+    # Definir el rango de fechas, con --desde-ultimo empieza en la marca de agua de la última ejecución que terminó bien
+    marca_agua = None
+    if desde_ultimo:
+        marca_agua = MarcaAgua("sentencias_sintetizar")
+        try:
+            creado_desde, creado_hasta = marca_agua.definir_rango(creado_desde, creado_hasta)
+        except MyAnyError as error:
+            click.echo(click.style(str(error), fg="red"))
+            sys.exit(1)
+        click.echo(click.style(f"Desde la última ejecución, del {creado_desde} al {creado_hasta}", fg="white"))
+    elif not creado_desde or not creado_hasta:
+        click.echo(click.style("Faltan creado_desde y creado_hasta, o use --desde-ultimo", fg="red"))
+        sys.exit(1)
 
     # Obtener el token
     try:
@@ -204,160 +499,176 @@ def sintetizar(creado_desde, creado_hasta, probar, sobreescribir):
         click.echo(click.style(str(error), fg="red"))
         sys.exit(1)
 
-    # Inicializar el contador y el offset
-    contador = 0
-    offset = 0
-
-    # Bucle por las consultas
-    while True:
-
-        # Consultar sentencias
+    # Preparar el punto de control, si se reanuda se carga el que dejó la ejecución anterior
+    punto_control = PuntoControl("sentencias_sintetizar", creado_desde, creado_hasta, persistente=not probar)
+    if reanudar:
         try:
-            respuesta = requests.get(
-                url=f"{API_BASE_URL}/api/v5/sentencias",
-                headers={"Authorization": f"Bearer {oauth2_token}"},
-                params={"creado_desde": creado_desde, "creado_hasta": creado_hasta, "limit": LIMIT, "offset": offset},
-                timeout=TIMEOUT,
-            )
-        except requests.exceptions.RequestException as error:
+            if punto_control.cargar():
+                click.echo(click.style(f"Reanudando desde el offset {punto_control.offset}", fg="white"))
+            else:
+                click.echo(click.style("No hay punto de control, se empieza desde el principio", fg="yellow"))
+        except MyAnyError as error:
             click.echo(click.style(str(error), fg="red"))
             sys.exit(1)
-        if respuesta.status_code != 200:
-            click.echo(click.style(str(respuesta), fg="red"))
-            sys.exit(1)
-        paginado = respuesta.json()
 
-        # Si hubo un error
-        if paginado["success"] is False:
-            click.echo(click.style(paginado["message"], fg="red"))
-            sys.exit(1)
-
-        # Bucle por los datos
-        for item in paginado["data"]:
-            click.echo(click.style(f"[{item['id']}] ", fg="white"), nl=False)
+    # Crear la sesión con una conexión por cada solicitud simultánea, vigilar da la suya para reutilizarla
+    if sesion is None:
+        sesion = crear_sesion(oauth2_token, simultaneas)
 
-            # Si NO ha sido analizada, se omite
-            if sobreescribir is False and item["rag_fue_analizado_tiempo"] is None:
-                click.echo(click.style("Se omite porque aun NO se ha analizado", fg="yellow"))
-                continue
+    # Inicializar el contador
+    contador = 0
 
-            # Si ya fue sintetizada, se omite
-            if sobreescribir is False and item["rag_fue_sintetizado_tiempo"] is not None:
-                click.echo(click.style("Se omite porque ya fue sintetizado", fg="yellow"))
-                continue
+    # Sintetizar con varias solicitudes en vuelo, pero mostrar los resultados en el orden de la consulta
+    parametros = {"creado_desde": creado_desde, "creado_hasta": creado_hasta}
+    sintetizar_item = functools.partial(
+        sintetizar_sentencia,
+        sesion,
+        open_ai,
+        probar=probar,
+        sobreescribir=sobreescribir,
+        usar_cache=not sin_cache,
+    )
 
-            # Consultar por su ID para obtener su texto
-            try:
-                respuesta = requests.get(
-                    url=f"{API_BASE_URL}/api/v5/sentencias/{item['id']}",
-                    headers={"Authorization": f"Bearer {oauth2_token}"},
-                    timeout=TIMEOUT,
-                )
-            except requests.exceptions.RequestException as error:
-                click.echo(click.style(str(error), fg="red"))
-                sys.exit(1)
-            if respuesta.status_code != 200:
-                click.echo(click.style(str(respuesta), fg="red"))
-                sys.exit(1)
-            detalle = respuesta.json()
-
-            # Si hubo un error
-            contenido = respuesta.json()
-            if contenido["success"] is False:
-                click.echo(click.style(contenido["message"], fg="red"))
-                sys.exit(1)
-
-            # Validar que tiene el texto
-            datos = detalle["data"]
-            if datos is None:
-                click.echo(click.style("No tiene 'data'", fg="yellow"))
-                continue
-            if "rag_analisis" not in datos or datos["rag_analisis"] is None:
-                click.echo(click.style("No tiene 'rag_analisis' o es nulo", fg="yellow"))
-                continue
-            if "texto" not in datos["rag_analisis"] or datos["rag_analisis"]["texto"] is None:
-                click.echo(click.style("No tiene 'texto' el análisis o es nulo", fg="yellow"))
-                continue
-            texto = datos["rag_analisis"]["texto"]
-            if texto.strip() == "":
-                click.echo(click.style("No hay texto para sintetizar, está vacío", fg="yellow"))
-                continue
-
-            # Mostrar en pantalla la longitud de caracteres
-            click.echo(click.style(f"{texto[:MOSTRAR_CARACTERES]}… = {len(texto)} ", fg="blue"), nl=False)
-
-            # Definir los mensajes a enviar a OpenAI
-            mensajes = [
-                {"role": "system", "content": OPENAI_PROMPT},
-                {"role": "user", "content": texto},
-            ]
+    def items_pendientes():
+        """Entregar los registros de cada página, sin los que ya procesó una ejecución anterior"""
+        for paginado in paginar(sesion, "/api/v5/sentencias", parametros, offset=punto_control.offset):
+            ids = [item["id"] for item in paginado["data"]]
+            pendientes = punto_control.iniciar_pagina(paginado["offset"], paginado["limit"], ids)
+            for item in paginado["data"]:
+                if item["id"] in pendientes:
+                    yield item
 
-            # Enviar a OpenAI el texto
-            try:
-                chat_response = open_ai.chat.completions.create(
-                    model=OPENAI_MODEL,
-                    messages=mensajes,
-                    stream=False,
-                )
-            except Exception as error:
-                click.echo(click.style(f"Error al sintetizar: {str(error)}", fg="yellow"))
-                continue
-
-            # Mostrar en pantalla un fragmento de la sintesis
-            sintesis = chat_response.choices[0].message.content
-            tokens_total = chat_response.usage.total_tokens
-            click.echo(click.style(f"{sintesis[:MOSTRAR_CARACTERES]}… = {tokens_total} ", fg="magenta"), nl=False)
-
-            # Definir los datos RAG a enviar
-            data = {
-                "id": item["id"],
-                "analisis": None,
-                "sintesis": {
-                    "modelo": chat_response.model,
-                    "sintesis": sintesis,
-                    "tokens_total": tokens_total,
-                },
-                "categorias": None,
-            }
-
-            # Si NO está en modo de pruebas
-            if probar is False:
-                # Enviar los datos RAG
-                try:
-                    respuesta = requests.put(
-                        url=f"{API_BASE_URL}/api/v5/sentencias/rag",
-                        headers={"Authorization": f"Bearer {oauth2_token}"},
-                        data=json.dumps(data),
-                        timeout=TIMEOUT,
-                    )
-                except requests.exceptions.RequestException as error:
-                    click.echo(click.style(str(error), fg="red"))
-                    sys.exit(1)
-                if respuesta.status_code != 200:
-                    click.echo(click.style(str(respuesta.content), fg="red"))
-                    sys.exit(1)
-
-                # Si hubo un error
-                resultado = respuesta.json()
-                if resultado["success"] is False:
-                    click.echo(click.style(resultado["message"], fg="yellow"))
+    try:
+        with concurrent.futures.ThreadPoolExecutor(max_workers=simultaneas) as executor:
+            for item, future in mapear_en_orden(executor, sintetizar_item, items_pendientes(), simultaneas):
+                fue_sintetizada, mensajes = future.result()
+                click.echo(click.style(f"[{item['id']}] ", fg="white"), nl=False)
+                for mensaje, color in mensajes:
+                    click.echo(click.style(mensaje, fg=color), nl=False)
+                click.echo()
+                # Si falló la API se deja sin marcar, para que se vuelva a intentar al reanudar
+                if fue_sintetizada is None:
                     continue
+                punto_control.marcar(item["id"])
+                if fue_sintetizada:
+                    contador += 1
+    except MyAnyError as error:
+        click.echo(click.style(str(error), fg="red"))
+        click.echo(click.style("Para continuar donde se quedó use --reanudar", fg="yellow"))
+        sys.exit(1)
+    finally:
+        punto_control.guardar()
+
+    # Avanzar la marca de agua, sólo si no quedó nada pendiente de volver a intentar
+    if marca_agua is not None and probar is False:
+        if punto_control.esta_completo():
+            click.echo(click.style(f"Marca de agua en {marca_agua.avanzar()}", fg="white"))
+        else:
+            click.echo(click.style("Quedaron pendientes, la marca de agua no avanzó", fg="yellow"))
+
+    # Borrar el punto de control si ya no hace falta, si quedaron pendientes se conserva para reanudar
+    if punto_control.esta_completo():
+        punto_control.borrar()
+    else:
+        punto_control.guardar()
+        click.echo(click.style("Quedaron pendientes, para volver a intentarlos use --reanudar", fg="yellow"))
+
+    # Mostrar los aciertos de la cache
+    if sin_cache is False:
+        contadores = synthesis_cache.obtener_contadores_ejecucion()
+        click.echo(
+            click.style(f"Cache de síntesis: {contadores['aciertos']} aciertos, {contadores['fallos']} fallos", fg="white")
+        )
 
-            # Incrementar el contador
-            contador += 1
-            if probar is False:
-                click.echo(click.style("ENVIADO", fg="white"))
-            else:
-                click.echo(click.style("PROBADO", fg="white"))
+    # Guardar y mostrar las medidas de cada etapa
+    resumen, rutas = metrics.publicar("sentencias_sintetizar", time.perf_counter() - inicio, contador)
+    for renglon in metrics.resumir_renglones(resumen):
+        click.echo(click.style(renglon, fg="white"))
+    click.echo(click.style(f"Medidas guardadas en {', '.join(str(ruta) for ruta in rutas)}", fg="white"))
 
-        # Incrementar el offset y terminar el bucle si lo rebasamos
-        offset += LIMIT
-        if offset >= paginado["total"]:
-            break
+    # Mostrar los tamaños de página elegidos
+    for renglon in resumir_limites():
+        click.echo(click.style(renglon, fg="white"))
 
     # Mostrar el mensaje de término
     click.echo(click.style(f"Fueron sintetizadas {contador} sentencias", fg="green"))
 
 
+@click.command()
+@click.option("--desde", type=str, default="", help="Fecha inicial AAAA-MM-DD si aún no hay marca de agua (por defecto hoy)")
+@click.option("--intervalo", type=int, default=VIGILAR_INTERVALO, help="Segundos entre cada consulta")
+@click.option("--probar", is_flag=True, help="Modo de prueba, sin cambios")
+@click.option("--simultaneas", type=int, default=SIMULTANEAS_POR_DEFECTO, help="Máximo de solicitudes simultáneas a OpenAI")
+@click.option("--sin-sintetizar", is_flag=True, help="Sólo analizar")
+@click.option("--hilos", type=int, default=HILOS_POR_DEFECTO, help="Número de hilos o procesos para analizar")
+@click.option("--motor", type=click.Choice(MOTORES), default="hilos", help="Motor para extraer los textos")
+@click.pass_context
+def vigilar(ctx, desde, intervalo, probar, simultaneas, sin_sintetizar, hilos, motor):
+    """Quedarse en ejecución analizando y sintetizando las sentencias nuevos cada intervalo, termina con SIGTERM"""
+    click.echo(f"Vigilando sentencias cada {intervalo} segundos")
+
+    # Validar el intervalo
+    if intervalo < 1:
+        click.echo(click.style("El intervalo debe ser mayor a cero", fg="red"))
+        sys.exit(1)
+
+    # Cada vuelta ejecuta las órdenes con --desde-ultimo en este proceso, así se reutilizan los módulos ya importados,
+    # el cliente de OpenAI, las caches y los tamaños de página aprendidos; el token se reutiliza mientras esté vigente
+    ordenes = [(analizar, {"hilos": hilos, "motor": motor})]
+    if sin_sintetizar is False:
+        ordenes.append((sintetizar, {"simultaneas": simultaneas}))
+    vigilante = Vigilante(intervalo)
+
+    # La sesión y el motor se crean una sola vez y se dan a cada orden, así las conexiones a la API y los procesos
+    # quedan listos entre vueltas; la sesión se crea en la primera vuelta para que un login fallido se vuelva a intentar
+    compartidos = {"executor": crear_ejecutor(motor, hilos)}
+
+    def vuelta():
+        """Procesar lo creado desde la última vuelta que terminó bien"""
+        if "sesion" not in compartidos:
+            compartidos["sesion"] = crear_sesion(get_auth_token(), max(ENVIOS_POR_DEFECTO + 1, simultaneas))
+        if motor == "procesos":
+            try:
+                compartidos["executor"].submit(int).result()
+            except concurrent.futures.BrokenExecutor:
+                # Si murió un proceso el motor ya no acepta tareas, se crea otro
+                compartidos["executor"] = crear_ejecutor(motor, hilos)
+        for orden, opciones in ordenes:
+            if vigilante.detener.is_set():
+                break
+            if orden is analizar:
+                opciones = {**opciones, "executor": compartidos["executor"]}
+            # Las medidas y los aciertos de la cache que muestra cada orden son sólo de esa vuelta
+            metrics.reiniciar()
+            synthesis_cache.reiniciar_contadores_ejecucion()
+            try:
+                ctx.invoke(
+                    orden,
+                    creado_desde=desde or date.today().isoformat(),
+                    desde_ultimo=True,
+                    probar=probar,
+                    sesion=compartidos["sesion"],
+                    **opciones,
+                )
+            except SystemExit as salida:
+                if salida.code:
+                    click.echo(
+                        click.style(f"{orden.name} terminó con error, se vuelve a intentar en la siguiente vuelta", fg="yellow")
+                    )
+
+    def al_fallar(error: Exception):
+        """Mostrar el error inesperado y seguir vigilando"""
+        click.echo(click.style(f"Error inesperado: {str(error)}", fg="red"))
+
+    try:
+        vigilante.ejecutar(vuelta, al_fallar)
+    finally:
+        compartidos["executor"].shutdown(cancel_futures=True)
+        if "sesion" in compartidos:
+            compartidos["sesion"].close()
+    click.echo(click.style(f"Se dejó de vigilar después de {vigilante.vueltas} vueltas", fg="green"))
+
+
 cli.add_command(analizar)
 cli.add_command(sintetizar)
+cli.add_command(vigilar)
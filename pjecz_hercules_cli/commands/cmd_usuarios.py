@@ -3,19 +3,13 @@ Command Usuarios
 """
 
 import csv
-import os
 import sys
 
 import click
-from dotenv import load_dotenv
-import requests
 
+from pjecz_hercules_cli.dependencies.api_client import resumir_limites, crear_sesion, paginar
 from pjecz_hercules_cli.dependencies.authentications import get_auth_token
-
-load_dotenv()
-API_BASE_URL = os.getenv("API_BASE_URL")
-LIMIT = int(os.getenv("LIMIT"))
-TIMEOUT = int(os.getenv("TIMEOUT"))
+from pjecz_hercules_cli.dependencies.exceptions import MyAnyError, MyEmptyError
 
 
 @click.group()
@@ -50,81 +44,41 @@ def exportar(archivo_csv, jurisdiccionales, notarias):
         escritor.writeheader()
 
         # Consultar las autoridades
-        autoridades_offset = 0
-        while True:
-            autoridades_params = {
-                "es_jurisdiccional": es_jurisdiccional,
-                "es_notaria": es_notaria,
-                "limit": LIMIT,
-                "offset": autoridades_offset,
-            }
-            try:
-                respuesta = requests.get(
-                    url=f"{API_BASE_URL}/api/v5/autoridades",
-                    headers={"Authorization": f"Bearer {oauth2_token}"},
-                    params=autoridades_params,
-                    timeout=TIMEOUT,
-                )
-            except requests.exceptions.RequestException as error:
-                click.echo(click.style(str(error), fg="red"))
-                sys.exit(1)
-            if respuesta.status_code != 200:
-                click.echo(click.style(str(respuesta), fg="red"))
-                sys.exit(1)
-            autoridades_contenido = respuesta.json()
-            if autoridades_contenido["success"] is False:
-                click.echo(click.style(autoridades_contenido["message"], fg="red"))
-                sys.exit(1)
-
-            # Bucle por cada autoridad
-            for autoridad_item in autoridades_contenido["data"]:
-
-                # Consultar los usuarios de la autoridad
-                usuarios_offset = 0
-                while True:
-                    usuarios_params = {"autoridad_clave": autoridad_item["clave"], "limit": LIMIT, "offset": usuarios_offset}
+        sesion = crear_sesion(oauth2_token)
+        autoridades_params = {"es_jurisdiccional": es_jurisdiccional, "es_notaria": es_notaria}
+        try:
+            for autoridades_contenido in paginar(sesion, "/api/v5/autoridades", autoridades_params):
+
+                # Bucle por cada autoridad
+                for autoridad_item in autoridades_contenido["data"]:
+
+                    # Consultar los usuarios de la autoridad
+                    usuarios_params = {"autoridad_clave": autoridad_item["clave"]}
                     try:
-                        respuesta = requests.get(
-                            url=f"{API_BASE_URL}/api/v5/usuarios",
-                            headers={"Authorization": f"Bearer {oauth2_token}"},
-                            params=usuarios_params,
-                            timeout=TIMEOUT,
-                        )
-                    except requests.exceptions.RequestException as error:
-                        click.echo(click.style(str(error), fg="red"))
-                        sys.exit(1)
-                    if respuesta.status_code != 200:
-                        click.echo(click.style(str(respuesta), fg="red"))
-                        sys.exit(1)
-                    usuarios_contenido = respuesta.json()
-                    if usuarios_contenido["success"] is False:
-                        click.echo(
-                            click.style(f"[{autoridad_item['clave']} {usuarios_contenido['message']}]", fg="yellow"), nl=False
-                        )
-                        break  # No se encontraron
-
-                    # Bucle por cada usuario
-                    for item in usuarios_contenido["data"]:
-                        escritor.writerow(
-                            {
-                                "distrito_nombre_corto": autoridad_item["distrito_nombre_corto"],
-                                "autoridad_descripcion_corta": autoridad_item["descripcion_corta"],
-                                "usuario_email": item["email"],
-                                "directorio_edictos": autoridad_item["directorio_edictos"],
-                            }
-                        )
-                        contador += 1
-                        click.echo(click.style("+", fg="green"), nl=False)
-
-                    # Incrementar el offset para obtener los siguientes resultados
-                    usuarios_offset += LIMIT
-                    if usuarios_offset > usuarios_contenido["total"]:
-                        break  # Salir del bucle
-
-            # Incrementar el offset para obtener los siguientes resultados
-            autoridades_offset += LIMIT
-            if autoridades_offset > autoridades_contenido["total"]:
-                break  # Salir del bucle
+                        for usuarios_contenido in paginar(sesion, "/api/v5/usuarios", usuarios_params):
+
+                            # Bucle por cada usuario
+                            for item in usuarios_contenido["data"]:
+                                escritor.writerow(
+                                    {
+                                        "distrito_nombre_corto": autoridad_item["distrito_nombre_corto"],
+                                        "autoridad_descripcion_corta": autoridad_item["descripcion_corta"],
+                                        "usuario_email": item["email"],
+                                        "directorio_edictos": autoridad_item["directorio_edictos"],
+                                    }
+                                )
+                                contador += 1
+                                click.echo(click.style("+", fg="green"), nl=False)
+                    except MyEmptyError as error:
+                        click.echo(click.style(f"[{autoridad_item['clave']} {str(error)}]", fg="yellow"), nl=False)
+        except MyAnyError as error:
+            click.echo(click.style(str(error), fg="red"))
+            sys.exit(1)
+
+    # Mostrar los tamaños de página elegidos, en un renglón aparte del avance
+    click.echo()
+    for renglon in resumir_limites():
+        click.echo(click.style(renglon, fg="white"))
 
     # Mostrar el mensaje de término
     click.echo(click.style(f"Fueron agregadas {contador} usuarios a {archivo_csv}", fg="green"))
@@ -0,0 +1,393 @@
+"""
+API Client
+"""
+
+import concurrent.futures
+import functools
+import gzip
+import json
+import os
+import threading
+import zlib
+from typing import TYPE_CHECKING, Iterator
+
+from dotenv import load_dotenv
+
+from . import metrics
+from .authentications import get_auth_token
+from .exceptions import MyConnectionError, MyEmptyError, MyNotValidTokenError, MyRequestError, MyTimeoutError
+from .executors import mapear_en_orden
+
+# Sólo para las anotaciones, requests tarda en importarse y se importa al crear la sesión
+if TYPE_CHECKING:
+    import requests
+
+# Cargar las variables de entorno
+load_dotenv()
+API_BASE_URL = os.getenv("API_BASE_URL")
+LIMIT = int(os.getenv("LIMIT"))
+TIMEOUT = int(os.getenv("TIMEOUT"))
+VENTANA_PAGINAS = int(os.getenv("VENTANA_PAGINAS", "4"))
+LIMIT_MINIMO = int(os.getenv("LIMIT_MINIMO", "10"))
+LIMIT_MAXIMO = int(os.getenv("LIMIT_MAXIMO", "500"))
+LIMIT_OBJETIVO_SEGUNDOS = float(os.getenv("LIMIT_OBJETIVO_SEGUNDOS", "2"))
+LIMIT_MAXIMO_MB = float(os.getenv("LIMIT_MAXIMO_MB", "4"))
+ENVIAR_EN_FLUJO_CARACTERES = int(os.getenv("ENVIAR_EN_FLUJO_CARACTERES", "262144"))
+ENVIAR_GZIP = os.getenv("ENVIAR_GZIP", "1") == "1"
+ENVIAR_GZIP_MINIMO_BYTES = int(os.getenv("ENVIAR_GZIP_MINIMO_BYTES", "4096"))
+ENVIAR_GZIP_NIVEL = int(os.getenv("ENVIAR_GZIP_NIVEL", "1"))
+
+BLOQUE_CARACTERES = 65536  # Tamaño de los pedazos en que se serializan los textos largos
+STATUS_SIN_GZIP = (400, 415, 422)  # Lo que responde una API que no descomprime el cuerpo
+
+_rutas_sin_gzip = set()  # Rutas que no aceptaron el cuerpo comprimido, no se vuelve a intentar en esta ejecución
+
+
+def crear_sesion(oauth2_token: str, conexiones: int = 10) -> "requests.Session":
+    """Crear una sesión que reutiliza las conexiones a la API, con tantas conexiones como hilos la van a usar"""
+    import requests
+    from requests.adapters import HTTPAdapter
+
+    sesion = requests.Session()
+    sesion.headers.update({"Authorization": f"Bearer {oauth2_token}"})
+    adaptador = HTTPAdapter(pool_connections=1, pool_maxsize=max(1, conexiones) + VENTANA_PAGINAS)
+    sesion.mount("http://", adaptador)
+    sesion.mount("https://", adaptador)
+    return sesion
+
+
+def _poner_token_vigente(sesion: "requests.Session", rechazado: str = None):
+    """Poner en la sesión el token vigente, se renueva antes de que venza para que las ejecuciones largas no fallen"""
+    if "Authorization" not in sesion.headers:
+        return
+    encabezado = f"Bearer {get_auth_token(rechazado)}"
+    if sesion.headers["Authorization"] != encabezado:
+        sesion.headers["Authorization"] = encabezado
+
+
+def _solicitar(
+    sesion: "requests.Session",
+    metodo: str,
+    ruta: str,
+    medidas: dict = None,
+    etapa: str = "api",
+    **kwargs,
+) -> dict:
+    """Hacer la solicitud a la API, validar el status code y entregar el contenido, con medidas anota segundos y bytes"""
+    import requests
+
+    _poner_token_vigente(sesion)
+    try:
+        with metrics.medir(etapa):
+            respuesta = sesion.request(method=metodo, url=f"{API_BASE_URL}{ruta}", timeout=TIMEOUT, **kwargs)
+    except requests.exceptions.Timeout as error:
+        raise MyTimeoutError(f"Se agotó el tiempo de espera con {ruta}: {str(error)}") from error
+    except requests.exceptions.ConnectionError as error:
+        raise MyConnectionError(f"No se pudo conectar con {ruta}: {str(error)}") from error
+    except requests.exceptions.RequestException as error:
+        raise MyRequestError(str(error)) from error
+    metrics.contar("bytes_recibidos", len(respuesta.content))
+    if medidas is not None:
+        medidas["segundos"] = respuesta.elapsed.total_seconds()
+        medidas["bytes"] = len(respuesta.content)
+        medidas["status"] = respuesta.status_code
+    if respuesta.status_code == 401 and "Authorization" in respuesta.request.headers:
+        # Se renueva el token y quien llama lo vuelve a intentar una vez, con el cuerpo armado de nuevo
+        _poner_token_vigente(sesion, respuesta.request.headers["Authorization"].removeprefix("Bearer "))
+        raise MyNotValidTokenError(f"La API rechazó el token con {ruta}")
+    if respuesta.status_code != 200:
+        raise MyRequestError(f"Status Code {respuesta.status_code}: {respuesta.content}")
+    try:
+        contenido = respuesta.json()
+    except ValueError as error:
+        raise MyRequestError(f"La respuesta de {ruta} no es JSON") from error
+    if "success" not in contenido or "message" not in contenido:
+        raise MyRequestError(f"Respuesta inesperada: {contenido}")
+    return contenido
+
+
+def consultar(
+    sesion: "requests.Session",
+    ruta: str,
+    params: dict = None,
+    medidas: dict = None,
+    etapa: str = "consultar",
+) -> dict:
+    """Consultar la API con GET, entrega el contenido y causa MyEmptyError si no tuvo éxito"""
+    try:
+        contenido = _solicitar(sesion, "GET", ruta, medidas, etapa, params=params)
+    except MyNotValidTokenError:
+        contenido = _solicitar(sesion, "GET", ruta, medidas, etapa, params=params)  # Con el token renovado
+    if contenido["success"] is False:
+        raise MyEmptyError(contenido["message"])
+    return contenido
+
+
+class ControlLimite:
+    """Ajustar el tamaño de página de un endpoint según el tiempo de respuesta y los bytes recibidos"""
+
+    def __init__(self, limit: int, minimo: int = LIMIT_MINIMO, maximo: int = LIMIT_MAXIMO):
+        self.minimo = max(1, minimo)
+        self.maximo = max(self.minimo, maximo)
+        self.limit = min(max(limit, self.minimo), self.maximo)
+        self.paginas = 0
+        self.segundos = 0.0
+        self.bytes = 0
+        self._segundos_por_elemento = None
+        self._bytes_por_elemento = None
+        self._candado = threading.Lock()
+
+    def observar(self, elementos: int, segundos: float, bytes_respuesta: int):
+        """Registrar una página recibida y calcular el siguiente tamaño, a lo más el doble o la mitad del actual"""
+        with self._candado:
+            self.paginas += 1
+            self.segundos += segundos
+            self.bytes += bytes_respuesta
+            if elementos == 0:
+                return
+            # Promedios móviles por elemento, para que una página atípica no mueva de más el tamaño
+            segundos_por_elemento = max(segundos, 0.001) / elementos
+            bytes_por_elemento = max(bytes_respuesta, 1) / elementos
+            if self._segundos_por_elemento is None:
+                self._segundos_por_elemento, self._bytes_por_elemento = segundos_por_elemento, bytes_por_elemento
+            else:
+                self._segundos_por_elemento = (self._segundos_por_elemento + segundos_por_elemento) / 2
+                self._bytes_por_elemento = (self._bytes_por_elemento + bytes_por_elemento) / 2
+            # El objetivo queda lejos del TIMEOUT para que una página lenta no agote el tiempo de espera
+            propuesto = min(
+                min(LIMIT_OBJETIVO_SEGUNDOS, TIMEOUT / 2) / self._segundos_por_elemento,
+                LIMIT_MAXIMO_MB * 1024 * 1024 / self._bytes_por_elemento,
+            )
+            propuesto = min(max(propuesto, self.limit / 2), self.limit * 2)
+            self.limit = int(min(max(propuesto, self.minimo), self.maximo))
+
+    def reducir(self):
+        """Reducir a la mitad el tamaño porque se agotó el tiempo de espera"""
+        with self._candado:
+            self.limit = max(self.minimo, self.limit // 2)
+
+    def topar(self, maximo: int):
+        """Bajar el máximo porque la API entregó menos elementos que los pedidos"""
+        with self._candado:
+            self.maximo = max(1, min(self.maximo, maximo))
+            self.minimo = min(self.minimo, self.maximo)
+            self.limit = min(self.limit, self.maximo)
+
+
+_controles = {}
+_controles_candado = threading.Lock()
+
+
+def obtener_control_limite(ruta: str) -> ControlLimite:
+    """Obtener el control del tamaño de página del endpoint, se comparte en toda la ejecución"""
+    with _controles_candado:
+        if ruta not in _controles:
+            # LIMIT es el tamaño inicial y siempre queda dentro de los límites
+            _controles[ruta] = ControlLimite(LIMIT, min(LIMIT_MINIMO, LIMIT), max(LIMIT_MAXIMO, LIMIT))
+        return _controles[ruta]
+
+
+def resumir_limites() -> list[str]:
+    """Entregar un renglón por endpoint con el tamaño de página elegido y lo observado"""
+    renglones = []
+    for ruta, control in sorted(_controles.items()):
+        if control.paginas == 0:
+            continue
+        renglones.append(
+            f"{ruta}: limit {control.limit} (entre {control.minimo} y {control.maximo}), {control.paginas} páginas, "
+            f"{control.segundos / control.paginas:.2f} s y {control.bytes / control.paginas / 1024:.0f} KB en promedio"
+        )
+    return renglones
+
+
+def paginar(
+    sesion: "requests.Session",
+    ruta: str,
+    params: dict = None,
+    limit: int = None,
+    offset: int = 0,
+    ventana: int = VENTANA_PAGINAS,
+) -> Iterator[dict]:
+    """Consultar la API página por página desde el offset, entrega el contenido de cada página con su offset y limit"""
+    params = dict(params or {})
+
+    # Sin limit el tamaño de página se adapta por endpoint, con limit es fijo
+    control = obtener_control_limite(ruta) if limit is None else ControlLimite(limit, limit, limit)
+
+    def consultar_rango(rango: tuple[int, int]) -> dict:
+        """Consultar los elementos de offset a offset + limit, partiendo el rango si se agota el tiempo"""
+        rango_offset, rango_limit = rango
+        medidas = {}
+        try:
+            contenido = consultar(sesion, ruta, {**params, "limit": rango_limit, "offset": rango_offset}, medidas, "listar")
+            recibidos = len(contenido["data"])
+            control.observar(recibidos, medidas["segundos"], medidas["bytes"])
+            if 0 < recibidos < rango_limit and rango_offset + recibidos < contenido["total"]:
+                control.topar(recibidos)
+        except MyTimeoutError:
+            if rango_limit <= 1:
+                raise
+            control.reducir()
+            contenido = consultar_rango((rango_offset, rango_limit // 2))
+        # Si la API entregó menos de lo pedido sin ser el final, se consulta lo que falta para no saltar elementos
+        while len(contenido["data"]) < rango_limit and rango_offset + len(contenido["data"]) < contenido["total"]:
+            recibidos = len(contenido["data"])
+            resto = consultar_rango((rango_offset + recibidos, rango_limit - recibidos))
+            if len(resto["data"]) == 0:
+                break
+            contenido["data"].extend(resto["data"])
+        contenido["offset"] = rango_offset
+        contenido["limit"] = rango_limit
+        return contenido
+
+    # Consultar la primera página para conocer el total
+    contenido = consultar_rango((offset, control.limit))
+    yield contenido
+    total = contenido["total"]
+    siguiente = offset + contenido["limit"]
+    if siguiente >= total:
+        return
+
+    def rangos() -> Iterator[tuple[int, int]]:
+        """Entregar los rangos por consultar, cada uno con el tamaño de página vigente al momento de pedirlo"""
+        rango_offset = siguiente
+        while rango_offset < total:
+            rango_limit = control.limit
+            yield rango_offset, rango_limit
+            rango_offset += rango_limit
+
+    # Consultar las demás páginas de forma concurrente, con un máximo de ventana en vuelo, pero entregarlas en orden
+    executor = concurrent.futures.ThreadPoolExecutor(max_workers=max(1, ventana))
+    try:
+        for _, future in mapear_en_orden(executor, consultar_rango, rangos(), max(1, ventana)):
+            yield future.result()
+    finally:
+        executor.shutdown(wait=True, cancel_futures=True)
+
+
+def _contar_caracteres(valor) -> int:
+    """Contar los caracteres de los textos dentro de los datos"""
+    if isinstance(valor, str):
+        return len(valor)
+    if isinstance(valor, dict):
+        return sum(_contar_caracteres(elemento) for elemento in valor.values())
+    if isinstance(valor, (list, tuple)):
+        return sum(_contar_caracteres(elemento) for elemento in valor)
+    return 0
+
+
+def _iterar_json(valor) -> Iterator[str]:
+    """Serializar a JSON en pedazos, los textos largos se parten para no copiarlos completos"""
+    if isinstance(valor, str) and len(valor) > BLOQUE_CARACTERES:
+        yield '"'
+        for inicio in range(0, len(valor), BLOQUE_CARACTERES):
+            yield json.dumps(valor[inicio : inicio + BLOQUE_CARACTERES])[1:-1]
+        yield '"'
+    elif isinstance(valor, dict):
+        yield "{"
+        for numero, (llave, elemento) in enumerate(valor.items()):
+            yield f"{', ' if numero > 0 else ''}{json.dumps(str(llave))}: "
+            yield from _iterar_json(elemento)
+        yield "}"
+    elif isinstance(valor, (list, tuple)):
+        yield "["
+        for numero, elemento in enumerate(valor):
+            if numero > 0:
+                yield ", "
+            yield from _iterar_json(elemento)
+        yield "]"
+    else:
+        yield json.dumps(valor)
+
+
+def _iterar_cuerpo(data: dict) -> Iterator[bytes]:
+    """Entregar el cuerpo JSON codificado en bloques de bytes"""
+    bloque = []
+    tamanio = 0
+    for pedazo in _iterar_json(data):
+        bloque.append(pedazo)
+        tamanio += len(pedazo)
+        if tamanio >= BLOQUE_CARACTERES:
+            yield "".join(bloque).encode("utf-8")
+            bloque, tamanio = [], 0
+    if bloque:
+        yield "".join(bloque).encode("utf-8")
+
+
+@functools.cache
+def _cargar_orjson():
+    """Importar orjson la primera vez que se serializa, entrega None si no está instalado"""
+    # orjson es opcional, pip install ".[json]", serializa más rápido y directo a bytes
+    try:
+        import orjson
+    except ImportError:
+        return None
+    return orjson
+
+
+def armar_cuerpo(data: dict) -> bytes | Iterator[bytes]:
+    """Serializar los datos a JSON en bytes, con textos largos entrega un generador de bloques de bytes"""
+    # Con textos largos el cuerpo se envía en bloques (chunked), sin armar una copia completa del JSON en memoria
+    if 0 < ENVIAR_EN_FLUJO_CARACTERES <= _contar_caracteres(data):
+        return _iterar_cuerpo(data)
+    orjson = _cargar_orjson()
+    if orjson is not None:
+        return orjson.dumps(data)
+    return json.dumps(data).encode("utf-8")
+
+
+def _comprimir_bloques(bloques: Iterator[bytes]) -> Iterator[bytes]:
+    """Comprimir con gzip los bloques conforme se generan, sin juntar el cuerpo completo"""
+    compresor = zlib.compressobj(ENVIAR_GZIP_NIVEL, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for bloque in bloques:
+        metrics.contar("bytes_json", len(bloque))
+        comprimido = compresor.compress(bloque)
+        if comprimido:
+            yield comprimido
+    yield compresor.flush()
+
+
+def _contar_bloques(bloques: Iterator[bytes], nombre: str) -> Iterator[bytes]:
+    """Entregar los bloques contando sus bytes"""
+    for bloque in bloques:
+        metrics.contar(nombre, len(bloque))
+        yield bloque
+
+
+def preparar_cuerpo(data: dict, comprimir: bool = ENVIAR_GZIP) -> tuple[bytes | Iterator[bytes], dict]:
+    """Armar el cuerpo del envío, comprimido con gzip si conviene, entrega el cuerpo y los encabezados"""
+    encabezados = {"Content-Type": "application/json"}
+    cuerpo = armar_cuerpo(data)
+    if isinstance(cuerpo, bytes):
+        metrics.contar("bytes_json", len(cuerpo))
+        if comprimir and len(cuerpo) >= ENVIAR_GZIP_MINIMO_BYTES:
+            cuerpo = gzip.compress(cuerpo, ENVIAR_GZIP_NIVEL, mtime=0)
+            encabezados["Content-Encoding"] = "gzip"
+        metrics.contar("bytes_enviados", len(cuerpo))
+        return cuerpo, encabezados
+    if comprimir:
+        encabezados["Content-Encoding"] = "gzip"
+        return _contar_bloques(_comprimir_bloques(cuerpo), "bytes_enviados"), encabezados
+    return _contar_bloques(_contar_bloques(cuerpo, "bytes_json"), "bytes_enviados"), encabezados
+
+
+def enviar(sesion: "requests.Session", ruta: str, data: dict) -> dict:
+    """Enviar datos a la API con PUT, entrega el contenido, revise su success"""
+    comprimir = ENVIAR_GZIP and ruta not in _rutas_sin_gzip
+    token_renovado = False
+    while True:
+        # El cuerpo se arma en cada intento porque un generador no se puede enviar dos veces
+        cuerpo, encabezados = preparar_cuerpo(data, comprimir)
+        medidas = {}
+        try:
+            return _solicitar(sesion, "PUT", ruta, medidas, "enviar", headers=encabezados, data=cuerpo)
+        except MyNotValidTokenError:
+            if token_renovado:
+                raise
+            token_renovado = True  # Se intenta una vez más con el token renovado
+        except MyRequestError:
+            if "Content-Encoding" not in encabezados or medidas.get("status") not in STATUS_SIN_GZIP:
+                raise
+            # La API no aceptó el cuerpo comprimido, se vuelve a enviar sin comprimir
+            _rutas_sin_gzip.add(ruta)
+            comprimir = False
@@ -2,11 +2,16 @@
 Authentications
 """
 
+import base64
+import json
 import os
+import threading
+import time
+from pathlib import Path
 
-import requests
 from dotenv import load_dotenv
 
+from .checkpoints import escribir_json_atomico
 from .exceptions import MyAuthenticationError
 
 # Cargar las variables de entorno
@@ -15,10 +20,58 @@ API_BASE_URL = os.getenv("API_BASE_URL")
 USERNAME = os.getenv("USERNAME")
 PASSWORD = os.getenv("PASSWORD")
 TIMEOUT = int(os.getenv("TIMEOUT"))
+CACHE_DIR = os.getenv("CACHE_DIR", str(Path.home() / ".cache" / "pjecz_hercules_cli"))
+TOKEN_CACHE = os.getenv("TOKEN_CACHE", "1") == "1"
+TOKEN_MARGEN_SEGUNDOS = int(os.getenv("TOKEN_MARGEN_SEGUNDOS", "300"))
+TOKEN_VIGENCIA_SEGUNDOS = int(os.getenv("TOKEN_VIGENCIA_SEGUNDOS", "1800"))
 
+TOKEN_ARCHIVO = "token_oauth2.json"
+
+_token = {}  # access_token, emitido y expira del token vigente en este proceso
+_candado = threading.Lock()
+
+
+def _calcular_expiracion(contenido: dict) -> float:
+    """Calcular cuándo vence el token, con expires_in, o con el exp del JWT, o con TOKEN_VIGENCIA_SEGUNDOS"""
+    if isinstance(contenido.get("expires_in"), (int, float)):
+        return time.time() + contenido["expires_in"]
+    try:
+        carga = contenido["access_token"].split(".")[1]
+        exp = json.loads(base64.urlsafe_b64decode(carga + "=" * (-len(carga) % 4)))["exp"]
+        return float(exp)
+    except (IndexError, KeyError, TypeError, ValueError):
+        return time.time() + TOKEN_VIGENCIA_SEGUNDOS
+
+
+def _calcular_margen(token: dict) -> float:
+    """Calcular el margen antes de vencer, a lo más la mitad de la vida del token para que uno corto se alcance a usar"""
+    if "emitido" not in token:
+        return TOKEN_MARGEN_SEGUNDOS  # Guardado por una versión anterior, sin su vida
+    return min(TOKEN_MARGEN_SEGUNDOS, (token.get("expira", 0) - token["emitido"]) // 2)
+
+
+def _esta_vigente(token: dict) -> bool:
+    """Entrega verdadero si el token es de esta API y este usuario y le queda más que el margen"""
+    return (
+        token.get("api_base_url") == API_BASE_URL
+        and token.get("username") == USERNAME
+        and token.get("expira", 0) - _calcular_margen(token) > time.time()
+    )
+
+
+def _cargar_token() -> dict:
+    """Cargar el token guardado en disco, entrega un diccionario vacío si no hay o no se puede leer"""
+    try:
+        with open(Path(CACHE_DIR) / TOKEN_ARCHIVO, encoding="utf8") as puntero:
+            return json.load(puntero)
+    except (OSError, ValueError):
+        return {}
+
+
+def _hacer_login() -> dict:
+    """Hacer el login en la API, entrega el token con su expiración"""
+    import requests  # Se importa aquí para que el CLI arranque rápido
 
-def get_auth_token() -> str:
-    """Hacer el login en la API para obtener el token"""
     payload = {
         "grant_type": "password",
         "username": USERNAME,
@@ -32,4 +85,43 @@ def get_auth_token() -> str:
         )
     except requests.exceptions.RequestException as error:
         raise MyAuthenticationError(error)
-    return response.json()["access_token"]
+    if response.status_code != 200:
+        raise MyAuthenticationError(f"Falló el login con Status Code {response.status_code}")
+    try:
+        contenido = response.json()
+        access_token = contenido["access_token"]
+    except (ValueError, KeyError) as error:
+        raise MyAuthenticationError("La respuesta del login no tiene access_token") from error
+    return {
+        "api_base_url": API_BASE_URL,
+        "username": USERNAME,
+        "access_token": access_token,
+        "emitido": time.time(),
+        "expira": _calcular_expiracion(contenido),
+    }
+
+
+def get_auth_token(rechazado: str = None) -> str:
+    """Entregar el token vigente, del proceso o del disco, y hacer el login si falta poco para que venza o fue rechazado"""
+    global _token
+
+    with _candado:
+        # Si otro hilo ya lo renovó después de que la API rechazó el anterior, se usa el nuevo
+        if _esta_vigente(_token) and _token["access_token"] != rechazado:
+            return _token["access_token"]
+
+        # Reutilizar el de una ejecución anterior, o el que renovó otra ejecución
+        if TOKEN_CACHE:
+            guardado = _cargar_token()
+            if _esta_vigente(guardado) and guardado["access_token"] != rechazado:
+                _token = guardado
+                return _token["access_token"]
+
+        # Hacer el login y guardarlo, escribir_json_atomico crea el archivo con permisos sólo para el usuario
+        _token = _hacer_login()
+        if TOKEN_CACHE:
+            try:
+                escribir_json_atomico(Path(CACHE_DIR) / TOKEN_ARCHIVO, _token)
+            except OSError:
+                pass  # Sin guardarlo, la siguiente ejecución hará el login
+        return _token["access_token"]
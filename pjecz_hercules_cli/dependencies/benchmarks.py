@@ -0,0 +1,205 @@
+"""
+Benchmarks
+"""
+
+import json
+import math
+import platform
+import random
+import sys
+import time
+import tracemalloc
+from datetime import datetime
+from pathlib import Path
+from typing import Callable, Iterator
+
+from .api_client import armar_cuerpo, preparar_cuerpo
+from .pdf_backends import abrir_pdf, elegir_motor
+from .pdf_tools import _normalizar_texto_pagina, extraer_texto_de_archivo_pdf
+
+# Tamaños del corpus sintético: nombre, cantidad de archivos y páginas por archivo
+CORPUS_TAMANIOS = [("chico", 20, 2), ("mediano", 6, 20), ("grande", 2, 120)]
+RENGLONES_POR_PAGINA = 40
+MINIMO_SEGUNDOS = 0.2  # Las medidas más cortas tienen demasiado ruido
+PALABRAS = (
+    "sentencia juzgado primera instancia civil familiar amparo recurso demanda actor demandado tribunal "
+    "resolutivo considerando artículo fracción código procedimientos audiencia pruebas alegatos notificación "
+    "expediente distrito Saltillo Torreón Monclova Coahuila Zaragoza"
+).split()
+
+
+def _escapar_texto_pdf(texto: str) -> str:
+    """Escapar los caracteres especiales de una cadena literal de PDF"""
+    return texto.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+
+def generar_pdf_sintetico(ruta: Path, paginas: int, semilla: int):
+    """Escribir un archivo PDF con texto al azar pero repetible, sin depender de otra biblioteca"""
+    azar = random.Random(semilla)
+    objetos = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        f"<< /Type /Pages /Kids [{' '.join(f'{3 + 2 * i} 0 R' for i in range(paginas))}] /Count {paginas} >>".encode(),
+    ]
+    fuente = 3 + 2 * paginas
+    for numero in range(paginas):
+        objetos.append(
+            f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] /Resources << /Font << /F1 {fuente} 0 R >> >> "
+            f"/Contents {4 + 2 * numero} 0 R >>".encode()
+        )
+        renglones = ["BT /F1 9 Tf 11 TL 40 760 Td"]
+        for _ in range(RENGLONES_POR_PAGINA):
+            renglon = " ".join(azar.choice(PALABRAS) for _ in range(azar.randint(6, 14)))
+            renglones.append(f"({_escapar_texto_pdf(renglon)}) '")
+        renglones.append("ET")
+        contenido = "\n".join(renglones).encode("latin-1")
+        objetos.append(b"<< /Length %d >>\nstream\n" % len(contenido) + contenido + b"\nendstream")
+    objetos.append(b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>")
+
+    # Juntar los objetos y la tabla de referencias cruzadas
+    salida = bytearray(b"%PDF-1.4\n")
+    desplazamientos = []
+    for numero, objeto in enumerate(objetos, 1):
+        desplazamientos.append(len(salida))
+        salida += f"{numero} 0 obj\n".encode() + objeto + b"\nendobj\n"
+    inicio_xref = len(salida)
+    salida += f"xref\n0 {len(objetos) + 1}\n0000000000 65535 f \n".encode()
+    for desplazamiento in desplazamientos:
+        salida += f"{desplazamiento:010d} 00000 n \n".encode()
+    salida += f"trailer\n<< /Size {len(objetos) + 1} /Root 1 0 R >>\nstartxref\n{inicio_xref}\n%%EOF\n".encode()
+    ruta.write_bytes(salida)
+
+
+def generar_corpus(directorio: Path, semilla: int = 0) -> dict[str, list[Path]]:
+    """Generar el corpus sintético si no existe, entrega los archivos por tamaño"""
+    directorio.mkdir(parents=True, exist_ok=True)
+    corpus = {}
+    for nombre, cantidad, paginas in CORPUS_TAMANIOS:
+        corpus[nombre] = []
+        for numero in range(cantidad):
+            ruta = directorio / f"{nombre}_{paginas:04d}p_{numero:02d}.pdf"
+            if ruta.exists() is False:
+                generar_pdf_sintetico(ruta, paginas, semilla * 1000 + paginas * 100 + numero)
+            corpus[nombre].append(ruta)
+    return corpus
+
+
+def _medir(funcion: Callable, repeticiones: int) -> tuple[float, object]:
+    """Ejecutar la función varias veces, entrega el mejor tiempo en segundos por llamada y lo que entregó la función"""
+    # La primera llamada calienta y define cuántas llamadas hacen falta para medir al menos MINIMO_SEGUNDOS
+    inicio = time.perf_counter()
+    resultado = funcion()
+    llamadas = max(1, math.ceil(MINIMO_SEGUNDOS / max(time.perf_counter() - inicio, 1e-6)))
+    mejor = None
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        for _ in range(llamadas):
+            resultado = funcion()
+        segundos = (time.perf_counter() - inicio) / llamadas
+        mejor = segundos if mejor is None else min(mejor, segundos)
+    return mejor, resultado
+
+
+def _consumir(cuerpo: bytes | Iterator[bytes]):
+    """Recorrer el cuerpo del envío si es un generador, como lo hace requests al enviarlo"""
+    if not isinstance(cuerpo, bytes):
+        for _ in cuerpo:
+            pass
+
+
+def ejecutar_benchmarks(
+    corpus: dict[str, list[Path]],
+    crear_datos: Callable[[int, str, int, str], dict],
+    repeticiones: int = 3,
+) -> dict:
+    """Medir la extracción, la normalización, la serialización del envío y el pico de memoria"""
+    resultados = {}
+
+    # Extracción de texto sin cache, por tamaño de archivo
+    textos = {}
+    for nombre, archivos in corpus.items():
+        segundos, textos[nombre] = _medir(
+            lambda: [extraer_texto_de_archivo_pdf(str(ruta), usar_cache=False) for ruta in archivos], repeticiones
+        )
+        megabytes = sum(ruta.stat().st_size for ruta in archivos) / 1024 / 1024
+        resultados[f"extraccion_{nombre}_docs_por_s"] = {"valor": len(archivos) / segundos, "mayor_es_mejor": True}
+        resultados[f"extraccion_{nombre}_mb_por_s"] = {"valor": megabytes / segundos, "mayor_es_mejor": True}
+
+    # Normalización de espacios, con el texto de las páginas como lo entrega el motor
+    paginas_crudas = []
+    for archivos in corpus.values():
+        documento = abrir_pdf(str(archivos[0]), elegir_motor())
+        try:
+            paginas_crudas.extend(documento.iterar_paginas(0, documento.contar_paginas()))
+        finally:
+            documento.cerrar()
+    megabytes = sum(len(texto) for texto in paginas_crudas) / 1024 / 1024
+    segundos, _ = _medir(lambda: [_normalizar_texto_pagina(texto) for texto in paginas_crudas], repeticiones)
+    resultados["normalizacion_mb_por_s"] = {"valor": megabytes / segundos, "mayor_es_mejor": True}
+
+    # Serialización del cuerpo del envío, como en enviar_analisis_rag
+    todos = [texto for lista in textos.values() for texto in lista]
+    megabytes = sum(len(texto) for texto in todos) / 1024 / 1024
+
+    def serializar():
+        for numero, texto in enumerate(todos):
+            _consumir(armar_cuerpo(crear_datos(numero, texto, len(texto), "benchmark")))
+
+    segundos, _ = _medir(serializar, repeticiones)
+    resultados["serializacion_mb_por_s"] = {"valor": megabytes / segundos, "mayor_es_mejor": True}
+
+    # Serialización y compresión con gzip, como se envía, y cuánto se reduce
+    def comprimir() -> int:
+        enviados = 0
+        for numero, texto in enumerate(todos):
+            cuerpo, _ = preparar_cuerpo(crear_datos(numero, texto, len(texto), "benchmark"), comprimir=True)
+            enviados += len(cuerpo) if isinstance(cuerpo, bytes) else sum(len(bloque) for bloque in cuerpo)
+        return enviados
+
+    segundos, enviados = _medir(comprimir, repeticiones)
+    resultados["compresion_mb_por_s"] = {"valor": megabytes / segundos, "mayor_es_mejor": True}
+    resultados["compresion_proporcion"] = {"valor": megabytes * 1024 * 1024 / enviados, "mayor_es_mejor": True}
+
+    # Pico de memoria al extraer y serializar el archivo más grande
+    mas_grande = max((ruta for archivos in corpus.values() for ruta in archivos), key=lambda ruta: ruta.stat().st_size)
+    tracemalloc.start()
+    try:
+        texto = extraer_texto_de_archivo_pdf(str(mas_grande), usar_cache=False)
+        _consumir(armar_cuerpo(crear_datos(0, texto, len(texto), "benchmark")))
+        _, pico = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    resultados["memoria_pico_mb"] = {"valor": pico / 1024 / 1024, "mayor_es_mejor": False}
+
+    # Redondear y agregar los datos del entorno para poder comparar
+    for resultado in resultados.values():
+        resultado["valor"] = round(resultado["valor"], 3)
+    return {
+        "fecha": datetime.now().isoformat(timespec="seconds"),
+        "python": sys.version.split()[0],
+        "plataforma": platform.platform(),
+        "motor_pdf": elegir_motor(),
+        "repeticiones": repeticiones,
+        "resultados": resultados,
+    }
+
+
+def leer_resultados(ruta: Path) -> dict | None:
+    """Leer resultados guardados, entrega None si no existen"""
+    if ruta.exists() is False:
+        return None
+    with open(ruta, encoding="utf8") as puntero:
+        return json.load(puntero)
+
+
+def comparar_con_base(actual: dict, base: dict, umbral: float) -> list[tuple[str, float, float, float]]:
+    """Comparar con la base, entrega (nombre, base, actual, cambio) de cada medida que empeoró más que el umbral"""
+    regresiones = []
+    for nombre, resultado in actual["resultados"].items():
+        if nombre not in base["resultados"] or base["resultados"][nombre]["valor"] == 0:
+            continue
+        valor_base = base["resultados"][nombre]["valor"]
+        cambio = (resultado["valor"] - valor_base) / valor_base
+        empeoro = -cambio if resultado["mayor_es_mejor"] else cambio
+        if empeoro > umbral:
+            regresiones.append((nombre, valor_base, resultado["valor"], cambio))
+    return regresiones
@@ -0,0 +1,124 @@
+"""
+Checkpoints
+"""
+
+import json
+import os
+import re
+import tempfile
+import threading
+from datetime import datetime
+from pathlib import Path
+
+from dotenv import load_dotenv
+
+from .exceptions import MyAnyError
+
+# Cargar las variables de entorno
+load_dotenv()
+CACHE_DIR = os.getenv("CACHE_DIR", str(Path.home() / ".cache" / "pjecz_hercules_cli"))
+
+PUNTOS_CONTROL_DIR = "puntos_control"
+GUARDAR_CADA = 25  # Guardar después de este número de marcas, además de cada vez que avanza el offset
+
+
+def escribir_json_atomico(ruta: Path, datos: dict):
+    """Escribir un archivo JSON en un temporal y reemplazar el original, así nunca queda a medias"""
+    ruta.parent.mkdir(parents=True, exist_ok=True)
+    descriptor, temporal = tempfile.mkstemp(dir=ruta.parent, prefix=ruta.name, suffix=".tmp")
+    try:
+        with os.fdopen(descriptor, "w", encoding="utf8") as puntero:
+            json.dump(datos, puntero)
+            puntero.flush()
+            os.fsync(puntero.fileno())
+        os.replace(temporal, ruta)
+    except BaseException:
+        Path(temporal).unlink(missing_ok=True)
+        raise
+
+
+class PuntoControl:
+    """Diario de avance de un comando para un rango de fechas, para reanudar donde se quedó"""
+
+    def __init__(self, comando: str, creado_desde: str, creado_hasta: str, persistente: bool = True):
+        nombre = re.sub(r"[^0-9A-Za-z_-]+", "_", f"{comando}_{creado_desde}_{creado_hasta}")
+        self.ruta = Path(CACHE_DIR) / PUNTOS_CONTROL_DIR / f"{nombre}.json"
+        self.persistente = persistente
+        self.offset = 0
+        self._hechos = set()
+        self._paginas = {}  # offset -> (limit, ids pendientes, ids de la página)
+        self._candado = threading.Lock()
+        self._sin_guardar = 0
+
+    def cargar(self) -> bool:
+        """Cargar el diario si existe, entrega verdadero si se cargó"""
+        if self.ruta.exists() is False:
+            return False
+        try:
+            with open(self.ruta, encoding="utf8") as puntero:
+                datos = json.load(puntero)
+        except (OSError, ValueError) as error:
+            raise MyAnyError(f"No se pudo leer el punto de control {self.ruta}: {str(error)}") from error
+        self.offset = int(datos["offset"])
+        self._hechos = set(datos["hechos"])
+        return True
+
+    def iniciar_pagina(self, offset: int, limit: int, ids: list[int]) -> set[int]:
+        """Registrar los IDs de una página consultada, entrega los pendientes, sin los hechos en una ejecución anterior"""
+        with self._candado:
+            pendientes = set(ids) - self._hechos
+            self._paginas[offset] = (limit, set(pendientes), set(ids))
+            self._avanzar()
+            return pendientes
+
+    def marcar(self, id: int):
+        """Marcar un ID como procesado y guardar cada tanto"""
+        with self._candado:
+            self._hechos.add(id)
+            for _, pendientes, _ in self._paginas.values():
+                pendientes.discard(id)
+            avanzo = self._avanzar()
+            self._sin_guardar += 1
+            if avanzo or self._sin_guardar >= GUARDAR_CADA:
+                self._guardar()
+
+    def _avanzar(self) -> bool:
+        """Avanzar el offset mientras la primera página pendiente esté completa, entrega verdadero si avanzó"""
+        avanzo = False
+        while self.offset in self._paginas and len(self._paginas[self.offset][1]) == 0:
+            limit, _, ids_pagina = self._paginas.pop(self.offset)
+            # Los IDs de las páginas completas ya no se necesitan porque se reanuda después de ellas
+            self._hechos -= ids_pagina
+            self.offset += limit
+            avanzo = True
+        return avanzo
+
+    def _guardar(self):
+        """Escribir el diario en disco"""
+        self._sin_guardar = 0
+        if self.persistente is False:
+            return
+        escribir_json_atomico(
+            self.ruta,
+            {
+                "offset": self.offset,
+                "hechos": sorted(self._hechos),
+                "actualizado": datetime.now().isoformat(timespec="seconds"),
+            },
+        )
+
+    def esta_completo(self) -> bool:
+        """Entrega verdadero si fueron marcados todos los IDs de las páginas consultadas"""
+        with self._candado:
+            return len(self._paginas) == 0
+
+    def guardar(self):
+        """Escribir el diario en disco"""
+        with self._candado:
+            self._guardar()
+
+    def borrar(self):
+        """Borrar el diario porque ya se terminó"""
+        if self.persistente is False:
+            return
+        self.ruta.unlink(missing_ok=True)
@@ -0,0 +1,48 @@
+"""
+Daemons
+"""
+
+import os
+import signal
+import threading
+import time
+from typing import Callable
+
+from dotenv import load_dotenv
+
+# Cargar las variables de entorno
+load_dotenv()
+VIGILAR_INTERVALO = int(os.getenv("VIGILAR_INTERVALO", "300"))
+
+
+class Vigilante:
+    """Repetir una vuelta cada intervalo hasta recibir SIGTERM o SIGINT, la vuelta en curso se deja terminar"""
+
+    def __init__(self, intervalo: int = VIGILAR_INTERVALO):
+        self.intervalo = max(1, intervalo)
+        self.vueltas = 0
+        self.detener = threading.Event()
+
+    def _al_recibir_senal(self, numero: int, _):
+        """La primera señal pide detenerse al terminar la vuelta, la segunda interrumpe lo que esté haciendo"""
+        if self.detener.is_set():
+            raise KeyboardInterrupt
+        self.detener.set()
+
+    def ejecutar(self, vuelta: Callable[[], None], al_fallar: Callable[[Exception], None] = None):
+        """Ejecutar la vuelta, esperar lo que falte del intervalo y repetir, un error en una vuelta no detiene al vigilante"""
+        anteriores = {numero: signal.signal(numero, self._al_recibir_senal) for numero in (signal.SIGTERM, signal.SIGINT)}
+        try:
+            while self.detener.is_set() is False:
+                inicio = time.monotonic()
+                try:
+                    vuelta()
+                except Exception as error:
+                    if al_fallar is None:
+                        raise
+                    al_fallar(error)
+                self.vueltas += 1
+                self.detener.wait(max(0.0, self.intervalo - (time.monotonic() - inicio)))
+        finally:
+            for numero, anterior in anteriores.items():
+                signal.signal(numero, anterior)
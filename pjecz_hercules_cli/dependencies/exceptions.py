@@ -39,6 +39,10 @@ class MyNotExistsError(MyAnyError):
     """Excepción porque no existe"""
 
 
+class MyNotValidTokenError(MyAuthenticationError):
+    """Excepción porque la API rechazó el token"""
+
+
 class MyOutOfRangeParamError(MyAnyError):
     """Excepción porque un parámetro esta fuera de rango"""
 
@@ -0,0 +1,53 @@
+"""
+Executors
+"""
+
+import collections
+import concurrent.futures
+import multiprocessing
+from typing import Callable, Iterable, Iterator
+
+from .exceptions import MyOutOfRangeParamError
+
+MOTORES = ["hilos", "procesos"]
+
+
+def crear_ejecutor(motor: str, trabajadores: int, tareas_por_proceso: int = 0) -> concurrent.futures.Executor:
+    """Crear el ejecutor de hilos o de procesos, los procesos se reciclan después de tareas_por_proceso (0 = nunca)"""
+    if trabajadores < 1:
+        raise MyOutOfRangeParamError("El número de trabajadores debe ser mayor a cero")
+    if motor == "hilos":
+        return concurrent.futures.ThreadPoolExecutor(max_workers=trabajadores)
+    if motor == "procesos":
+        # Siempre con spawn, quien llama puede tener hilos (consultas, envíos, sqlite) y un fork los copia a medias
+        return concurrent.futures.ProcessPoolExecutor(
+            max_workers=trabajadores,
+            mp_context=multiprocessing.get_context("spawn"),
+            max_tasks_per_child=tareas_por_proceso if tareas_por_proceso > 0 else None,
+        )
+    raise MyOutOfRangeParamError(f"El motor {motor} no es válido, use uno de {', '.join(MOTORES)}")
+
+
+def dividir_en_lotes(elementos: list, tamanio: int) -> list[list]:
+    """Dividir una lista en lotes de un tamaño dado"""
+    if tamanio < 1:
+        raise MyOutOfRangeParamError("El tamaño del lote debe ser mayor a cero")
+    return [elementos[i : i + tamanio] for i in range(0, len(elementos), tamanio)]
+
+
+def mapear_en_orden(
+    executor: concurrent.futures.Executor,
+    funcion: Callable,
+    elementos: Iterable,
+    simultaneas: int,
+) -> Iterator[tuple[object, concurrent.futures.Future]]:
+    """Ejecutar la función con cada elemento, con un máximo de simultaneas en vuelo, entrega (elemento, futuro) en orden"""
+    if simultaneas < 1:
+        raise MyOutOfRangeParamError("El número de simultáneas debe ser mayor a cero")
+    pendientes = collections.deque()
+    for elemento in elementos:
+        pendientes.append((elemento, executor.submit(funcion, elemento)))
+        if len(pendientes) >= simultaneas:
+            yield pendientes.popleft()
+    while pendientes:
+        yield pendientes.popleft()
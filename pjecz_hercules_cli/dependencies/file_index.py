@@ -0,0 +1,204 @@
+"""
+File Index
+"""
+
+import concurrent.futures
+import functools
+import json
+import os
+import posixpath
+import threading
+import time
+from pathlib import Path
+from typing import TYPE_CHECKING
+
+from dotenv import load_dotenv
+
+from . import metrics
+
+# Sólo para las anotaciones, sqlite3 se importa al conectar
+if TYPE_CHECKING:
+    import sqlite3
+
+# Cargar las variables de entorno
+load_dotenv()
+CACHE_DIR = os.getenv("CACHE_DIR", str(Path.home() / ".cache" / "pjecz_hercules_cli"))
+INDICE_HILOS = int(os.getenv("INDICE_HILOS", "16"))
+
+INDICE_ARCHIVO = "indice_archivos.sqlite3"
+
+_local = threading.local()
+
+
+def _conectar() -> "sqlite3.Connection":
+    """Conectar a la base de datos SQLite, una conexión por hilo y por proceso"""
+    conexion = getattr(_local, "conexion", None)
+    if conexion is not None and getattr(_local, "pid", None) == os.getpid():
+        return conexion
+    import sqlite3  # Se importa aquí para que el CLI arranque rápido
+
+    Path(CACHE_DIR).mkdir(parents=True, exist_ok=True)
+    conexion = sqlite3.connect(Path(CACHE_DIR) / INDICE_ARCHIVO, timeout=30, isolation_level=None)
+    conexion.execute("PRAGMA journal_mode=WAL")
+    conexion.execute("PRAGMA synchronous=NORMAL")
+    conexion.execute(
+        "CREATE TABLE IF NOT EXISTS archivos ("
+        "raiz TEXT, directorio TEXT, nombre TEXT, tamanio INTEGER, mtime_ns INTEGER, "
+        "PRIMARY KEY (raiz, directorio, nombre))"
+    )
+    conexion.execute(
+        "CREATE TABLE IF NOT EXISTS directorios ("
+        "raiz TEXT, directorio TEXT, mtime_ns INTEGER, subdirectorios TEXT, PRIMARY KEY (raiz, directorio))"
+    )
+    conexion.execute("CREATE TABLE IF NOT EXISTS raices (raiz TEXT PRIMARY KEY, actualizado REAL, segundos REAL)")
+    _local.conexion = conexion
+    _local.pid = os.getpid()
+    return conexion
+
+
+@functools.cache
+def _obtener_raiz(base_dir: str) -> str:
+    """Obtener la ruta canónica del directorio base, una sola vez por ejecución"""
+    return str(Path(base_dir).resolve())
+
+
+def _revisar_directorio(ruta: str, mtime_ns_conocido: int | None, completo: bool) -> tuple[int, list | None, list | None]:
+    """Revisar un directorio, si no cambió desde la última vez entrega (mtime_ns, None, None) sin listarlo"""
+    mtime_ns = os.stat(ruta).st_mtime_ns
+    if completo is False and mtime_ns == mtime_ns_conocido:
+        return mtime_ns, None, None
+
+    # Listar con os.scandir, que entrega el tipo de cada entrada sin consultarlo aparte
+    archivos, subdirectorios = [], []
+    with os.scandir(ruta) as entradas:
+        for entrada in entradas:
+            try:
+                if entrada.is_dir(follow_symlinks=False):
+                    subdirectorios.append(entrada.name)
+                elif entrada.name.lower().endswith(".pdf") and entrada.is_file():
+                    estado = entrada.stat()
+                    archivos.append((entrada.name, estado.st_size, estado.st_mtime_ns))
+            except OSError:
+                continue  # Se borró mientras se listaba
+    return mtime_ns, archivos, subdirectorios
+
+
+def actualizar_indice(base_dir: str, completo: bool = False, hilos: int = INDICE_HILOS) -> dict:
+    """Recorrer el directorio base con varios hilos y guardar los PDF, sólo se listan los directorios que cambiaron"""
+    raiz = _obtener_raiz(base_dir)
+    if os.path.isdir(raiz) is False:
+        raise FileNotFoundError(f"No existe el directorio {base_dir}")
+    conexion = _conectar()
+    conocidos = {
+        directorio: (mtime_ns, json.loads(subdirectorios))
+        for directorio, mtime_ns, subdirectorios in conexion.execute(
+            "SELECT directorio, mtime_ns, subdirectorios FROM directorios WHERE raiz = ?", (raiz,)
+        )
+    }
+    visitados = set()
+    explorados = 0
+    errores = 0
+    inicio = time.perf_counter()
+
+    def revisar(executor: concurrent.futures.Executor, directorio: str) -> concurrent.futures.Future:
+        """Mandar a revisar un directorio relativo a la raíz"""
+        mtime_ns_conocido = conocidos.get(directorio, (None, []))[0]
+        return executor.submit(_revisar_directorio, os.path.join(raiz, directorio), mtime_ns_conocido, completo)
+
+    # Los hilos consultan el sistema de archivos, que en una unidad de red tarda, y aquí se escribe en SQLite
+    conexion.execute("BEGIN")
+    try:
+        with concurrent.futures.ThreadPoolExecutor(max_workers=max(1, hilos)) as executor:
+            pendientes = {revisar(executor, ""): ""}
+            while pendientes:
+                hechos, _ = concurrent.futures.wait(pendientes, return_when=concurrent.futures.FIRST_COMPLETED)
+                for futuro in hechos:
+                    directorio = pendientes.pop(futuro)
+                    try:
+                        mtime_ns, archivos, subdirectorios = futuro.result()
+                    except FileNotFoundError:
+                        continue  # Ya no existe, se borra al final
+                    except OSError:
+                        # Sin acceso por ahora, se conserva lo que se tenía
+                        errores += 1
+                        mtime_ns, archivos, subdirectorios = None, None, None
+                        if directorio not in conocidos:
+                            continue
+                    visitados.add(directorio)
+                    if archivos is None:
+                        subdirectorios = conocidos[directorio][1]
+                    else:
+                        explorados += 1
+                        conexion.execute("DELETE FROM archivos WHERE raiz = ? AND directorio = ?", (raiz, directorio))
+                        conexion.executemany(
+                            "INSERT INTO archivos (raiz, directorio, nombre, tamanio, mtime_ns) VALUES (?, ?, ?, ?, ?)",
+                            [(raiz, directorio, nombre, tamanio, mtime) for nombre, tamanio, mtime in archivos],
+                        )
+                        conexion.execute(
+                            "INSERT OR REPLACE INTO directorios (raiz, directorio, mtime_ns, subdirectorios) VALUES (?, ?, ?, ?)",
+                            (raiz, directorio, mtime_ns, json.dumps(subdirectorios)),
+                        )
+                    for subdirectorio in subdirectorios:
+                        hijo = posixpath.join(directorio, subdirectorio) if directorio else subdirectorio
+                        pendientes[revisar(executor, hijo)] = hijo
+
+        # Borrar los directorios que ya no existen
+        for directorio in set(conocidos) - visitados:
+            conexion.execute("DELETE FROM archivos WHERE raiz = ? AND directorio = ?", (raiz, directorio))
+            conexion.execute("DELETE FROM directorios WHERE raiz = ? AND directorio = ?", (raiz, directorio))
+        segundos = time.perf_counter() - inicio
+        conexion.execute(
+            "INSERT OR REPLACE INTO raices (raiz, actualizado, segundos) VALUES (?, ?, ?)", (raiz, time.time(), segundos)
+        )
+        conexion.execute("COMMIT")
+    except BaseException:
+        conexion.execute("ROLLBACK")
+        raise
+    return {
+        "raiz": raiz,
+        "directorios": len(visitados),
+        "explorados": explorados,
+        "borrados": len(set(conocidos) - visitados),
+        "errores": errores,
+        "segundos": segundos,
+        **obtener_estadisticas(base_dir),
+    }
+
+
+def obtener_estadisticas(base_dir: str) -> dict | None:
+    """Obtener cuántos archivos y bytes tiene el índice y cuándo se actualizó, entrega None si no se ha creado"""
+    raiz = _obtener_raiz(base_dir)
+    conexion = _conectar()
+    renglon = conexion.execute("SELECT actualizado FROM raices WHERE raiz = ?", (raiz,)).fetchone()
+    if renglon is None:
+        return None
+    archivos, bytes_total = conexion.execute(
+        "SELECT COUNT(*), COALESCE(SUM(tamanio), 0) FROM archivos WHERE raiz = ?", (raiz,)
+    ).fetchone()
+    return {"archivos": archivos, "bytes": bytes_total, "actualizado": renglon[0]}
+
+
+def listar_archivos(base_dir: str) -> list[str]:
+    """Listar las rutas de todos los archivos del índice del directorio base, sin consultar la unidad de red"""
+    raiz = _obtener_raiz(base_dir)
+    renglones = _conectar().execute("SELECT directorio, nombre FROM archivos WHERE raiz = ?", (raiz,)).fetchall()
+    return [os.path.join(raiz, directorio, nombre) for directorio, nombre in renglones]
+
+
+def buscar_archivo(base_dir: str, archivo: str) -> tuple[str, int] | None:
+    """Buscar en el índice un archivo dentro del directorio base, entrega su ruta canónica y su tamaño o None"""
+    relativo = os.path.relpath(archivo, base_dir).replace(os.sep, "/")
+    if relativo.startswith("../"):
+        return None
+    directorio, nombre = posixpath.split(relativo)
+    raiz = _obtener_raiz(base_dir)
+    renglon = (
+        _conectar()
+        .execute("SELECT tamanio FROM archivos WHERE raiz = ? AND directorio = ? AND nombre = ?", (raiz, directorio, nombre))
+        .fetchone()
+    )
+    if renglon is None:
+        metrics.contar("indice_fallos")
+        return None
+    metrics.contar("indice_aciertos")
+    return os.path.join(raiz, relativo), renglon[0]
@@ -0,0 +1,189 @@
+"""
+Metrics
+"""
+
+import contextlib
+import math
+import os
+import tempfile
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Callable
+
+from dotenv import load_dotenv
+
+from .checkpoints import escribir_json_atomico
+
+# Cargar las variables de entorno
+load_dotenv()
+CACHE_DIR = os.getenv("CACHE_DIR", str(Path.home() / ".cache" / "pjecz_hercules_cli"))
+METRICAS_DIR = os.getenv("METRICAS_DIR", str(Path(CACHE_DIR) / "metricas"))
+PROMETHEUS_TEXTFILE_DIR = os.getenv("PROMETHEUS_TEXTFILE_DIR", "")
+
+PERCENTILES = (50, 95, 99)
+
+_local = threading.local()
+_candado = threading.Lock()
+_tiempos = {}  # etapa -> lista de segundos
+_contadores = {}  # nombre -> valor
+
+
+def calcular_percentil(valores: list[float], percentil: float) -> float:
+    """Calcular el percentil por rango más cercano, entrega 0 si no hay valores"""
+    if len(valores) == 0:
+        return 0.0
+    ordenados = sorted(valores)
+    posicion = max(1, math.ceil(percentil / 100 * len(ordenados)))
+    return ordenados[posicion - 1]
+
+
+def calcular_percentiles(valores: list[float], percentiles: tuple = PERCENTILES) -> dict[str, float]:
+    """Calcular varios percentiles, entrega un diccionario como {"p50": ..., "p95": ..., "p99": ...}"""
+    ordenados = sorted(valores)
+    return {f"p{percentil}": calcular_percentil(ordenados, percentil) for percentil in percentiles}
+
+
+def _destino() -> tuple[dict, dict]:
+    """Entregar dónde se registra, en la captura del hilo si la hay o en los registros de la ejecución"""
+    captura = getattr(_local, "captura", None)
+    if captura is not None:
+        return captura["tiempos"], captura["contadores"]
+    return _tiempos, _contadores
+
+
+def registrar(etapa: str, segundos: float):
+    """Registrar lo que tardó una vez la etapa"""
+    tiempos, _ = _destino()
+    with _candado:
+        tiempos.setdefault(etapa, []).append(segundos)
+
+
+def contar(nombre: str, valor: float = 1):
+    """Sumar al contador, como bytes o tokens procesados"""
+    _, contadores = _destino()
+    with _candado:
+        contadores[nombre] = contadores.get(nombre, 0) + valor
+
+
+@contextlib.contextmanager
+def medir(etapa: str):
+    """Registrar lo que tarda el bloque, aunque termine con una excepción"""
+    inicio = time.perf_counter()
+    try:
+        yield
+    finally:
+        registrar(etapa, time.perf_counter() - inicio)
+
+
+def capturar(funcion: Callable, *args, **kwargs) -> tuple[object, dict]:
+    """Ejecutar la función guardando aparte sus medidas, entrega (resultado, medidas) para juntarlas desde otro proceso"""
+    _local.captura = {"tiempos": {}, "contadores": {}}
+    try:
+        resultado = funcion(*args, **kwargs)
+    finally:
+        captura, _local.captura = _local.captura, None
+    return resultado, captura
+
+
+def juntar(captura: dict):
+    """Agregar las medidas que entregó capturar a las de esta ejecución"""
+    with _candado:
+        for etapa, segundos in captura["tiempos"].items():
+            _tiempos.setdefault(etapa, []).extend(segundos)
+        for nombre, valor in captura["contadores"].items():
+            _contadores[nombre] = _contadores.get(nombre, 0) + valor
+
+
+def reiniciar():
+    """Borrar las medidas de esta ejecución"""
+    with _candado:
+        _tiempos.clear()
+        _contadores.clear()
+
+
+def resumir(comando: str, segundos: float, documentos: int) -> dict:
+    """Resumir la ejecución, con los percentiles en segundos de cada etapa, los contadores y las tasas por segundo"""
+    with _candado:
+        tiempos = {etapa: list(valores) for etapa, valores in _tiempos.items()}
+        contadores = dict(_contadores)
+    etapas = {}
+    for etapa, valores in sorted(tiempos.items()):
+        percentiles = calcular_percentiles(valores)
+        etapas[etapa] = {"cantidad": len(valores), "segundos": round(sum(valores), 6)}
+        etapas[etapa].update({nombre: round(valor, 6) for nombre, valor in percentiles.items()})
+    return {
+        "comando": comando,
+        "fecha": datetime.now().isoformat(timespec="seconds"),
+        "segundos": round(segundos, 3),
+        "documentos": documentos,
+        "documentos_por_segundo": round(documentos / segundos, 3) if segundos > 0 else 0.0,
+        "tokens_por_segundo": round(contadores.get("tokens", 0) / segundos, 3) if segundos > 0 else 0.0,
+        "etapas": etapas,
+        "contadores": contadores,
+    }
+
+
+def formatear_prometheus(resumen: dict) -> str:
+    """Formatear el resumen para el textfile collector de node exporter"""
+    comando = resumen["comando"]
+    renglones = [
+        "# HELP hercules_etapa_segundos Duración de cada vez que se ejecutó la etapa",
+        "# TYPE hercules_etapa_segundos summary",
+    ]
+    for etapa, medida in resumen["etapas"].items():
+        etiquetas = f'comando="{comando}",etapa="{etapa}"'
+        for percentil in PERCENTILES:
+            renglones.append(f'hercules_etapa_segundos{{{etiquetas},quantile="{percentil / 100}"}} {medida[f"p{percentil}"]}')
+        renglones.append(f"hercules_etapa_segundos_sum{{{etiquetas}}} {medida['segundos']}")
+        renglones.append(f"hercules_etapa_segundos_count{{{etiquetas}}} {medida['cantidad']}")
+    for nombre, valor in sorted(resumen["contadores"].items()):
+        renglones.append(f"# TYPE hercules_{nombre} gauge")
+        renglones.append(f'hercules_{nombre}{{comando="{comando}"}} {valor}')
+    for nombre in ("segundos", "documentos", "documentos_por_segundo", "tokens_por_segundo"):
+        renglones.append(f"# TYPE hercules_ejecucion_{nombre} gauge")
+        renglones.append(f'hercules_ejecucion_{nombre}{{comando="{comando}"}} {resumen[nombre]}')
+    renglones.append("# TYPE hercules_ejecucion_fin_timestamp_seconds gauge")
+    renglones.append(f'hercules_ejecucion_fin_timestamp_seconds{{comando="{comando}"}} {int(time.time())}')
+    return "\n".join(renglones) + "\n"
+
+
+def _escribir_texto_atomico(ruta: Path, texto: str):
+    """Escribir un archivo de texto en un temporal y reemplazar el original, node exporter no debe leerlo a medias"""
+    ruta.parent.mkdir(parents=True, exist_ok=True)
+    descriptor, temporal = tempfile.mkstemp(dir=ruta.parent, prefix=f".{ruta.name}", suffix=".tmp")
+    try:
+        with os.fdopen(descriptor, "w", encoding="utf8") as puntero:
+            puntero.write(texto)
+        os.chmod(temporal, 0o644)
+        os.replace(temporal, ruta)
+    except BaseException:
+        Path(temporal).unlink(missing_ok=True)
+        raise
+
+
+def publicar(comando: str, segundos: float, documentos: int) -> tuple[dict, list[Path]]:
+    """Guardar el resumen en JSON en METRICAS_DIR y en PROMETHEUS_TEXTFILE_DIR si está definido, entrega el resumen y las rutas"""
+    resumen = resumir(comando, segundos, documentos)
+    rutas = [Path(METRICAS_DIR) / f"{comando}.json"]
+    escribir_json_atomico(rutas[0], resumen)
+    if PROMETHEUS_TEXTFILE_DIR:
+        rutas.append(Path(PROMETHEUS_TEXTFILE_DIR) / f"hercules_{comando}.prom")
+        _escribir_texto_atomico(rutas[-1], formatear_prometheus(resumen))
+    return resumen, rutas
+
+
+def resumir_renglones(resumen: dict) -> list[str]:
+    """Entregar un renglón por etapa y uno con las tasas, para mostrar al terminar"""
+    renglones = []
+    for etapa, medida in resumen["etapas"].items():
+        renglones.append(
+            f"{etapa}: {medida['cantidad']} veces, {medida['segundos']:.2f} s en total, "
+            f"p50 {medida['p50'] * 1000:.0f} ms, p95 {medida['p95'] * 1000:.0f} ms, p99 {medida['p99'] * 1000:.0f} ms"
+        )
+    renglones.append(
+        f"{resumen['documentos']} documentos en {resumen['segundos']:.1f} s = {resumen['documentos_por_segundo']:.2f} docs/s, "
+        f"{resumen['tokens_por_segundo']:.1f} tokens/s"
+    )
+    return renglones
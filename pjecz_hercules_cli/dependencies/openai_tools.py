@@ -0,0 +1,241 @@
+"""
+OpenAI Tools
+"""
+
+import concurrent.futures
+import functools
+import json
+import os
+import threading
+import time
+from typing import TYPE_CHECKING, Callable
+
+from dotenv import load_dotenv
+
+from . import metrics, synthesis_cache
+from .exceptions import MyAnyError
+
+# Sólo para las anotaciones, openai tarda en importarse y se importa al crear el cliente
+if TYPE_CHECKING:
+    from openai import OpenAI
+
+# Cargar las variables de entorno
+load_dotenv()
+OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
+OPENAI_ENDPOINT = os.getenv("OPENAI_ENDPOINT")
+OPENAI_MODEL = os.getenv("OPENAI_MODEL")
+OPENAI_ORG_ID = os.getenv("OPENAI_ORG_ID")
+OPENAI_PROJECT_ID = os.getenv("OPENAI_PROJECT_ID")
+OPENAI_PROMPT = os.getenv("OPENAI_PROMPT")
+OPENAI_PROMPT_REDUCIR = os.getenv("OPENAI_PROMPT_REDUCIR") or OPENAI_PROMPT
+OPENAI_UMBRAL_TOKENS = int(os.getenv("OPENAI_UMBRAL_TOKENS", "6000"))
+OPENAI_FRAGMENTO_TOKENS = int(os.getenv("OPENAI_FRAGMENTO_TOKENS", "3000"))
+OPENAI_TRASLAPE_TOKENS = int(os.getenv("OPENAI_TRASLAPE_TOKENS", "200"))
+OPENAI_FRAGMENTOS_SIMULTANEOS = int(os.getenv("OPENAI_FRAGMENTOS_SIMULTANEOS", "4"))
+CARACTERES_POR_TOKEN = float(os.getenv("CARACTERES_POR_TOKEN", "4"))
+
+# Limita las solicitudes en vuelo de todo el proceso, incluyendo las de los fragmentos
+_semaforo = threading.BoundedSemaphore(64)
+
+
+def configurar_simultaneas(simultaneas: int):
+    """Definir el máximo de solicitudes a OpenAI en vuelo en todo el proceso"""
+    global _semaforo
+    _semaforo = threading.BoundedSemaphore(max(1, simultaneas))
+
+
+@functools.cache
+def crear_cliente_openai() -> "OpenAI":
+    """Crear el cliente de OpenAI una vez por proceso, se comparte entre hilos y entre las vueltas de vigilar"""
+    from openai import OpenAI
+
+    return OpenAI(
+        api_key=OPENAI_API_KEY,
+        base_url=OPENAI_ENDPOINT,
+        organization=OPENAI_ORG_ID,
+        project=OPENAI_PROJECT_ID,
+        timeout=60,
+    )
+
+
+def estimar_tokens(texto: str) -> int:
+    """Estimar el número de tokens de un texto por su longitud"""
+    return int(len(texto) / CARACTERES_POR_TOKEN) + 1
+
+
+def dividir_en_fragmentos(texto: str, fragmento_tokens: int, traslape_tokens: int) -> list[str]:
+    """Dividir el texto en fragmentos de hasta fragmento_tokens, cortando en fin de oración o espacio, con traslape"""
+    maximo = max(1, int(fragmento_tokens * CARACTERES_POR_TOKEN))
+    traslape = min(int(traslape_tokens * CARACTERES_POR_TOKEN), maximo // 2)
+    fragmentos = []
+    inicio = 0
+    while inicio < len(texto):
+        fin = min(inicio + maximo, len(texto))
+        if fin < len(texto):
+            # Preferir cortar después de un punto, si no en un espacio, en la segunda mitad del fragmento
+            corte = texto.rfind(". ", inicio + maximo // 2, fin)
+            if corte == -1:
+                corte = texto.rfind(" ", inicio + maximo // 2, fin)
+            if corte != -1:
+                fin = corte + 1
+        fragmentos.append(texto[inicio:fin].strip())
+        if fin >= len(texto):
+            break
+        # El siguiente fragmento empieza antes del corte, en el inicio de una palabra
+        siguiente = max(fin - traslape, inicio + 1)
+        espacio = texto.find(" ", siguiente, fin)
+        inicio = espacio + 1 if espacio != -1 else siguiente
+    return [fragmento for fragmento in fragmentos if fragmento != ""]
+
+
+def completar(open_ai: "OpenAI", prompt: str, texto: str) -> tuple[str, int, str]:
+    """Enviar el prompt y el texto a OpenAI, entrega la respuesta, el total de tokens y el modelo"""
+
+    # Definir los mensajes a enviar a OpenAI
+    mensajes = [
+        {"role": "system", "content": prompt},
+        {"role": "user", "content": texto},
+    ]
+
+    # Enviar a OpenAI el texto
+    try:
+        with _semaforo, metrics.medir("openai"):
+            chat_response = open_ai.chat.completions.create(
+                model=OPENAI_MODEL,
+                messages=mensajes,
+                stream=False,
+            )
+    except Exception as error:
+        raise MyAnyError(f"Error al sintetizar: {str(error)}") from error
+    respuesta = chat_response.choices[0].message.content
+    # Si el servidor no entrega el uso, los tokens se estiman con los caracteres
+    if chat_response.usage is not None:
+        tokens = chat_response.usage.total_tokens
+        metrics.contar("tokens_entrada", chat_response.usage.prompt_tokens)
+        metrics.contar("tokens_salida", chat_response.usage.completion_tokens)
+    else:
+        tokens = estimar_tokens(prompt) + estimar_tokens(texto) + estimar_tokens(respuesta or "")
+    metrics.contar("tokens", tokens)
+    return respuesta, tokens, chat_response.model
+
+
+def preguntar_en_flujo(open_ai: "OpenAI", mensajes: list[dict], al_recibir: Callable[[str], None]) -> dict:
+    """Enviar los mensajes a OpenAI con stream, llamar a al_recibir con cada fragmento, entrega las métricas de latencia"""
+    from openai import BadRequestError
+
+    # Pedir el uso de tokens al final del flujo, si el servidor no lo acepta, se estima con los caracteres
+    inicio = time.perf_counter()
+    try:
+        try:
+            flujo = open_ai.chat.completions.create(
+                model=OPENAI_MODEL,
+                messages=mensajes,
+                stream=True,
+                stream_options={"include_usage": True},
+            )
+        except BadRequestError:
+            flujo = open_ai.chat.completions.create(
+                model=OPENAI_MODEL,
+                messages=mensajes,
+                stream=True,
+            )
+
+        # Recibir los fragmentos
+        primer_token = None
+        respuesta = []
+        uso = None
+        modelo = OPENAI_MODEL
+        for pedazo in flujo:
+            modelo = pedazo.model or modelo
+            if pedazo.usage is not None:
+                uso = pedazo.usage
+            if len(pedazo.choices) == 0 or not pedazo.choices[0].delta.content:
+                continue
+            if primer_token is None:
+                primer_token = time.perf_counter()
+            respuesta.append(pedazo.choices[0].delta.content)
+            al_recibir(pedazo.choices[0].delta.content)
+    except Exception as error:
+        raise MyAnyError(f"Error al preguntar: {str(error)}") from error
+    fin = time.perf_counter()
+
+    # Calcular las métricas, los tokens por segundo se miden desde el primer token
+    if primer_token is None:
+        primer_token = fin
+    tokens = uso.completion_tokens if uso is not None else estimar_tokens("".join(respuesta))
+    generacion = fin - primer_token
+    return {
+        "respuesta": "".join(respuesta),
+        "modelo": modelo,
+        "tiempo_primer_token": primer_token - inicio,
+        "tiempo_total": fin - inicio,
+        "tokens": tokens,
+        "tokens_estimados": uso is None,
+        "tokens_por_segundo": tokens / generacion if generacion > 0 else 0.0,
+    }
+
+
+def sintetizar_por_fragmentos(open_ai: "OpenAI", texto: str, nivel: int = 1) -> tuple[str, int, str]:
+    """Sintetizar un texto largo: sintetizar cada fragmento en paralelo y luego sintetizar las síntesis"""
+
+    # Mapear: sintetizar cada fragmento
+    fragmentos = dividir_en_fragmentos(texto, OPENAI_FRAGMENTO_TOKENS, OPENAI_TRASLAPE_TOKENS)
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max(1, OPENAI_FRAGMENTOS_SIMULTANEOS)) as executor:
+        resultados = list(executor.map(lambda fragmento: completar(open_ai, OPENAI_PROMPT, fragmento), fragmentos))
+    tokens_total = sum(tokens for _, tokens, _ in resultados)
+    sintesis_parciales = "\n\n".join(sintesis for sintesis, _, _ in resultados)
+
+    # Reducir: si las síntesis parciales siguen siendo largas, se vuelven a dividir, hasta tres niveles
+    if estimar_tokens(sintesis_parciales) > OPENAI_UMBRAL_TOKENS and len(fragmentos) > 1 and nivel < 3:
+        sintesis, tokens, modelo = sintetizar_por_fragmentos(open_ai, sintesis_parciales, nivel + 1)
+    else:
+        sintesis, tokens, modelo = completar(open_ai, OPENAI_PROMPT_REDUCIR, sintesis_parciales)
+    return sintesis, tokens_total + tokens, modelo
+
+
+@functools.cache
+def obtener_configuracion_sintesis() -> str:
+    """Entregar en JSON lo que además del modelo y el texto cambia la síntesis, para la llave de la cache"""
+    return json.dumps(
+        {
+            "prompt": OPENAI_PROMPT,
+            "prompt_reducir": OPENAI_PROMPT_REDUCIR,
+            "umbral_tokens": OPENAI_UMBRAL_TOKENS,
+            "fragmento_tokens": OPENAI_FRAGMENTO_TOKENS,
+            "traslape_tokens": OPENAI_TRASLAPE_TOKENS,
+            "caracteres_por_token": CARACTERES_POR_TOKEN,
+        },
+        sort_keys=True,
+    )
+
+
+def sintetizar_texto(open_ai: "OpenAI", texto: str, usar_cache: bool = True) -> tuple[str, int, str]:
+    """Sintetizar un texto con OpenAI, entrega la síntesis, el total de tokens y el modelo"""
+
+    # Si ya se sintetizó el mismo texto con el mismo modelo, prompts y fragmentación, entregarlo sin llamar a OpenAI
+    configuracion = obtener_configuracion_sintesis()
+    if usar_cache:
+        import sqlite3  # Se importa aquí para que el CLI arranque rápido
+
+        try:
+            guardada = synthesis_cache.obtener_sintesis(OPENAI_MODEL, configuracion, texto)
+        except sqlite3.Error:
+            guardada = None  # Si falla la cache, se sintetiza como siempre
+        if guardada is not None:
+            return guardada
+
+    # Si el texto rebasa el umbral, se sintetiza por fragmentos, si no, de una vez
+    if estimar_tokens(texto) > OPENAI_UMBRAL_TOKENS:
+        sintesis, tokens_total, modelo = sintetizar_por_fragmentos(open_ai, texto)
+    else:
+        sintesis, tokens_total, modelo = completar(open_ai, OPENAI_PROMPT, texto)
+
+    # Guardar en la cache
+    if usar_cache and sintesis:
+        try:
+            synthesis_cache.guardar_sintesis(OPENAI_MODEL, configuracion, texto, sintesis, tokens_total, modelo)
+        except sqlite3.Error:
+            pass
+
+    # Entregar la síntesis, el total de tokens y el modelo
+    return sintesis, tokens_total, modelo
@@ -0,0 +1,166 @@
+"""
+PDF Backends
+"""
+
+from abc import ABC, abstractmethod
+import functools
+import importlib.util
+import io
+import json
+import os
+from pathlib import Path
+from typing import Iterator
+
+from dotenv import load_dotenv
+
+from .exceptions import MyMissingConfigurationError, MyOutOfRangeParamError
+
+# Cargar las variables de entorno
+load_dotenv()
+CACHE_DIR = os.getenv("CACHE_DIR", str(Path.home() / ".cache" / "pjecz_hercules_cli"))
+PDF_MOTOR = os.getenv("PDF_MOTOR", "automatico")
+
+CALIBRACION_ARCHIVO = "calibracion_pdf.json"
+MOTOR_POR_DEFECTO = "pypdf"
+
+
+class MotorPdf(ABC):
+    """Motor para extraer el texto de las páginas de un archivo PDF"""
+
+    nombre = ""
+    modulo = ""  # Módulo que debe estar instalado para usar este motor
+
+    def __init__(self, archivo: str, datos: bytes = None):
+        self.archivo = archivo
+        self.datos = datos  # El contenido si ya se leyó por adelantado, así no se vuelve a leer del disco
+
+    def _abrir(self) -> str | io.BytesIO:
+        """Entregar el contenido en memoria si se tiene, si no la ruta al archivo"""
+        return io.BytesIO(self.datos) if self.datos is not None else self.archivo
+
+    @abstractmethod
+    def contar_paginas(self) -> int:
+        """Entregar el número de páginas"""
+
+    @abstractmethod
+    def iterar_paginas(self, inicio: int, fin: int) -> Iterator[str]:
+        """Entregar el texto de cada página de inicio a fin (sin incluir), una página a la vez"""
+
+    def cerrar(self):
+        """Liberar el archivo"""
+
+
+class MotorPypdf(MotorPdf):
+    """Motor con pypdf, puro Python, siempre disponible"""
+
+    nombre = "pypdf"
+    modulo = "pypdf"
+
+    def __init__(self, archivo: str, datos: bytes = None):
+        super().__init__(archivo, datos)
+        from pypdf import PdfReader
+
+        self.lector = PdfReader(self._abrir())
+
+    def contar_paginas(self) -> int:
+        return len(self.lector.pages)
+
+    def iterar_paginas(self, inicio: int, fin: int) -> Iterator[str]:
+        for numero in range(inicio, fin):
+            yield self.lector.pages[numero].extract_text()
+
+
+class MotorPdfium(MotorPdf):
+    """Motor con pypdfium2, usa la biblioteca PDFium de Chromium"""
+
+    nombre = "pdfium"
+    modulo = "pypdfium2"
+
+    def __init__(self, archivo: str, datos: bytes = None):
+        super().__init__(archivo, datos)
+        import pypdfium2
+
+        self.documento = pypdfium2.PdfDocument(datos if datos is not None else archivo)
+
+    def contar_paginas(self) -> int:
+        return len(self.documento)
+
+    def iterar_paginas(self, inicio: int, fin: int) -> Iterator[str]:
+        for numero in range(inicio, fin):
+            pagina = self.documento[numero]
+            texto_pagina = pagina.get_textpage()
+            try:
+                yield texto_pagina.get_text_range()
+            finally:
+                texto_pagina.close()
+                pagina.close()
+
+    def cerrar(self):
+        self.documento.close()
+
+
+class MotorPdfminer(MotorPdf):
+    """Motor con pdfminer.six"""
+
+    nombre = "pdfminer"
+    modulo = "pdfminer"
+
+    def contar_paginas(self) -> int:
+        from pdfminer.pdfpage import PDFPage
+
+        if self.datos is not None:
+            return sum(1 for _ in PDFPage.get_pages(io.BytesIO(self.datos)))
+        with open(self.archivo, "rb") as puntero:
+            return sum(1 for _ in PDFPage.get_pages(puntero))
+
+    def iterar_paginas(self, inicio: int, fin: int) -> Iterator[str]:
+        from pdfminer.high_level import extract_pages
+        from pdfminer.layout import LTTextContainer
+
+        # pdfminer analiza una página a la vez, se juntan sus bloques de texto
+        for pagina in extract_pages(self._abrir(), page_numbers=range(inicio, fin)):
+            yield "".join(elemento.get_text() for elemento in pagina if isinstance(elemento, LTTextContainer))
+
+
+MOTORES_PDF = {motor.nombre: motor for motor in (MotorPypdf, MotorPdfium, MotorPdfminer)}
+
+
+@functools.cache
+def obtener_motores_disponibles() -> list[str]:
+    """Entregar los nombres de los motores cuyos módulos están instalados"""
+    return [nombre for nombre, motor in MOTORES_PDF.items() if importlib.util.find_spec(motor.modulo) is not None]
+
+
+@functools.cache
+def _elegir_motor_automatico() -> str:
+    """Elegir el más rápido de la calibración, se lee una vez por proceso"""
+    calibracion = leer_calibracion()
+    if calibracion is not None and calibracion.get("seleccionado") in obtener_motores_disponibles():
+        return calibracion["seleccionado"]
+    return MOTOR_POR_DEFECTO
+
+
+def leer_calibracion() -> dict | None:
+    """Leer el resultado de la última calibración, entrega None si no hay"""
+    try:
+        with open(Path(CACHE_DIR) / CALIBRACION_ARCHIVO, encoding="utf8") as puntero:
+            return json.load(puntero)
+    except (OSError, ValueError):
+        return None
+
+
+def elegir_motor(nombre: str = None) -> str:
+    """Elegir el motor por nombre, por PDF_MOTOR o, si es automatico, el más rápido de la calibración"""
+    nombre = nombre or PDF_MOTOR
+    if nombre == "automatico":
+        return _elegir_motor_automatico()
+    if nombre not in MOTORES_PDF:
+        raise MyOutOfRangeParamError(f"El motor PDF {nombre} no es válido, use uno de {', '.join(MOTORES_PDF)}")
+    if nombre not in obtener_motores_disponibles():
+        raise MyMissingConfigurationError(f"El motor PDF {nombre} requiere instalar {MOTORES_PDF[nombre].modulo}")
+    return nombre
+
+
+def abrir_pdf(archivo: str, motor: str, datos: bytes = None) -> MotorPdf:
+    """Abrir el archivo PDF con el motor, con datos se usa el contenido ya leído en lugar de leer el archivo"""
+    return MOTORES_PDF[motor](archivo, datos)
@@ -2,28 +2,303 @@
 PDF Tools
 """
 
+import concurrent.futures
+import functools
+import io
+import multiprocessing
+import os
 from pathlib import Path
+import stat
+import time
+from typing import Iterator
 
-from pypdf import PdfReader
+from dotenv import load_dotenv
 
+from . import metrics, text_cache
+from .checkpoints import escribir_json_atomico
 from .exceptions import MyAnyError, MyFileNotFoundError, MyFileNotAllowedError
+from .executors import mapear_en_orden
+from .pdf_backends import CACHE_DIR, CALIBRACION_ARCHIVO, MOTOR_POR_DEFECTO, abrir_pdf, elegir_motor
+from .pipelines import PresupuestoBytes
 
+# Cargar las variables de entorno
+load_dotenv()
+PDF_PAGINAS_PARALELO = int(os.getenv("PDF_PAGINAS_PARALELO", "0"))
+PDF_TRABAJADORES_PAGINAS = int(os.getenv("PDF_TRABAJADORES_PAGINAS", str(os.cpu_count() or 1)))
+PDF_MAXIMO_PAGINAS = int(os.getenv("PDF_MAXIMO_PAGINAS", "2000"))
+PDF_MAXIMO_CARACTERES = int(os.getenv("PDF_MAXIMO_CARACTERES", "2000000"))
+PDF_LEER_ADELANTE_MB = int(os.getenv("PDF_LEER_ADELANTE_MB", "256"))
+PDF_LECTORES = int(os.getenv("PDF_LECTORES", "4"))
 
-def extraer_texto_de_archivo_pdf(archivo: str) -> str:
-    """Extraer el texto de un archivo PDF"""
+
+def _normalizar_texto_pagina(texto: str) -> str:
+    """Quitar los avances de línea y los espacios repetidos del texto de una página"""
+    return " ".join(texto.replace("\n", " ").split())
+
+
+def _extraer_rango_paginas(motor: str, archivo: str, rango: tuple[int, int]) -> list[str]:
+    """Extraer el texto de las páginas del rango (inicio, fin sin incluir), se ejecuta en otro proceso"""
+    documento = abrir_pdf(archivo, motor)
+    try:
+        return [_normalizar_texto_pagina(texto) for texto in documento.iterar_paginas(*rango)]
+    finally:
+        documento.cerrar()
+
+
+def _iterar_paginas_en_paralelo(motor: str, archivo: str, total_paginas: int, trabajadores: int) -> Iterator[str]:
+    """Repartir las páginas en rangos entre procesos y entregar sus textos en el orden de las páginas"""
+    # Más rangos que trabajadores para que uno lento no retrase a los demás
+    tamanio = max(1, -(-total_paginas // (trabajadores * 4)))
+    rangos = [(inicio, min(inicio + tamanio, total_paginas)) for inicio in range(0, total_paginas, tamanio)]
+    # Con spawn porque quien llama puede tener hilos, como las etapas de analizar
+    executor = concurrent.futures.ProcessPoolExecutor(
+        max_workers=min(trabajadores, len(rangos)),
+        mp_context=multiprocessing.get_context("spawn"),
+    )
+    try:
+        # Con un máximo de rangos en vuelo, para no acumular los textos de todo el documento
+        funcion = functools.partial(_extraer_rango_paginas, motor, archivo)
+        for _, futuro in mapear_en_orden(executor, funcion, rangos, trabajadores * 2):
+            yield from futuro.result()
+    finally:
+        executor.shutdown(wait=True, cancel_futures=True)
+
+
+def iterar_textos_paginas(
+    archivo: str,
+    motor: str = None,
+    maximo_paginas: int = PDF_MAXIMO_PAGINAS,
+    datos: bytes = None,
+) -> Iterator[str]:
+    """Entregar el texto de cada página, una a la vez, hasta maximo_paginas (0 = sin límite)"""
+    motor = elegir_motor(motor)
+    documento = abrir_pdf(archivo, motor, datos)
+    try:
+        total_paginas = documento.contar_paginas()
+        if 0 < maximo_paginas < total_paginas:
+            total_paginas = maximo_paginas
+        # Con PDF_PAGINAS_PARALELO los archivos con muchas páginas se reparten entre procesos, es para extraer pocos
+        # archivos grandes; no se usa con los datos leídos por adelantado porque cada proceso volvería a abrir la ruta
+        en_paralelo = 0 < PDF_PAGINAS_PARALELO <= total_paginas and PDF_TRABAJADORES_PAGINAS > 1 and datos is None
+        if en_paralelo is False:
+            for texto in documento.iterar_paginas(0, total_paginas):
+                yield _normalizar_texto_pagina(texto)
+    finally:
+        documento.cerrar()
+    if en_paralelo:
+        yield from _iterar_paginas_en_paralelo(motor, archivo, total_paginas, PDF_TRABAJADORES_PAGINAS)
+
+
+def extraer_texto_de_archivo_pdf(
+    archivo: str,
+    usar_cache: bool = True,
+    motor: str = None,
+    maximo_paginas: int = PDF_MAXIMO_PAGINAS,
+    maximo_caracteres: int = PDF_MAXIMO_CARACTERES,
+    tamanio: int = None,
+    datos: bytes = None,
+    estado: os.stat_result = None,
+    canonica: bool = False,
+) -> str:
+    """Extraer el texto de un archivo PDF, con usar_cache se reutiliza lo extraído de un archivo con el mismo contenido"""
     ruta = Path(archivo)
-    if ruta.exists() is False or ruta.is_file() is False:
-        raise MyFileNotFoundError("No existe el archivo PDF")
     if ruta.suffix.lower() != ".pdf":
         raise MyFileNotAllowedError("No es un archivo PDF")
-    texto = ""
+
+    # Con el estado del disco, el tamaño del índice de archivos o los datos leídos por adelantado ya se sabe que existe
+    if tamanio is None and estado is not None:
+        tamanio = estado.st_size
+    if tamanio is None and datos is not None:
+        tamanio = len(datos)
+    if tamanio is None:
+        if ruta.exists() is False or ruta.is_file() is False:
+            raise MyFileNotFoundError("No existe el archivo PDF")
+        tamanio = ruta.stat().st_size
+    motor = elegir_motor(motor)
+    metrics.contar("bytes_pdf", tamanio)
+
+    # Si está en la cache, entregarlo sin volver a extraerlo, leer el archivo para su hash es la etapa de E/S
+    llave = None
+    if usar_cache:
+        import sqlite3  # Se importa aquí para que el CLI arranque rápido
+
+        try:
+            # Cada motor y cada límite entregan un texto distinto
+            with metrics.medir("leer_archivo"):
+                hash_archivo = text_cache.obtener_hash_archivo(ruta, datos, estado, canonica)
+                llave = f"{hash_archivo}:{motor}:{maximo_paginas}:{maximo_caracteres}"
+                texto = text_cache.obtener_texto(llave)
+        except (sqlite3.Error, OSError):
+            llave, texto = None, None  # Si falla la cache, se extrae como siempre
+        if texto is not None:
+            metrics.contar("caracteres", len(texto))
+            return texto
+
+    # Extraer el texto página por página, escribiendo cada una en el búfer sin pasar del máximo de caracteres
+    # (0 = sin límite) y dejando de leer al llegar a él, así no se guardan las páginas para juntarlas al final
+    bufer = io.StringIO()
+    paginas_leidas = 0
+    caracteres = 0
     try:
-        lector = PdfReader(ruta)
-        paginas_textos = []
-        for pagina in lector.pages:
-            texto_sin_avances_de_linea = pagina.extract_text().replace("\n", " ")
-            paginas_textos.append(" ".join(texto_sin_avances_de_linea.split()))
-        texto = " ".join(paginas_textos)
+        with metrics.medir("extraer_pdf"):
+            paginas = iterar_textos_paginas(str(ruta), motor, maximo_paginas, datos)
+            try:
+                for pagina_texto in paginas:
+                    if paginas_leidas > 0:
+                        pagina_texto = " " + pagina_texto
+                    paginas_leidas += 1
+                    if maximo_caracteres > 0:
+                        pagina_texto = pagina_texto[: maximo_caracteres - caracteres]
+                    bufer.write(pagina_texto)
+                    caracteres += len(pagina_texto)
+                    if 0 < maximo_caracteres <= caracteres:
+                        break
+            finally:
+                paginas.close()
     except Exception as error:
         raise MyAnyError(error) from error
+    texto = bufer.getvalue()
+    bufer.close()
+    metrics.contar("paginas", paginas_leidas)
+    metrics.contar("caracteres", len(texto))
+
+    # Guardar en la cache
+    if llave is not None:
+        try:
+            text_cache.guardar_texto(llave, texto)
+        except sqlite3.Error:
+            pass
     return texto
+
+
+def analizar_archivo_pdf(
+    id: int,
+    archivo: str,
+    autor: str,
+    usar_cache: bool = True,
+    datos: bytes = None,
+    canonica: bool = False,
+) -> tuple[int, str, int, str]:
+    """Analizar un archivo PDF, entrega el ID, el texto extraído, el tamaño del archivo y el autor"""
+    ruta = Path(archivo)
+    # El tamaño del índice de archivos pudo cambiar si se reemplazó el archivo, con una consulta al disco
+    # se sabe que existe, su tamaño y, para la cache de textos, si cambió
+    try:
+        estado = os.stat(ruta)
+    except OSError:
+        estado = None
+    if estado is None or stat.S_ISREG(estado.st_mode) is False:
+        raise MyAnyError(f"El archivo {ruta} no existe o no es un archivo")
+    if datos is not None and len(datos) != estado.st_size:
+        datos = None  # Cambió después de leerlo por adelantado, se extrae del disco
+    tamanio = estado.st_size
+    try:
+        texto = extraer_texto_de_archivo_pdf(
+            str(ruta), usar_cache, tamanio=tamanio, datos=datos, estado=estado, canonica=canonica
+        )
+    except MyAnyError as error:
+        raise MyAnyError(f"Error al extraer texto del archivo {ruta.name}: {str(error)}") from error
+    if texto.strip() == "":
+        raise MyAnyError(f"El archivo {ruta.name} no tiene texto")
+    return id, texto, tamanio, autor
+
+
+def analizar_lote_archivos_pdf(
+    lote: list[tuple[int, str, str, int | None, bool, bytes | None]],
+    usar_cache: bool = True,
+) -> list[tuple[int, str, int, str, str | None]]:
+    """Analizar un lote de archivos PDF (id, archivo, autor, tamaño, canónica, datos), entrega (id, texto, tamaño, autor, error)"""
+    resultados = []
+    for id, archivo, autor, _, canonica, datos in lote:
+        try:
+            _, texto, archivo_tamanio, _ = analizar_archivo_pdf(id, archivo, autor, usar_cache, datos, canonica)
+        except MyAnyError as error:
+            resultados.append((id, "", 0, autor, str(error)))
+            continue
+        resultados.append((id, texto, archivo_tamanio, autor, None))
+    return resultados
+
+
+def leer_adelantado_lote_pdf(lote: list[tuple], presupuesto: PresupuestoBytes) -> tuple[list[tuple], int]:
+    """Leer a memoria los archivos del lote (id, archivo, autor, tamaño, canónica, datos), entrega el lote con sus datos y lo reservado"""
+    # Se reserva el lote completo de una vez, reservar archivo por archivo podría dejar esperando a un lote a medias
+    tamanios = []
+    for _, archivo, _, tamanio, _, _ in lote:
+        if tamanio is None:
+            try:
+                tamanio = os.stat(archivo).st_size
+            except OSError:
+                tamanio = 0  # Al extraerlo se revisa en el disco y se reporta el error
+        tamanios.append(tamanio)
+    reservado = sum(tamanios)
+    presupuesto.reservar(reservado)
+
+    # Leer cada archivo completo, si falla se deja sin datos para que la extracción lo lea como siempre
+    leidos = []
+    for id, archivo, autor, tamanio, canonica, _ in lote:
+        try:
+            with metrics.medir("leer_adelantado"), open(archivo, "rb") as puntero:
+                datos = puntero.read()
+            metrics.contar("bytes_leidos_adelantado", len(datos))
+        except OSError:
+            datos = None
+        leidos.append((id, archivo, autor, tamanio, canonica, datos))
+    return leidos, reservado
+
+
+def calibrar_motores(archivos: list[str], motores: list[str], tolerancia: float = 0.9) -> dict:
+    """Extraer los archivos con cada motor, medir documentos por segundo y caracteres, elegir el más rápido aceptable"""
+    # Leer la muestra una sola vez antes de medir, así el primer motor no paga las lecturas en frío de la unidad de red
+    muestra = []
+    for archivo in archivos:
+        try:
+            with open(archivo, "rb") as puntero:
+                muestra.append((archivo, puntero.read()))
+        except OSError:
+            muestra.append((archivo, None))  # Falla igual con todos los motores
+
+    def extraer_muestra(motor: str) -> tuple[int, int, int]:
+        """Extraer la muestra con el motor, entrega los documentos, caracteres y errores"""
+        documentos, caracteres, errores = 0, 0, 0
+        for archivo, datos in muestra:
+            try:
+                caracteres += len(extraer_texto_de_archivo_pdf(archivo, usar_cache=False, motor=motor, datos=datos))
+                documentos += 1
+            except MyAnyError:
+                errores += 1
+        return documentos, caracteres, errores
+
+    resultados = {}
+    for motor in motores:
+        extraer_muestra(motor)  # Una vuelta sin medir para importar el módulo del motor y calentar sus caches
+        inicio = time.perf_counter()
+        documentos, caracteres, errores = extraer_muestra(motor)
+        segundos = time.perf_counter() - inicio
+        resultados[motor] = {
+            "documentos": documentos,
+            "errores": errores,
+            "caracteres": caracteres,
+            "segundos": round(segundos, 3),
+            "documentos_por_segundo": round(documentos / segundos, 3) if segundos > 0 else 0.0,
+        }
+
+    # Es aceptable si no tuvo errores de más y extrajo casi tantos caracteres como el que más extrajo
+    maximo_caracteres = max((resultado["caracteres"] for resultado in resultados.values()), default=0)
+    minimo_errores = min((resultado["errores"] for resultado in resultados.values()), default=0)
+    for resultado in resultados.values():
+        resultado["aceptable"] = (
+            resultado["errores"] == minimo_errores and resultado["caracteres"] >= tolerancia * maximo_caracteres
+        )
+    aceptables = [motor for motor, resultado in resultados.items() if resultado["aceptable"]]
+    seleccionado = max(aceptables, key=lambda motor: resultados[motor]["documentos_por_segundo"], default=MOTOR_POR_DEFECTO)
+
+    # Guardar la calibración para que elegir_motor la use cuando PDF_MOTOR sea automatico
+    calibracion = {
+        "actualizado": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "archivos": len(archivos),
+        "tolerancia": tolerancia,
+        "motores": resultados,
+        "seleccionado": seleccionado,
+    }
+    escribir_json_atomico(Path(CACHE_DIR) / CALIBRACION_ARCHIVO, calibracion)
+    return calibracion
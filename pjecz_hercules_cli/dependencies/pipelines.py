@@ -0,0 +1,95 @@
+"""
+Pipelines
+"""
+
+import queue
+import threading
+from typing import Callable, Iterable
+
+# Marca que se pone en una cola para avisar que ya no vienen más elementos
+FIN = object()
+
+
+class Etapa:
+    """Etapa de una tubería: hilos que toman de una cola de entrada, procesan y ponen en una cola de salida"""
+
+    def __init__(
+        self,
+        nombre: str,
+        funcion: Callable[[object], Iterable],
+        entrada: queue.Queue,
+        salida: queue.Queue,
+        trabajadores: int = 1,
+    ):
+        self.nombre = nombre
+        self.funcion = funcion
+        self.entrada = entrada
+        self.salida = salida
+        self.trabajadores = max(1, trabajadores)
+        self.errores = []
+        self._candado = threading.Lock()
+        self._restantes = self.trabajadores
+        self._hilos = []
+
+    def _trabajar(self):
+        """Bucle de un hilo trabajador"""
+        try:
+            while True:
+                elemento = self.entrada.get()
+                if elemento is FIN:
+                    # Devolver la marca para que la vean los demás hilos de esta etapa
+                    self.entrada.put(FIN)
+                    break
+                try:
+                    for resultado in self.funcion(elemento):
+                        self.salida.put(resultado)
+                except Exception as error:
+                    with self._candado:
+                        self.errores.append(error)
+        finally:
+            # El último hilo en terminar avisa a la siguiente etapa
+            with self._candado:
+                self._restantes -= 1
+                if self._restantes == 0:
+                    self.salida.put(FIN)
+
+    def iniciar(self) -> "Etapa":
+        """Iniciar los hilos trabajadores"""
+        for numero in range(self.trabajadores):
+            hilo = threading.Thread(target=self._trabajar, name=f"{self.nombre}-{numero}", daemon=True)
+            hilo.start()
+            self._hilos.append(hilo)
+        return self
+
+    def esperar(self):
+        """Esperar a que terminen los hilos trabajadores"""
+        for hilo in self._hilos:
+            hilo.join()
+
+
+class PresupuestoBytes:
+    """Limitar los bytes en memoria entre etapas, quien reserva espera a que otros liberen"""
+
+    def __init__(self, maximo: int):
+        self.maximo = max(1, maximo)
+        self.usados = 0
+        self._condicion = threading.Condition()
+
+    def reservar(self, cantidad: int):
+        """Esperar a que haya lugar, uno más grande que el máximo pasa cuando no hay otros en memoria"""
+        with self._condicion:
+            self._condicion.wait_for(lambda: self.usados == 0 or self.usados + cantidad <= self.maximo)
+            self.usados += cantidad
+
+    def liberar(self, cantidad: int):
+        """Devolver los bytes reservados"""
+        with self._condicion:
+            self.usados -= cantidad
+            self._condicion.notify_all()
+
+
+def alimentar(cola: queue.Queue, elementos: Iterable):
+    """Poner los elementos en la cola seguidos de la marca FIN"""
+    for elemento in elementos:
+        cola.put(elemento)
+    cola.put(FIN)
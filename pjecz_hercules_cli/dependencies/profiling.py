@@ -0,0 +1,84 @@
+"""
+Profiling
+"""
+
+import cProfile
+import io
+import pstats
+import sys
+import threading
+import tracemalloc
+from pathlib import Path
+
+FUNCIONES_REPORTE = 40
+ASIGNACIONES_REPORTE = 25
+
+
+class Perfilador:
+    """Perfilar con cProfile el hilo principal y los hilos que se creen, opcionalmente la memoria con tracemalloc"""
+
+    def __init__(self, memoria: bool = False):
+        self.memoria = memoria
+        self.perfiles = []
+        # Desde Python 3.12 cProfile usa sys.monitoring, no se puede activar un perfil por hilo, pero el del hilo principal
+        # recibe las llamadas de todos los hilos con una sola pila, cuenta bien las llamadas y mezcla los tiempos
+        self.perfil_compartido = sys.version_info >= (3, 12)
+        self._candado = threading.Lock()
+
+    def _perfilar_hilo(self, *args):
+        """Crear un perfil para el hilo nuevo, cProfile sólo mide el hilo donde se activa"""
+        sys.setprofile(None)
+        perfil = cProfile.Profile()
+        with self._candado:
+            self.perfiles.append(perfil)
+        perfil.enable()
+
+    def iniciar(self):
+        """Empezar a perfilar"""
+        if self.memoria:
+            tracemalloc.start()
+        if self.perfil_compartido is False:
+            threading.setprofile(self._perfilar_hilo)
+        perfil = cProfile.Profile()
+        self.perfiles.append(perfil)
+        perfil.enable()
+
+    def terminar(self, ruta: Path) -> list[Path]:
+        """Dejar de perfilar, guardar las estadísticas para pstats y un reporte de texto, entrega las rutas"""
+        if self.perfil_compartido is False:
+            threading.setprofile(None)
+        self.perfiles[0].disable()
+        instantanea, pico = None, 0
+        if self.memoria:
+            instantanea = tracemalloc.take_snapshot()
+            _, pico = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+
+        # Juntar los perfiles de todos los hilos en un archivo que se puede ordenar con pstats o snakeviz
+        with self._candado:
+            estadisticas = pstats.Stats(*self.perfiles)
+            hilos = len(self.perfiles)
+        ruta.parent.mkdir(parents=True, exist_ok=True)
+        estadisticas.dump_stats(ruta)
+
+        # Reporte de texto con las funciones más costosas y las líneas que más memoria asignaron
+        reporte = io.StringIO()
+        reporte.write(f"Perfil de {' '.join(sys.argv)}" + (f" en {hilos} hilos\n" if self.perfil_compartido is False else "\n"))
+        if self.perfil_compartido:
+            reporte.write(
+                f"Con Python {sys.version_info.major}.{sys.version_info.minor} un solo perfil recibe todos los hilos, "
+                "las llamadas de las etapas se cuentan pero sus tiempos no son confiables\n"
+            )
+        for orden in ("cumulative", "tottime"):
+            reporte.write(f"\n== Funciones por {orden} ==\n")
+            pstats.Stats(str(ruta), stream=reporte).sort_stats(orden).print_stats(FUNCIONES_REPORTE)
+        if instantanea is not None:
+            instantanea = instantanea.filter_traces(
+                [tracemalloc.Filter(False, tracemalloc.__file__), tracemalloc.Filter(False, "<frozen importlib._bootstrap*>")]
+            )
+            reporte.write(f"\n== Asignaciones de memoria, pico {pico / 1024 / 1024:.1f} MB ==\n")
+            for estadistica in instantanea.statistics("lineno")[:ASIGNACIONES_REPORTE]:
+                reporte.write(f"{estadistica}\n")
+        ruta_reporte = ruta.with_name(f"{ruta.name}.txt")
+        ruta_reporte.write_text(reporte.getvalue(), encoding="utf8")
+        return [ruta, ruta_reporte]
@@ -0,0 +1,287 @@
+"""
+Simulator
+"""
+
+import gzip
+import json
+import random
+import threading
+import time
+from dataclasses import dataclass
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import parse_qs, urlparse
+
+from .benchmarks import PALABRAS, generar_pdf_sintetico
+from .metrics import calcular_percentiles
+
+RECURSOS = ("sentencias", "edictos")
+GCS_BASE_URL = "https://storage.googleapis.com/simulador"
+MODELO = "simulador"
+
+
+@dataclass
+class ConfiguracionSimulador:
+    """Parámetros del simulador, las latencias en milisegundos"""
+
+    documentos: int = 100
+    paginas: int = 5
+    latencia_ms: float = 20.0
+    latencia_elemento_ms: float = 1.0
+    latencia_llm_ms: float = 200.0
+    variacion: float = 0.2
+    tasa_errores: float = 0.0
+    acepta_gzip: bool = True
+    semilla: int = 0
+
+
+class EstadoSimulador:
+    """Registros de cada recurso, textos recibidos y latencias de cada endpoint, compartidos entre los hilos"""
+
+    def __init__(self, configuracion: ConfiguracionSimulador, base_dir: Path):
+        self.configuracion = configuracion
+        self.base_dir = base_dir
+        self.azar = random.Random(configuracion.semilla)
+        self.registros = {recurso: {} for recurso in RECURSOS}
+        self.textos = {recurso: {} for recurso in RECURSOS}
+        self.latencias = {}
+        self.envios = {"analisis": 0, "sintesis": 0}
+        self.errores = 0
+        self.candado = threading.Lock()
+
+    def generar_corpus(self):
+        """Escribir los archivos PDF y crear los registros que entrega el listado"""
+        for recurso in RECURSOS:
+            directorio = self.base_dir / recurso
+            directorio.mkdir(parents=True, exist_ok=True)
+            for id in range(1, self.configuracion.documentos + 1):
+                archivo = f"{id:06d}.pdf"
+                ruta = directorio / archivo
+                if ruta.exists() is False:
+                    paginas = self.azar.randint(1, max(1, self.configuracion.paginas))
+                    generar_pdf_sintetico(ruta, paginas, self.configuracion.semilla * 100000 + id)
+                self.registros[recurso][id] = {
+                    "id": id,
+                    "archivo": archivo,
+                    "autoridad_clave": f"SIM-{id % 7:02d}",
+                    "descripcion": " ".join(self.azar.choice(PALABRAS) for _ in range(8)),
+                    "url": f"{GCS_BASE_URL}/{recurso}/{archivo}",
+                    "rag_fue_analizado_tiempo": None,
+                    "rag_fue_sintetizado_tiempo": None,
+                }
+
+    def esperar(self, milisegundos: float):
+        """Dormir la latencia con una variación al azar"""
+        variacion = self.configuracion.variacion
+        with self.candado:
+            factor = self.azar.uniform(1 - variacion, 1 + variacion)
+        time.sleep(max(0.0, milisegundos * factor / 1000))
+
+    def fallar(self) -> bool:
+        """Decidir al azar si la solicitud falla, según la tasa de errores"""
+        with self.candado:
+            fallo = self.azar.random() < self.configuracion.tasa_errores
+            if fallo:
+                self.errores += 1
+            return fallo
+
+    def registrar_latencia(self, endpoint: str, segundos: float):
+        """Registrar los segundos que tardó una respuesta"""
+        with self.candado:
+            self.latencias.setdefault(endpoint, []).append(segundos)
+
+    def reiniciar_medidas(self):
+        """Borrar las latencias y los contadores, entre una fase y la siguiente"""
+        with self.candado:
+            self.latencias = {}
+            self.envios = {"analisis": 0, "sintesis": 0}
+            self.errores = 0
+
+    def resumir_latencias(self) -> dict[str, dict]:
+        """Entregar por endpoint la cantidad de solicitudes y los percentiles en milisegundos"""
+        with self.candado:
+            latencias = {endpoint: list(segundos) for endpoint, segundos in self.latencias.items()}
+        resumen = {}
+        for endpoint, segundos in sorted(latencias.items()):
+            percentiles = calcular_percentiles([valor * 1000 for valor in segundos])
+            resumen[endpoint] = {"solicitudes": len(segundos), **percentiles}
+        return resumen
+
+
+class ManejadorSimulador(BaseHTTPRequestHandler):
+    """Atender las solicitudes como lo harían la API de Hércules y OpenAI"""
+
+    protocol_version = "HTTP/1.1"
+    estado: EstadoSimulador = None  # Se asigna en la clase que crea iniciar_simulador
+
+    def log_message(self, format, *args):
+        """No mostrar cada solicitud"""
+
+    def _responder(self, contenido: dict, status: int = 200):
+        """Enviar la respuesta en JSON"""
+        cuerpo = json.dumps(contenido).encode("utf8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(cuerpo)))
+        self.end_headers()
+        self.wfile.write(cuerpo)
+
+    def _leer_cuerpo(self) -> bytes:
+        """Leer el cuerpo de la solicitud, con Content-Length o en pedazos (chunked)"""
+        if self.headers.get("Transfer-Encoding", "").lower() == "chunked":
+            partes = []
+            while True:
+                tamanio = int(self.rfile.readline().strip(), 16)
+                if tamanio == 0:
+                    self.rfile.readline()
+                    break
+                partes.append(self.rfile.read(tamanio))
+                self.rfile.readline()
+            return b"".join(partes)
+        return self.rfile.read(int(self.headers.get("Content-Length", 0)))
+
+    def _atender(self, endpoint: str, funcion, *args):
+        """Medir el tiempo de la respuesta, o responder con error según la tasa de errores"""
+        inicio = time.perf_counter()
+        if endpoint != "token" and self.estado.fallar():
+            self.estado.esperar(self.estado.configuracion.latencia_ms)
+            self._responder({"detail": "Error simulado"}, 500)
+        else:
+            funcion(*args)
+        self.estado.registrar_latencia(endpoint, time.perf_counter() - inicio)
+
+    def do_GET(self):
+        """Listado y detalle de sentencias y edictos"""
+        url = urlparse(self.path)
+        partes = url.path.strip("/").split("/")
+        if len(partes) == 3 and partes[:2] == ["api", "v5"] and partes[2] in RECURSOS:
+            self._atender(f"GET {partes[2]}", self._listar, partes[2], parse_qs(url.query))
+        elif len(partes) == 4 and partes[:2] == ["api", "v5"] and partes[2] in RECURSOS and partes[3].isdigit():
+            self._atender(f"GET {partes[2]}/id", self._detallar, partes[2], int(partes[3]))
+        else:
+            self._responder({"detail": "Not Found"}, 404)
+
+    def do_POST(self):
+        """Token y chat completions"""
+        cuerpo = self._leer_cuerpo()
+        ruta = urlparse(self.path).path
+        if ruta == "/token":
+            self._atender("token", self._responder, {"access_token": "simulador", "token_type": "bearer"})
+        elif ruta.endswith("/chat/completions"):
+            self._atender("chat/completions", self._completar, json.loads(cuerpo or b"{}"))
+        else:
+            self._responder({"detail": "Not Found"}, 404)
+
+    def do_PUT(self):
+        """Recibir los análisis y las síntesis, comprimidos con gzip o no"""
+        inicio = time.perf_counter()
+        cuerpo = self._leer_cuerpo()
+        partes = urlparse(self.path).path.strip("/").split("/")
+        if self.headers.get("Content-Encoding", "").lower() == "gzip":
+            if self.estado.configuracion.acepta_gzip is False:
+                # Se registra aparte para que la prueba de carga muestre que el cliente volvió a enviar sin comprimir
+                self._responder({"detail": "Unsupported Media Type"}, 415)
+                self.estado.registrar_latencia(f"PUT {'/'.join(partes[2:])} 415", time.perf_counter() - inicio)
+                return
+            cuerpo = gzip.decompress(cuerpo)
+        if len(partes) == 4 and partes[:2] == ["api", "v5"] and partes[2] in RECURSOS and partes[3] == "rag":
+            self._atender(f"PUT {partes[2]}/rag", self._guardar_rag, partes[2], json.loads(cuerpo))
+        else:
+            self._responder({"detail": "Not Found"}, 404)
+
+    def _listar(self, recurso: str, parametros: dict):
+        """Entregar una página del listado, tarda más mientras más elementos se piden"""
+        configuracion = self.estado.configuracion
+        limit = int(parametros.get("limit", ["10"])[0])
+        offset = int(parametros.get("offset", ["0"])[0])
+        with self.estado.candado:
+            registros = list(self.estado.registros[recurso].values())
+            data = [dict(registro) for registro in registros[offset : offset + limit]]
+        self.estado.esperar(configuracion.latencia_ms + configuracion.latencia_elemento_ms * len(data))
+        contenido = {"success": True, "message": "Success", "total": len(registros), "limit": limit, "offset": offset}
+        self._responder({**contenido, "data": data})
+
+    def _detallar(self, recurso: str, id: int):
+        """Entregar un registro con el texto de su análisis, si ya lo recibió"""
+        self.estado.esperar(self.estado.configuracion.latencia_ms)
+        with self.estado.candado:
+            registro = self.estado.registros[recurso].get(id)
+            data = None if registro is None else dict(registro)
+            texto = self.estado.textos[recurso].get(id)
+        if data is None:
+            self._responder({"success": False, "message": "No existe", "data": None})
+            return
+        data["rag_analisis"] = None if texto is None else {"texto": texto}
+        self._responder({"success": True, "message": "Success", "data": data})
+
+    def _guardar_rag(self, recurso: str, datos: dict):
+        """Guardar el análisis o la síntesis y marcar el registro con la fecha"""
+        self.estado.esperar(self.estado.configuracion.latencia_ms)
+        ahora = datetime.now().isoformat(timespec="seconds")
+        with self.estado.candado:
+            registro = self.estado.registros[recurso].get(datos["id"])
+            if registro is not None and datos.get("analisis") is not None:
+                self.estado.textos[recurso][datos["id"]] = datos["analisis"]["texto"]
+                registro["rag_fue_analizado_tiempo"] = ahora
+                self.estado.envios["analisis"] += 1
+            if registro is not None and datos.get("sintesis") is not None:
+                registro["rag_fue_sintetizado_tiempo"] = ahora
+                self.estado.envios["sintesis"] += 1
+        if registro is None:
+            self._responder({"success": False, "message": "No existe"})
+            return
+        self._responder({"success": True, "message": "Success"})
+
+    def _completar(self, solicitud: dict):
+        """Responder como OpenAI, con una síntesis corta, en flujo si se pide"""
+        configuracion = self.estado.configuracion
+        with self.estado.candado:
+            palabras = [self.estado.azar.choice(PALABRAS) for _ in range(40)]
+        tokens_entrada = sum(len(mensaje.get("content") or "") for mensaje in solicitud.get("messages", [])) // 4
+        uso = {
+            "prompt_tokens": tokens_entrada,
+            "completion_tokens": len(palabras),
+            "total_tokens": tokens_entrada + len(palabras),
+        }
+        base = {"id": "simulador", "created": int(time.time()), "model": solicitud.get("model") or MODELO}
+        if solicitud.get("stream") is not True:
+            self.estado.esperar(configuracion.latencia_llm_ms)
+            mensaje = {"role": "assistant", "content": " ".join(palabras)}
+            choices = [{"index": 0, "message": mensaje, "finish_reason": "stop"}]
+            self._responder({**base, "object": "chat.completion", "choices": choices, "usage": uso})
+            return
+
+        # En flujo, la latencia se reparte entre el primer token y los siguientes
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = True
+        self.estado.esperar(configuracion.latencia_llm_ms / 2)
+        for palabra in palabras:
+            delta = {"index": 0, "delta": {"content": palabra + " "}, "finish_reason": None}
+            evento = {**base, "object": "chat.completion.chunk", "choices": [delta]}
+            self.wfile.write(f"data: {json.dumps(evento)}\n\n".encode("utf8"))
+            self.wfile.flush()
+            time.sleep(configuracion.latencia_llm_ms / 2 / len(palabras) / 1000)
+        if solicitud.get("stream_options", {}).get("include_usage"):
+            evento = {**base, "object": "chat.completion.chunk", "choices": [], "usage": uso}
+            self.wfile.write(f"data: {json.dumps(evento)}\n\n".encode("utf8"))
+        self.wfile.write(b"data: [DONE]\n\n")
+        self.wfile.flush()
+
+
+def iniciar_simulador(
+    configuracion: ConfiguracionSimulador,
+    base_dir: Path,
+    puerto: int = 0,
+) -> tuple[ThreadingHTTPServer, EstadoSimulador]:
+    """Generar el corpus e iniciar el servidor en un hilo, con el puerto 0 se elige uno libre"""
+    estado = EstadoSimulador(configuracion, base_dir)
+    estado.generar_corpus()
+    manejador = type("Manejador", (ManejadorSimulador,), {"estado": estado})
+    servidor = ThreadingHTTPServer(("127.0.0.1", puerto), manejador)
+    servidor.daemon_threads = True
+    threading.Thread(target=servidor.serve_forever, daemon=True).start()
+    return servidor, estado
@@ -0,0 +1,190 @@
+"""
+Synthesis Cache
+"""
+
+import hashlib
+import os
+import threading
+import time
+from pathlib import Path
+from typing import TYPE_CHECKING
+
+from dotenv import load_dotenv
+
+# Sólo para las anotaciones, sqlite3 se importa al conectar
+if TYPE_CHECKING:
+    import sqlite3
+
+# Cargar las variables de entorno
+load_dotenv()
+CACHE_DIR = os.getenv("CACHE_DIR", str(Path.home() / ".cache" / "pjecz_hercules_cli"))
+CACHE_SINTESIS_MAXIMO_MB = int(os.getenv("CACHE_SINTESIS_MAXIMO_MB", "256"))
+
+CACHE_SINTESIS_ARCHIVO = "sintesis.sqlite3"
+DESALOJAR_LOTE = 100
+
+_local = threading.local()
+_candado = threading.Lock()
+_contadores = {"aciertos": 0, "fallos": 0}
+
+
+def _conectar() -> "sqlite3.Connection":
+    """Conectar a la base de datos SQLite, una conexión por hilo y por proceso"""
+    conexion = getattr(_local, "conexion", None)
+    if conexion is not None and getattr(_local, "pid", None) == os.getpid():
+        return conexion
+    import sqlite3  # Se importa aquí para que el CLI arranque rápido
+
+    Path(CACHE_DIR).mkdir(parents=True, exist_ok=True)
+    conexion = sqlite3.connect(Path(CACHE_DIR) / CACHE_SINTESIS_ARCHIVO, timeout=30, isolation_level=None)
+    conexion.execute("PRAGMA journal_mode=WAL")
+    conexion.execute("PRAGMA synchronous=NORMAL")
+    conexion.execute(
+        "CREATE TABLE IF NOT EXISTS sintesis ("
+        "modelo TEXT, prompt_hash TEXT, texto_hash TEXT, "
+        "sintesis TEXT, tokens_total INTEGER, modelo_respuesta TEXT, bytes INTEGER, usado REAL, "
+        "PRIMARY KEY (modelo, prompt_hash, texto_hash))"
+    )
+    conexion.execute("CREATE INDEX IF NOT EXISTS sintesis_usado ON sintesis (usado)")
+    conexion.execute("CREATE TABLE IF NOT EXISTS contadores (nombre TEXT PRIMARY KEY, valor INTEGER)")
+    # El total de bytes de las síntesis lo llevan disparadores, se crea con su valor inicial en una sola transacción
+    conexion.execute("BEGIN IMMEDIATE")
+    try:
+        conexion.execute("CREATE TABLE IF NOT EXISTS total_sintesis (id INTEGER PRIMARY KEY CHECK (id = 1), bytes INTEGER)")
+        if conexion.execute("SELECT 1 FROM total_sintesis").fetchone() is None:
+            conexion.execute("INSERT INTO total_sintesis (id, bytes) SELECT 1, COALESCE(SUM(bytes), 0) FROM sintesis")
+        conexion.execute(
+            "CREATE TRIGGER IF NOT EXISTS sintesis_insertar AFTER INSERT ON sintesis "
+            "BEGIN UPDATE total_sintesis SET bytes = bytes + NEW.bytes; END"
+        )
+        conexion.execute(
+            "CREATE TRIGGER IF NOT EXISTS sintesis_actualizar AFTER UPDATE OF bytes ON sintesis "
+            "BEGIN UPDATE total_sintesis SET bytes = bytes - OLD.bytes + NEW.bytes; END"
+        )
+        conexion.execute(
+            "CREATE TRIGGER IF NOT EXISTS sintesis_borrar AFTER DELETE ON sintesis "
+            "BEGIN UPDATE total_sintesis SET bytes = bytes - OLD.bytes; END"
+        )
+        conexion.execute("COMMIT")
+    except sqlite3.Error:
+        conexion.execute("ROLLBACK")
+        raise
+    _local.conexion = conexion
+    _local.pid = os.getpid()
+    return conexion
+
+
+def calcular_hash(texto: str) -> str:
+    """Calcular el SHA-256 de un texto"""
+    return hashlib.sha256((texto or "").encode("utf-8")).hexdigest()
+
+
+def _contar(conexion: "sqlite3.Connection", nombre: str):
+    """Incrementar el contador de esta ejecución y el guardado"""
+    with _candado:
+        _contadores[nombre] += 1
+    conexion.execute(
+        "INSERT INTO contadores (nombre, valor) VALUES (?, 1) ON CONFLICT(nombre) DO UPDATE SET valor = valor + 1",
+        (nombre,),
+    )
+
+
+def obtener_sintesis(modelo: str, configuracion: str, texto: str) -> tuple[str, int, str] | None:
+    """Obtener la síntesis, el total de tokens y el modelo de la respuesta, entrega None si no está"""
+    conexion = _conectar()
+    # En prompt_hash va el hash de toda la configuración de la síntesis, no sólo del prompt
+    llave = (modelo, calcular_hash(configuracion), calcular_hash(texto))
+    renglon = conexion.execute(
+        "SELECT sintesis, tokens_total, modelo_respuesta FROM sintesis WHERE modelo = ? AND prompt_hash = ? AND texto_hash = ?",
+        llave,
+    ).fetchone()
+    if renglon is None:
+        _contar(conexion, "fallos")
+        return None
+    conexion.execute(
+        "UPDATE sintesis SET usado = ? WHERE modelo = ? AND prompt_hash = ? AND texto_hash = ?",
+        (time.time(), *llave),
+    )
+    _contar(conexion, "aciertos")
+    return renglon[0], renglon[1], renglon[2]
+
+
+def guardar_sintesis(modelo: str, configuracion: str, texto: str, sintesis: str, tokens_total: int, modelo_respuesta: str):
+    """Guardar la síntesis y desalojar las menos usadas si se rebasa el tamaño máximo"""
+    conexion = _conectar()
+    # Se actualiza la síntesis existente en lugar de reemplazarla, así corre el disparador que lleva el total
+    conexion.execute(
+        "INSERT INTO sintesis "
+        "(modelo, prompt_hash, texto_hash, sintesis, tokens_total, modelo_respuesta, bytes, usado) "
+        "VALUES (?, ?, ?, ?, ?, ?, ?, ?) "
+        "ON CONFLICT(modelo, prompt_hash, texto_hash) DO UPDATE SET sintesis = excluded.sintesis, "
+        "tokens_total = excluded.tokens_total, modelo_respuesta = excluded.modelo_respuesta, "
+        "bytes = excluded.bytes, usado = excluded.usado",
+        (
+            modelo,
+            calcular_hash(configuracion),
+            calcular_hash(texto),
+            sintesis,
+            tokens_total,
+            modelo_respuesta,
+            len(sintesis.encode("utf-8")),
+            time.time(),
+        ),
+    )
+    desalojar(CACHE_SINTESIS_MAXIMO_MB * 1024 * 1024)
+
+
+def desalojar(maximo_bytes: int) -> int:
+    """Borrar las síntesis menos usadas hasta quedar debajo del máximo de bytes, entrega cuántas se borraron"""
+    conexion = _conectar()
+    borrados = 0
+    # Por lotes de las menos usadas, releyendo el total en cada lote porque otro proceso pudo desalojar también
+    while True:
+        total = conexion.execute("SELECT bytes FROM total_sintesis").fetchone()[0]
+        if total <= maximo_bytes:
+            break
+        lote = conexion.execute("SELECT rowid, bytes FROM sintesis ORDER BY usado LIMIT ?", (DESALOJAR_LOTE,)).fetchall()
+        if not lote:
+            break
+        for rowid, bytes_sintesis in lote:
+            if total <= maximo_bytes:
+                break
+            conexion.execute("DELETE FROM sintesis WHERE rowid = ?", (rowid,))
+            total -= bytes_sintesis
+            borrados += 1
+    return borrados
+
+
+def obtener_contadores_ejecucion() -> dict:
+    """Obtener los aciertos y fallos de esta ejecución"""
+    with _candado:
+        return dict(_contadores)
+
+
+def reiniciar_contadores_ejecucion():
+    """Poner en cero los aciertos y fallos de esta ejecución, como en cada vuelta de vigilar"""
+    with _candado:
+        for nombre in _contadores:
+            _contadores[nombre] = 0
+
+
+def obtener_estadisticas() -> dict:
+    """Obtener la cantidad de síntesis, los bytes que ocupan y los aciertos y fallos acumulados"""
+    conexion = _conectar()
+    registros, bytes_sintesis = conexion.execute("SELECT COUNT(*), COALESCE(SUM(bytes), 0) FROM sintesis").fetchone()
+    contadores = dict(conexion.execute("SELECT nombre, valor FROM contadores").fetchall())
+    return {
+        "registros": registros,
+        "bytes": bytes_sintesis,
+        "maximo_bytes": CACHE_SINTESIS_MAXIMO_MB * 1024 * 1024,
+        "aciertos": contadores.get("aciertos", 0),
+        "fallos": contadores.get("fallos", 0),
+    }
+
+
+def vaciar():
+    """Borrar todas las síntesis y los contadores"""
+    conexion = _conectar()
+    conexion.execute("DELETE FROM sintesis")
+    conexion.execute("DELETE FROM contadores")
+    conexion.execute("VACUUM")
@@ -0,0 +1,160 @@
+"""
+Text Cache
+"""
+
+import hashlib
+import os
+import threading
+import time
+import zlib
+from pathlib import Path
+from typing import TYPE_CHECKING
+
+from dotenv import load_dotenv
+
+# Sólo para las anotaciones, sqlite3 se importa al conectar
+if TYPE_CHECKING:
+    import sqlite3
+
+# Cargar las variables de entorno
+load_dotenv()
+CACHE_DIR = os.getenv("CACHE_DIR", str(Path.home() / ".cache" / "pjecz_hercules_cli"))
+CACHE_TEXTOS_MAXIMO_MB = int(os.getenv("CACHE_TEXTOS_MAXIMO_MB", "1024"))
+
+CACHE_TEXTOS_ARCHIVO = "textos.sqlite3"
+DESALOJAR_LOTE = 100
+
+_local = threading.local()
+
+
+def _conectar() -> "sqlite3.Connection":
+    """Conectar a la base de datos SQLite, una conexión por hilo y por proceso"""
+    conexion = getattr(_local, "conexion", None)
+    if conexion is not None and getattr(_local, "pid", None) == os.getpid():
+        return conexion
+    import sqlite3  # Se importa aquí para que el CLI arranque rápido
+
+    Path(CACHE_DIR).mkdir(parents=True, exist_ok=True)
+    conexion = sqlite3.connect(Path(CACHE_DIR) / CACHE_TEXTOS_ARCHIVO, timeout=30, isolation_level=None)
+    conexion.execute("PRAGMA journal_mode=WAL")
+    conexion.execute("PRAGMA synchronous=NORMAL")
+    conexion.execute(
+        "CREATE TABLE IF NOT EXISTS archivos (ruta TEXT PRIMARY KEY, tamanio INTEGER, mtime_ns INTEGER, hash TEXT)"
+    )
+    conexion.execute("CREATE TABLE IF NOT EXISTS textos (hash TEXT PRIMARY KEY, texto BLOB, bytes INTEGER, usado REAL)")
+    conexion.execute("CREATE INDEX IF NOT EXISTS textos_usado ON textos (usado)")
+    # Los disparadores llevan el total de bytes de los textos, así desalojar no suma la tabla completa en cada escritura;
+    # la tabla, su valor inicial y los disparadores se crean en una misma transacción para no perder escrituras de otro proceso
+    conexion.execute("BEGIN IMMEDIATE")
+    try:
+        conexion.execute("CREATE TABLE IF NOT EXISTS total_textos (id INTEGER PRIMARY KEY CHECK (id = 1), bytes INTEGER)")
+        if conexion.execute("SELECT 1 FROM total_textos").fetchone() is None:
+            conexion.execute("INSERT INTO total_textos (id, bytes) SELECT 1, COALESCE(SUM(bytes), 0) FROM textos")
+        conexion.execute(
+            "CREATE TRIGGER IF NOT EXISTS textos_insertar AFTER INSERT ON textos "
+            "BEGIN UPDATE total_textos SET bytes = bytes + NEW.bytes; END"
+        )
+        conexion.execute(
+            "CREATE TRIGGER IF NOT EXISTS textos_actualizar AFTER UPDATE OF bytes ON textos "
+            "BEGIN UPDATE total_textos SET bytes = bytes - OLD.bytes + NEW.bytes; END"
+        )
+        conexion.execute(
+            "CREATE TRIGGER IF NOT EXISTS textos_borrar AFTER DELETE ON textos "
+            "BEGIN UPDATE total_textos SET bytes = bytes - OLD.bytes; END"
+        )
+        conexion.execute("COMMIT")
+    except sqlite3.Error:
+        conexion.execute("ROLLBACK")
+        raise
+    _local.conexion = conexion
+    _local.pid = os.getpid()
+    return conexion
+
+
+def calcular_hash_archivo(ruta: Path) -> str:
+    """Calcular el SHA-256 del contenido de un archivo"""
+    sha256 = hashlib.sha256()
+    with open(ruta, "rb") as puntero:
+        for bloque in iter(lambda: puntero.read(1024 * 1024), b""):
+            sha256.update(bloque)
+    return sha256.hexdigest()
+
+
+def obtener_hash_archivo(ruta: Path, datos: bytes = None, estado: os.stat_result = None, canonica: bool = False) -> str:
+    """Obtener el hash del archivo, sin leerlo si su tamaño y fecha de modificación no han cambiado o si se dan sus datos"""
+    conexion = _conectar()
+    # El tamaño y la fecha siempre son los del disco, quien llama puede dar el estado que acaba de consultar,
+    # así un archivo reemplazado nunca entrega el hash anterior; con la ruta canónica del índice no se resuelve
+    if estado is None:
+        estado = os.stat(ruta)
+    ruta_texto = str(ruta) if canonica else str(ruta.resolve())
+    renglon = conexion.execute("SELECT tamanio, mtime_ns, hash FROM archivos WHERE ruta = ?", (ruta_texto,)).fetchone()
+    if renglon is not None and renglon[0] == estado.st_size and renglon[1] == estado.st_mtime_ns:
+        return renglon[2]
+    hash_archivo = hashlib.sha256(datos).hexdigest() if datos is not None else calcular_hash_archivo(ruta)
+    conexion.execute(
+        "INSERT OR REPLACE INTO archivos (ruta, tamanio, mtime_ns, hash) VALUES (?, ?, ?, ?)",
+        (ruta_texto, estado.st_size, estado.st_mtime_ns, hash_archivo),
+    )
+    return hash_archivo
+
+
+def obtener_texto(hash_archivo: str) -> str | None:
+    """Obtener el texto guardado para el hash, entrega None si no está"""
+    conexion = _conectar()
+    renglon = conexion.execute("SELECT texto FROM textos WHERE hash = ?", (hash_archivo,)).fetchone()
+    if renglon is None:
+        return None
+    conexion.execute("UPDATE textos SET usado = ? WHERE hash = ?", (time.time(), hash_archivo))
+    return zlib.decompress(renglon[0]).decode("utf-8")
+
+
+def guardar_texto(hash_archivo: str, texto: str):
+    """Guardar el texto comprimido y desalojar los menos usados si se rebasa el tamaño máximo"""
+    conexion = _conectar()
+    comprimido = zlib.compress(texto.encode("utf-8"), 6)
+    # Con INSERT OR REPLACE no corre el disparador de borrado, por eso se actualiza el renglón existente
+    conexion.execute(
+        "INSERT INTO textos (hash, texto, bytes, usado) VALUES (?, ?, ?, ?) "
+        "ON CONFLICT(hash) DO UPDATE SET texto = excluded.texto, bytes = excluded.bytes, usado = excluded.usado",
+        (hash_archivo, comprimido, len(comprimido), time.time()),
+    )
+    desalojar(CACHE_TEXTOS_MAXIMO_MB * 1024 * 1024)
+
+
+def desalojar(maximo_bytes: int) -> int:
+    """Borrar los textos menos usados hasta quedar debajo del máximo de bytes, entrega cuántos se borraron"""
+    conexion = _conectar()
+    borrados = 0
+    # Se leen por lotes los menos usados, así sólo se recorre lo que se desaloja; el total se vuelve a leer
+    # en cada lote por si otro proceso también desalojó
+    while True:
+        total = conexion.execute("SELECT bytes FROM total_textos").fetchone()[0]
+        if total <= maximo_bytes:
+            break
+        lote = conexion.execute("SELECT hash, bytes FROM textos ORDER BY usado LIMIT ?", (DESALOJAR_LOTE,)).fetchall()
+        if not lote:
+            break
+        for hash_archivo, bytes_texto in lote:
+            if total <= maximo_bytes:
+                break
+            conexion.execute("DELETE FROM textos WHERE hash = ?", (hash_archivo,))
+            total -= bytes_texto
+            borrados += 1
+    return borrados
+
+
+def obtener_estadisticas() -> dict:
+    """Obtener la cantidad de archivos, de textos y los bytes que ocupan"""
+    conexion = _conectar()
+    archivos = conexion.execute("SELECT COUNT(*) FROM archivos").fetchone()[0]
+    textos, bytes_textos = conexion.execute("SELECT COUNT(*), COALESCE(SUM(bytes), 0) FROM textos").fetchone()
+    return {"archivos": archivos, "textos": textos, "bytes": bytes_textos, "maximo_bytes": CACHE_TEXTOS_MAXIMO_MB * 1024 * 1024}
+
+
+def vaciar():
+    """Borrar todos los archivos y textos"""
+    conexion = _conectar()
+    conexion.execute("DELETE FROM archivos")
+    conexion.execute("DELETE FROM textos")
+    conexion.execute("VACUUM")
@@ -0,0 +1,85 @@
+"""
+Watermarks
+"""
+
+import json
+import os
+import re
+from datetime import date, datetime, timedelta
+from pathlib import Path
+
+from dotenv import load_dotenv
+
+from .checkpoints import escribir_json_atomico
+from .exceptions import MyAnyError
+
+# Cargar las variables de entorno
+load_dotenv()
+CACHE_DIR = os.getenv("CACHE_DIR", str(Path.home() / ".cache" / "pjecz_hercules_cli"))
+MARCA_AGUA_TRASLAPE_DIAS = int(os.getenv("MARCA_AGUA_TRASLAPE_DIAS", "1"))
+
+MARCAS_AGUA_DIR = "marcas_agua"
+
+
+def _convertir_fecha(texto: str, nombre: str) -> date:
+    """Convertir un texto AAAA-MM-DD en fecha"""
+    try:
+        return date.fromisoformat(texto)
+    except ValueError as error:
+        raise MyAnyError(f"La fecha {nombre} '{texto}' no es AAAA-MM-DD") from error
+
+
+class MarcaAgua:
+    """Fecha hasta donde terminó bien un comando, para que la siguiente ejecución sólo consulte lo creado después"""
+
+    def __init__(self, comando: str):
+        nombre = re.sub(r"[^0-9A-Za-z_-]+", "_", comando)
+        self.ruta = Path(CACHE_DIR) / MARCAS_AGUA_DIR / f"{nombre}.json"
+        self.fecha = None
+        self.siguiente = None  # La fecha a guardar si la ejecución termina bien
+
+    def cargar(self) -> date | None:
+        """Cargar la fecha de la marca de agua, entrega None si no hay"""
+        if self.ruta.exists() is False:
+            return None
+        try:
+            with open(self.ruta, encoding="utf8") as puntero:
+                datos = json.load(puntero)
+            self.fecha = date.fromisoformat(datos["fecha"])
+        except (OSError, ValueError, KeyError) as error:
+            raise MyAnyError(f"No se pudo leer la marca de agua {self.ruta}: {str(error)}") from error
+        return self.fecha
+
+    def definir_rango(self, creado_desde: str | None, creado_hasta: str | None) -> tuple[str, str]:
+        """Definir el rango a consultar desde la marca de agua, o desde creado_desde la primera vez, hasta creado_hasta u hoy"""
+        hoy = date.today()
+        hasta = _convertir_fecha(creado_hasta, "hasta") if creado_hasta else hoy
+        if self.cargar() is not None:
+            # Se vuelve a consultar el día de la marca y los del traslape, lo creado ese día después de la ejecución
+            # y lo que se analizó tarde también debe procesarse, lo ya hecho se omite como siempre
+            desde = self.fecha - timedelta(days=MARCA_AGUA_TRASLAPE_DIAS)
+        elif creado_desde:
+            desde = _convertir_fecha(creado_desde, "desde")
+        else:
+            raise MyAnyError(f"No hay marca de agua en {self.ruta}, indique creado_desde para la primera ejecución")
+        if desde > hasta:
+            raise MyAnyError(f"La marca de agua {self.fecha} es posterior a {hasta}")
+        # Lo que se cree hoy más tarde debe entrar en la siguiente ejecución, la marca no pasa de hoy
+        self.siguiente = min(hasta, hoy)
+        return desde.isoformat(), hasta.isoformat()
+
+    def avanzar(self) -> date:
+        """Guardar la fecha siguiente de forma atómica, nunca retrocede si otra ejecución ya la avanzó más"""
+        fecha = self.siguiente
+        try:
+            anterior = self.cargar()
+        except MyAnyError:
+            anterior = None  # Se reemplaza la que no se pudo leer
+        if anterior is not None and anterior > fecha:
+            fecha = anterior
+        escribir_json_atomico(
+            self.ruta,
+            {"fecha": fecha.isoformat(), "actualizado": datetime.now().isoformat(timespec="seconds")},
+        )
+        self.fecha = fecha
+        return fecha
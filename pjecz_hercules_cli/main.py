@@ -2,12 +2,15 @@
 Hércules CLI (Command Line Interface)
 """
 
+import importlib
 import os
+from pathlib import Path
 
 import click
 
 CMD_FOLDER = os.path.join(os.path.dirname(__file__), "commands")
 CMD_PREFIX = "cmd_"
+CMD_PACKAGE = "pjecz_hercules_cli.commands"
 
 
 class CLI(click.MultiCommand):
@@ -23,18 +26,48 @@ class CLI(click.MultiCommand):
         return commands
 
     def get_command(self, ctx, name):
-        """Obtener comando"""
-        ns = {}
-        filename = os.path.join(CMD_FOLDER, CMD_PREFIX + name + ".py")
-        with open(filename) as f:
-            code = compile(f.read(), filename, "exec")
-            eval(code, ns, ns)
-        return ns["cli"]
+        """Obtener comando, se importa sólo el módulo de la orden y Python reutiliza su bytecode en __pycache__"""
+        if name not in self.list_commands(ctx):
+            return None
+        module = importlib.import_module(f"{CMD_PACKAGE}.{CMD_PREFIX}{name}")
+        return module.cli
 
 
 @click.command(cls=CLI)
-def cli():
+@click.option(
+    "--perfil",
+    type=click.Path(dir_okay=False),
+    default=None,
+    help="Perfilar la orden con cProfile en este archivo (con Python 3.12 o posterior los tiempos de los hilos no son confiables)",
+)
+@click.option("--perfil-memoria", is_flag=True, help="Con --perfil, agregar las asignaciones de memoria con tracemalloc")
+@click.pass_context
+def cli(ctx, perfil, perfil_memoria):
     """Click"""
+    if perfil is None:
+        return
+
+    # Se importa aquí para que el CLI arranque rápido, al cerrar el contexto se guarda el perfil aunque falle la orden
+    from pjecz_hercules_cli.dependencies.profiling import Perfilador
+
+    perfilador = Perfilador(perfil_memoria)
+
+    def guardar_perfil():
+        """Guardar el perfil al terminar la orden"""
+        rutas = perfilador.terminar(Path(perfil))
+        click.echo(click.style(f"Perfil guardado en {', '.join(str(ruta) for ruta in rutas)}", fg="white"), err=True)
+
+    ctx.call_on_close(guardar_perfil)
+    perfilador.iniciar()
+    if perfilador.perfil_compartido:
+        click.echo(
+            click.style(
+                "Con esta versión de Python se cuentan las llamadas de las etapas pero sus tiempos no son confiables, "
+                "para medirlos use Python 3.11 o las medidas por etapa que muestra la orden",
+                fg="yellow",
+            ),
+            err=True,
+        )
 
 
 if __name__ == "__main__":